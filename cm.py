@@ -1,7 +1,10 @@
 import argparse
+import atexit
+import json
+import sys
 
 from cml import utils
-from cml import Project
+from cml import CMakeDiskCache, Project
 
 
 # Create argument parser
@@ -10,15 +13,18 @@ subparsers = parser.add_subparsers(title='subcommands', dest='command')
 
 # General options
 parser.add_argument('-d', '--dry-run', help='Do not modify project on disk', action='store_true')
+parser.add_argument('--cache', help='Keep parsed cmake files in the cache directory', action='store_true')
+parser.add_argument('--cache-dir', help='Cache directory (default: $XDG_CACHE_HOME/cm)')
 
 # Command 'get'
 sub_parser = subparsers.add_parser('get', help='Get project property')
-sub_parser.add_argument('name', help='Property name')
+sub_parser.add_argument('name', nargs='?', help='Property name')
+sub_parser.add_argument('--all', help='Get all properties', action='store_true')
+sub_parser.add_argument('--json', help='Print properties as JSON object', action='store_true')
 
 # Command 'set'
-sub_parser = subparsers.add_parser('set', help='Set project property')
-sub_parser.add_argument('name', help='Property name')
-sub_parser.add_argument('value', help='Property value')
+sub_parser = subparsers.add_parser('set', help='Set project properties')
+sub_parser.add_argument('values', nargs='+', metavar='name=value', help='Property values (or a property name and its value)')
 
 # Command 'init'
 sub_parser = subparsers.add_parser('init', aliases=['i'], help='Initialize cmake project')
@@ -41,22 +47,61 @@ sub_parser = subparsers.add_parser('remove', aliases=['rm'], help='Remove sub-pr
 sub_parser.add_argument('-d', '--dry-run', help='Do not modify project on disk', action='store_true')
 sub_parser.add_argument('name', help='Project name')
 
-# Create project
-project = Project()
-dry_run = True
+# Command 'upgrade'
+sub_parser = subparsers.add_parser('upgrade', help='Merge changes of the project template into the project')
+sub_parser.add_argument('-d', '--dry-run', help='Do not modify project on disk', action='store_true')
+sub_parser.add_argument('--base', required=True, help='Path to the core template the project has been generated from')
+
+# Command 'cache'
+sub_parser = subparsers.add_parser('cache', help='Manage the cache of parsed cmake files')
+sub_parser.add_argument('action', choices=[ 'clear', 'stats' ], help='Remove all entries or show statistics')
 
 # Parse command line arguments
 args = parser.parse_args()
 
+# Use cache on disk
+if args.cache or args.command == 'cache':
+    Project.parse_cache = CMakeDiskCache(args.cache_dir)
+
+    # Keep hits and misses of this run for 'cm cache stats'
+    atexit.register(Project.parse_cache.save_statistics)
+
+# Create project (each command only parses the cmake files it needs)
+project = Project()
+dry_run = True
+
 # Execute commands
 if args.command == 'get':
-    # Print property value
-    value = project.get_prop(args.name)
-    if value != None:
-        print(value)
-if args.command == 'set':
-    # Set property value
-    project.set_prop(args.name, args.value)
+    # Get property values
+    if args.all or args.name == None:
+        values = project.get_props()
+    else:
+        values = project.get_props([ args.name ])
+
+    # Print property values
+    if args.json:
+        print(json.dumps(values, indent=2))
+    elif args.all or args.name == None:
+        for (name, value) in values.items():
+            print('{}={}'.format(name, value if value != None else ''))
+    elif values[args.name] != None:
+        print(values[args.name])
+elif args.command == 'set':
+    # Get property values ('name value' or 'name=value ...')
+    if len(args.values) == 2 and not '=' in args.values[0]:
+        values = { args.values[0]: args.values[1] }
+    else:
+        values = {}
+        for item in args.values:
+            (name, separator, value) = item.partition('=')
+            if not separator:
+                print('Invalid property value \'{}\', expected name=value'.format(item))
+                sys.exit(1)
+            values[name] = value
+
+    # Set property values (and write the main cmake file once)
+    if not project.set_props(values):
+        sys.exit(1)
 elif args.command == 'init' or args.command == 'i':
     # Initialize project
     project.initialize(name=args.name, description=args.description, author_name=args.author_name,
@@ -76,3 +121,20 @@ elif args.command == 'generate' or args.command == 'g':
 elif args.command == 'remove' or args.command == 'rm':
     # Remove sub-project
     project.remove_subproject(name=args.name, dry=args.dry_run)
+elif args.command == 'cache':
+    # Manage cache
+    cache = Project.parse_cache
+    if args.action == 'clear':
+        cache.clear()
+    else:
+        print('Directory: {}'.format(cache.directory))
+        print('Entries: {}'.format(len(cache)))
+        print('Size: {} of {} bytes'.format(cache.size, cache.max_size))
+        (hits, misses, evictions) = cache.statistics()
+        print('Hits: {}'.format(hits))
+        print('Misses: {}'.format(misses))
+        print('Evictions: {}'.format(evictions))
+elif args.command == 'upgrade':
+    # Upgrade project (fails on conflicts)
+    if not project.upgrade(base=args.base, dry=args.dry_run):
+        sys.exit(1)
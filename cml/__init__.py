@@ -1,10 +1,19 @@
-from .cmake import ElementType, TokenType
+from .cmake import CMakeDiagnostic, CMakeSaveError, CMakeSyntaxError, ElementType, TokenType, Tokenizer
 from .cmake_command import CMakeCommand
 from .cmake_comment import CMakeComment
+from .cmake_disk_cache import CMakeDiskCache
 from .cmake_element import CMakeElement
+from .cmake_element_list import CMakeElementList
 from .cmake_file import CMakeFile
+from .cmake_invalid import CMakeInvalid
+from .cmake_parse_cache import CMakeParseCache
 from .cmake_parser import CMakeParser
+from .cmake_signature_index import CMakeSignatureIndex
+from .cmake_source_map import CMakeSourceMap
+from .cmake_tokens import CMakeTokens
+from .cmake_variable_index import CMakeVariableIndex
 from .cmake_whitespace import CMakeWhitespace
 from .project import Project
+from .sub_project import SubProject
 from .user_query import UserQuery
 from . import utils
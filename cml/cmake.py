@@ -1,5 +1,6 @@
 import os
 
+from collections import namedtuple
 from enum import Enum
 
 
@@ -29,7 +30,27 @@ class ElementType(Enum):
     - COMMAND: Element containing a cmake command
     - COMMENT: Element containing comments
     - WHITESPACE: Element containing only whitespace tokens
+    - INVALID: Element containing tokens that could not be parsed
     """
     WHITESPACE = 0
     COMMAND = 1
     COMMENT = 2
+    INVALID = 3
+
+class Tokenizer(Enum):
+    """Tokenizer engine used by the parser
+
+    - FSM: Legacy state machine, reads the file character by character
+    - REGEX: Scanner based on a compiled regular expression, reads the file at once
+    """
+    FSM = 0
+    REGEX = 1
+
+class CMakeSyntaxError(Exception):
+    """Error raised when a cmake file cannot be parsed"""
+
+class CMakeSaveError(Exception):
+    """Error raised when a transaction ends and a cmake file cannot be saved"""
+
+# Problem found while parsing a cmake file (line and column start at 1)
+CMakeDiagnostic = namedtuple('CMakeDiagnostic', [ 'line', 'column', 'message' ])
@@ -2,70 +2,137 @@ import os
 
 from .cmake_element import CMakeElement
 from .cmake import ElementType, TokenType
+from .cmake_tokens import token_types
 
 
 class CMakeCommand(CMakeElement):
     """A section of a cmake file that represents a command"""
 
-    def __init__(self, tokens):
+    __slots__ = ('name_position', '_arg_positions', '_signature')
+
+    def __init__(self, tokens, name_position = None):
         """Constructor
 
+        The command is parsed lazily, when its name or arguments are accessed for the first time.
+
         Args:
-            tokens (list): List of tokens that belong to the command
+            tokens (list): List of tokens that belong to the command (list, CMakeTokens or CMakeTokenRange)
+            name_position (int): Index of the name token in tokens, if already known
 
         """
         super().__init__(ElementType.COMMAND)
 
         # Initialize
         self.tokens = tokens
-        self.name = ''
-        self.args = []
+        self.name_position = name_position # Index of the name token in self.tokens
+        self._arg_positions = None # Indices of the argument tokens in self.tokens (parsed on demand)
+        self._signature = None # Name and argument values (computed on demand)
 
-        # Parse command
-        self.parse()
+    @property
+    def name(self):
+        """Name of the command
 
-    def write(self, stream):
-        """Print element to stream
+        Returns:
+            string: Command name
 
-        Args:
-            stream (file object): Output stream to write to
+        """
+
+        # Parse command if the name is not known, yet
+        if self.name_position == None and self._arg_positions == None:
+            self.parse()
+
+        if self.name_position == None:
+            return ''
+        return self.tokens[self.name_position][1]
+
+    @property
+    def arg_positions(self):
+        """Positions of the arguments of the command
+
+        Returns:
+            list: Indices of the argument tokens in self.tokens
 
         """
 
-        for (_, token) in self.tokens:
-            stream.write(token)
+        # Parse command on first access
+        if self._arg_positions == None:
+            self.parse()
+
+        return self._arg_positions
+
+    @property
+    def args(self):
+        """Arguments of the command
+
+        Returns:
+            list: List of argument tokens (TokenType, string)
+
+        """
+        return [ self.tokens[position] for position in self.arg_positions ]
 
     def parse(self):
         """Parse the elements of the command"""
 
-        for token in self.tokens:
-            if token[0] in [ TokenType.DEFAULT, TokenType.STRING ]:
-                if self.name == '':
-                    self.name = token[1]
+        # Only look at token types, so values are not decoded before they are read
+        self.name_position = None
+        self._arg_positions = []
+        self._signature = None
+        for (position, token_type) in enumerate(token_types(self.tokens)):
+            if token_type in [ TokenType.DEFAULT, TokenType.STRING ]:
+                if self.name_position == None:
+                    self.name_position = position
                 else:
-                    self.args.append(token)
+                    self._arg_positions.append(position)
 
     def signature(self, numargs = -1):
         """Get command signature (name and arguments)
 
+        The complete signature is cached until an argument is modified. As a
+        tuple, it can also be used as a key to group or deduplicate commands.
+
         Args:
             numargs (int): Number of arguments to include of the signature
         
         Returns:
-            list: List of name and arguments of the command
+            tuple: Name and arguments of the command
 
         """
 
         # Get complete signature
-        cmd = [ self.name ]
-        for (_, arg) in self.args:
-            cmd.append(arg)
+        if self._signature == None:
+            self._signature = (self.name, ) + tuple(arg for (_, arg) in self.args)
 
         # Return name and specified number of arguments
         if numargs >= 0:
-            return cmd[0:numargs + 1]
+            return self._signature[0:numargs + 1]
         else:
-            return cmd
+            return self._signature
+
+    def matches(self, signature):
+        """Check if the command has a specific signature
+
+        The command name is compared case-insensitively, the arguments exactly.
+
+        Args:
+            signature (list): Command signature, e.g. [ 'set', 'name' ]
+
+        Returns:
+            Boolean: True if the name and first arguments of the command match the signature, else False
+
+        """
+
+        cmd = self.signature()
+        return cmd[1:len(signature)] == tuple(signature[1:]) and cmd[0].casefold() == signature[0].casefold()
+
+    def reset(self):
+        """Forget the parsed arguments and cached signature
+
+        Needs to be called after the tokens have been modified directly.
+        """
+
+        self.name_position = None
+        self._arg_positions = None
+        self._signature = None
 
     def get_arg(self, index):
         """Get command argument
@@ -79,8 +146,8 @@ class CMakeCommand(CMakeElement):
         """
 
         # Return argument at given index or None
-        if index >= 0 and index < len(self.args):
-            return self.args[index]
+        if index >= 0 and index < len(self.arg_positions):
+            return self.tokens[self.arg_positions[index]]
         else:
             return None
 
@@ -95,11 +162,11 @@ class CMakeCommand(CMakeElement):
 
         """
 
-        # Get argument at given index
-        arg = self.get_arg(index)
-        if arg:
+        # Get argument at given index from the signature
+        cmd = self.signature()
+        if index >= 0 and index < len(cmd) - 1:
             # Return value
-            return arg[1]
+            return cmd[index + 1]
         else:
             # Does not exist
             return None
@@ -117,4 +184,10 @@ class CMakeCommand(CMakeElement):
         arg = self.get_arg(index)
         if arg:
             # Set value
-            arg[1] = value
+            self.tokens[self.arg_positions[index]] = [ arg[0], value ]
+            self._signature = None
+            self.invalidate()
+
+            # Positions in the file have changed
+            if self.owner != None:
+                self.owner.element_changed(self, index, arg[1])
@@ -7,6 +7,8 @@ from .cmake import ElementType, TokenType
 class CMakeComment(CMakeElement):
     """A section of a cmake file that represents a comment"""
 
+    __slots__ = ()
+
     def __init__(self, tokens):
         """Constructor
 
@@ -17,14 +19,3 @@ class CMakeComment(CMakeElement):
 
         super().__init__(ElementType.COMMENT)
         self.tokens = tokens
-
-    def write(self, stream):
-        """Print element to stream
-
-        Args:
-            stream (file object): Output stream to write to
-
-        """
-
-        for (_, token) in self.tokens:
-            stream.write(token)
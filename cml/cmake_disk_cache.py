@@ -0,0 +1,294 @@
+import hashlib
+import marshal
+import os
+import tempfile
+
+from array import array
+
+from .cmake import CMakeDiagnostic
+from .cmake_file import CMakeFile
+from .cmake_tokens import CMakeTokens
+from .cmake_parser import _create_chunk_elements
+
+
+# Version of the parser output and of the serialised form, entries of other versions are ignored.
+# Needs to be increased whenever the parser creates different elements or the format changes.
+CACHE_FORMAT = 1
+
+# Default maximum size of the cache directory in bytes
+MAX_SIZE = 64 * 1024 * 1024
+
+# Name of the file in the cache directory that keeps the counters of all processes
+STATISTICS_FILE = 'statistics'
+
+
+def default_directory():
+    """Get default cache directory
+
+    Returns:
+        string: Directory 'cm' in $XDG_CACHE_HOME (default: ~/.cache)
+
+    """
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cm')
+
+
+class CMakeDiskCache:
+    """Cache of parsed cmake files on disk
+
+    Each parsed file is stored in its own entry file, in the same compact
+    form that is used to pass parsed chunks between processes (token types
+    as bytes, token values and element boundaries), serialised with marshal.
+    Entries are stored by path and parser options and are only used while
+    the file still has the same modification time, size and inode, and only
+    if they have been written with the same CACHE_FORMAT. When the entries
+    exceed the size limit, the least recently used ones are removed.
+
+    The class can be used in place of CMakeParseCache, e.g., to reuse parsed
+    files across invocations of the command line tool.
+    """
+
+    persistent = True # Entries are reused by later processes
+
+    def __init__(self, directory = None, max_size = MAX_SIZE):
+        """Constructor
+
+        Args:
+            directory (string): Cache directory (default: see default_directory)
+            max_size (int): Maximum total size of the entries in bytes
+
+        """
+
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.hits = 0       # Number of lookups that found a parsed file
+        self.misses = 0     # Number of lookups that did not
+        self.evictions = 0  # Number of entries removed to stay within max_size
+
+    def __len__(self):
+        return len(self._entries())
+
+    @property
+    def size(self):
+        """Total size of the entries
+
+        Returns:
+            int: Size in bytes
+
+        """
+        return sum(size for (_, _, size) in self._entries())
+
+    def get(self, key, stamp):
+        """Get parsed file
+
+        Args:
+            key (tuple): Real path of the file and parser options
+            stamp (tuple): Modification time, size and inode of the file on disk
+
+        Returns:
+            CMakeFile: Parsed file, or None if the file is not cached or has been modified since
+
+        """
+
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = marshal.load(f)
+            (cache_format, entry_key, entry_stamp, compact, types, values, elements, diagnostics) = data
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, ValueError, TypeError):
+            # Broken entry
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Check entry
+        if cache_format != CACHE_FORMAT or entry_key != repr(key) or entry_stamp != stamp:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # Mark entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        # Create file
+        cmake_file = CMakeFile(key[0], compact=compact)
+        for element in _create_chunk_elements((types, values, elements), compact):
+            cmake_file.add(element)
+        cmake_file.diagnostics = [ CMakeDiagnostic(*diagnostic) for diagnostic in diagnostics ]
+        cmake_file.dirty = False
+        self.hits += 1
+        return cmake_file
+
+    def put(self, key, stamp, cmake_file, size):
+        """Add parsed file
+
+        Errors while writing the entry are ignored.
+
+        Args:
+            key (tuple): Real path of the file and parser options
+            stamp (tuple): Modification time, size and inode of the file when it was parsed
+            cmake_file (CMakeFile): Parsed file
+            size (int): Size of the file in bytes
+
+        """
+
+        # Collect tokens and element boundaries
+        types = array('B')
+        values = []
+        elements = []
+        for element in cmake_file.elements:
+            if isinstance(element.tokens, CMakeTokens):
+                types.extend(element.tokens.types)
+                values.extend(element.tokens.values)
+            else:
+                for (token_type, value) in element.tokens:
+                    types.append(token_type.value)
+                    values.append(value)
+            elements.append((element.element_type.value, len(values), getattr(element, 'name_position', None)))
+        diagnostics = [ tuple(diagnostic) for diagnostic in cmake_file.diagnostics ]
+        data = marshal.dumps((CACHE_FORMAT, repr(key), stamp, cmake_file.compact, types.tobytes(), values, elements, diagnostics))
+
+        # Write entry (atomically, other processes may read it at the same time)
+        if not self._write(self._entry_path(key), data):
+            return
+
+        # Remove least recently used entries
+        entries = self._entries()
+        total = sum(entry_size for (_, _, entry_size) in entries)
+        for (_, entry_path, entry_size) in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(entry_path)
+            total -= entry_size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the counters (including the saved ones)"""
+
+        for (_, path, _) in self._entries():
+            self._remove(path)
+        self._remove(os.path.join(self.directory, STATISTICS_FILE))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def statistics(self):
+        """Get counters of all processes that have used the cache directory
+
+        Returns:
+            (int, int, int): Hits, misses and evictions saved with save_statistics, plus the counters of this instance
+
+        """
+
+        (hits, misses, evictions) = self._saved_statistics()
+        return (hits + self.hits, misses + self.misses, evictions + self.evictions)
+
+    def save_statistics(self):
+        """Add the counters of this instance to the counters saved in the cache directory
+
+        The counters of this instance are reset afterwards. Errors are ignored,
+        and processes that save at the same time may lose some counts.
+        """
+
+        if self.hits == 0 and self.misses == 0 and self.evictions == 0:
+            return
+        if self._write(os.path.join(self.directory, STATISTICS_FILE), marshal.dumps(self.statistics())):
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _saved_statistics(self):
+        """Read counters saved in the cache directory
+
+        Returns:
+            (int, int, int): Hits, misses and evictions (zeros if none have been saved)
+
+        """
+
+        try:
+            with open(os.path.join(self.directory, STATISTICS_FILE), 'rb') as f:
+                (hits, misses, evictions) = marshal.load(f)
+            return (int(hits), int(misses), int(evictions))
+        except (OSError, EOFError, ValueError, TypeError):
+            return (0, 0, 0)
+
+    def _write(self, path, data):
+        """Write file in the cache directory atomically
+
+        Args:
+            path (string): Path of the file
+            data (bytes): Content of the file
+
+        Returns:
+            Boolean: True if the file has been written, else False
+
+        """
+
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            (fd, temp_path) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with open(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            if temp_path != None:
+                self._remove(temp_path)
+            return False
+        return True
+
+    def _entry_path(self, key):
+        """Get path of the entry for a key
+
+        Args:
+            key (tuple): Real path of the file and parser options
+
+        Returns:
+            string: Path of the entry file
+
+        """
+
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.cache')
+
+    def _entries(self):
+        """List entries
+
+        Returns:
+            list: Last use, path and size of each entry
+
+        """
+
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith('.cache'):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime_ns, entry.path, stat.st_size))
+        except OSError:
+            pass
+        return entries
+
+    def _remove(self, path):
+        """Remove file in the cache directory, if it exists
+
+        Args:
+            path (string): Path of the file
+
+        """
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
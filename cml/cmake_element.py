@@ -1,12 +1,16 @@
+import copy
 import os
 import sys
 
 from .cmake import ElementType
+from .cmake_tokens import CMakeTokens
 
 
 class CMakeElement:
     """Class that represents an element of a cmake file"""
 
+    __slots__ = ('element_type', 'tokens', 'owner', '_text')
+
     def __init__(self, element_type):
         """Constructor
 
@@ -17,6 +21,8 @@ class CMakeElement:
 
         self.element_type = element_type
         self.tokens = []
+        self.owner = None # CMakeFile that contains the element
+        self._text = None # Rendered tokens (computed on demand)
 
     def get_type(self):
         """Get type of element
@@ -54,6 +60,76 @@ class CMakeElement:
         """
         return self.element_type == ElementType.WHITESPACE
 
+    def is_invalid(self):
+        """Check if element could not be parsed
+
+        Returns:
+            Boolean: True if element is an invalid element, else False
+
+        """
+        return self.element_type == ElementType.INVALID
+
+    @property
+    def span(self):
+        """Position of the element in its file
+
+        Returns:
+            (int, int): Offset of the first byte and after the last byte of the element, or None
+
+        """
+
+        if self.owner == None:
+            return None
+        return self.owner.source_map.span(self)
+
+    @property
+    def text(self):
+        """Source text of the element
+
+        The text is rendered once and cached until the tokens are modified.
+        Tokens of a mapped file that have not been modified are copied from
+        the source buffer as one slice.
+
+        Returns:
+            string: Text of all tokens
+
+        """
+
+        if self._text == None:
+            text = None
+            if hasattr(self.tokens, 'source'):
+                text = self.tokens.source()
+            if text == None:
+                text = ''.join([ token for (_, token) in self.tokens ])
+            self._text = text
+        return self._text
+
+    def invalidate(self):
+        """Discard the cached text
+
+        Needs to be called after the tokens of the element have been modified.
+        """
+        self._text = None
+
+    def copy(self):
+        """Create copy of the element that is not part of a file
+
+        The tokens are copied, so that the copy can be modified without
+        affecting the original element. Parsed and rendered data is kept.
+
+        Returns:
+            CMakeElement: Copy of the element
+
+        """
+
+        element = copy.copy(self)
+        if isinstance(self.tokens, list):
+            element.tokens = list(self.tokens)
+        else:
+            element.tokens = CMakeTokens(self.tokens)
+        element.owner = None
+        return element
+
     def print(self):
         """Print element to terminal"""
         self.write(sys.stdout)
@@ -65,3 +141,4 @@ class CMakeElement:
             stream (file object): Output stream to write to
 
         """
+        stream.write(self.text)
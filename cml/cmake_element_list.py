@@ -0,0 +1,341 @@
+class CMakeElementList:
+    """Doubly linked list of the elements of a cmake file
+
+    The links are kept in two dicts that map each element to its successor
+    and predecessor, so elements serve as their own stable handles: inserting
+    before or after an element and removing an element take constant time.
+    Iteration is in document order. Access by index is supported, but walks
+    the list.
+
+    If own is set, the elements are passed through it whenever they are
+    handed out (by iteration, index, first, last, next, prev or iter_after),
+    e.g., to copy elements that are shared with other versions of a file
+    (see CMakeFile.snapshot). iter_raw() hands out the elements as they are.
+    """
+
+    __slots__ = ('_next', '_prev', 'own')
+
+    # Dicts use None as key for the head of the list: _next[None] is the first
+    # element, _prev[None] the last one
+
+    def __init__(self, elements = None):
+        """Constructor
+
+        Args:
+            elements (iterable): Elements to add (CMakeElement)
+
+        """
+
+        self._next = { None: None } # Successor of each element
+        self._prev = { None: None } # Predecessor of each element
+        self.own = None # Function that is applied to elements that are handed out, or None
+
+        if elements:
+            for element in elements:
+                self.append(element)
+
+    def __len__(self):
+        return len(self._next) - 1
+
+    def __iter__(self):
+        if self.own == None:
+            return self.iter_raw()
+        return self._iter_owned(self._next, None)
+
+    def __reversed__(self):
+        if self.own == None:
+            return self._iter_raw(self._prev, None)
+        return self._iter_owned(self._prev, None)
+
+    def iter_raw(self, after = None):
+        """Iterate over the elements without passing them through own
+
+        Elements may then be shared with other versions of a file and must
+        not be modified.
+
+        Args:
+            after (CMakeElement): Element of the list after which to start, or None to start at the first element
+
+        Returns:
+            iterator: Elements (CMakeElement)
+
+        """
+        return self._iter_raw(self._next, after)
+
+    def _iter_raw(self, links, element):
+        """Iterate along links
+
+        Args:
+            links (dict): Successors or predecessors of the elements
+            element (CMakeElement): Element after which to start, or None
+
+        Returns:
+            iterator: Elements (CMakeElement)
+
+        """
+
+        element = links[element]
+        while element is not None:
+            yield element
+            element = links[element]
+
+    def _iter_owned(self, links, element):
+        """Iterate along links, passing the elements through own
+
+        Args:
+            links (dict): Successors or predecessors of the elements
+            element (CMakeElement): Element after which to start, or None
+
+        Returns:
+            iterator: Elements (CMakeElement)
+
+        """
+
+        # Take the following element first, own may replace the current one
+        element = links[element]
+        while element is not None:
+            following = links[element]
+            yield self.own(element)
+            element = following
+
+    def __contains__(self, element):
+        return element is not None and element in self._next
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            elements = list(self.iter_raw())[index]
+            return elements if self.own == None else [ self.own(element) for element in elements ]
+
+        # Walk from the nearest end
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('element index out of range')
+        if index < len(self) // 2:
+            elements = self._iter_raw(self._next, None)
+        else:
+            elements = self._iter_raw(self._prev, None)
+            index = len(self) - 1 - index
+        for _ in range(index):
+            next(elements)
+        return self._owned(next(elements))
+
+    def __eq__(self, other):
+        try:
+            return list(self.iter_raw()) == list(other.iter_raw() if isinstance(other, CMakeElementList) else other)
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'CMakeElementList({!r})'.format(list(self.iter_raw()))
+
+    def _owned(self, element):
+        """Pass element through own, if set
+
+        Args:
+            element (CMakeElement): Element of the list, or None
+
+        Returns:
+            CMakeElement: Element to hand out
+
+        """
+        return element if self.own == None or element is None else self.own(element)
+
+    def first(self):
+        """Get first element
+
+        Returns:
+            CMakeElement: First element, or None if the list is empty
+
+        """
+        return self._owned(self._next[None])
+
+    def last(self):
+        """Get last element
+
+        Returns:
+            CMakeElement: Last element, or None if the list is empty
+
+        """
+        return self._owned(self._prev[None])
+
+    def next(self, element):
+        """Get element after an element
+
+        Args:
+            element (CMakeElement): Element of the list
+
+        Returns:
+            CMakeElement: Next element, or None
+
+        """
+        return self._owned(self._next[element])
+
+    def prev(self, element):
+        """Get element before an element
+
+        Args:
+            element (CMakeElement): Element of the list
+
+        Returns:
+            CMakeElement: Previous element, or None
+
+        """
+        return self._owned(self._prev[element])
+
+    def iter_after(self, element):
+        """Iterate over the elements after an element
+
+        Args:
+            element (CMakeElement): Element of the list
+
+        Returns:
+            iterator: Elements after the element (CMakeElement)
+
+        """
+
+        if self.own == None:
+            return self._iter_raw(self._next, element)
+        return self._iter_owned(self._next, element)
+
+    def append(self, element):
+        """Add element at the end
+
+        Args:
+            element (CMakeElement): New element
+
+        """
+        self.insert_after(self._prev[None], element)
+
+    def insert_before(self, before, element):
+        """Add element before another element
+
+        Args:
+            before (CMakeElement): Element of the list, or None to add the element at the end
+            element (CMakeElement): New element
+
+        """
+        self.insert_after(self._prev[before], element)
+
+    def insert_after(self, after, element):
+        """Add element after another element
+
+        Args:
+            after (CMakeElement): Element of the list, or None to add the element at the start
+            element (CMakeElement): New element
+
+        """
+
+        if element is None or element in self._next:
+            raise ValueError('element is already in the list')
+
+        following = self._next[after]
+        self._next[after] = element
+        self._next[element] = following
+        self._prev[following] = element
+        self._prev[element] = after
+
+    def insert_ordered(self, element, elements):
+        """Add element at its position in the order of another list
+
+        The nearest element of this list around element is searched in
+        elements in both directions at once, so the cost depends on the
+        distance to it (or to an end of elements), not on the length of the
+        lists.
+
+        Args:
+            element (CMakeElement): New element, which is part of elements
+            elements (CMakeElementList): List that contains element and all elements of this list, in the same order
+
+        """
+
+        if len(self) == 0:
+            self.append(element)
+            return
+
+        following = elements._next[element]
+        preceding = elements._prev[element]
+        while True:
+            if following is None:
+                self.append(element)
+                return
+            if following in self._next:
+                self.insert_before(following, element)
+                return
+            if preceding is None:
+                self.insert_after(None, element)
+                return
+            if preceding in self._next:
+                self.insert_after(preceding, element)
+                return
+            following = elements._next[following]
+            preceding = elements._prev[preceding]
+
+    def remove(self, element):
+        """Remove element
+
+        Args:
+            element (CMakeElement): Element of the list
+
+        """
+
+        if not element in self:
+            raise ValueError('element is not in the list')
+
+        following = self._next.pop(element)
+        preceding = self._prev.pop(element)
+        self._next[preceding] = following
+        self._prev[following] = preceding
+
+    def replace(self, element, new_element):
+        """Replace element by another element at the same position
+
+        Args:
+            element (CMakeElement): Element of the list
+            new_element (CMakeElement): New element
+
+        """
+
+        if not element in self:
+            raise ValueError('element is not in the list')
+        if new_element is None or new_element in self._next:
+            raise ValueError('element is already in the list')
+
+        following = self._next.pop(element)
+        preceding = self._prev.pop(element)
+        self._next[preceding] = new_element
+        self._next[new_element] = following
+        self._prev[following] = new_element
+        self._prev[new_element] = preceding
+
+    def index(self, element):
+        """Get position of an element (walks the list)
+
+        Args:
+            element (CMakeElement): Element of the list
+
+        Returns:
+            int: Index of the element
+
+        """
+
+        if not element in self:
+            raise ValueError('element is not in the list')
+        for (index, other) in enumerate(self.iter_raw()):
+            if other is element:
+                return index
+
+    def copy(self):
+        """Create shallow copy of the list (without own)
+
+        Returns:
+            CMakeElementList: List with the same elements
+
+        """
+
+        elements = CMakeElementList()
+        elements._next = self._next.copy()
+        elements._prev = self._prev.copy()
+        return elements
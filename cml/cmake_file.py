@@ -1,63 +1,606 @@
+import contextlib
+import difflib
 import os
+import shutil
+import tempfile
 
-from .cmake import ElementType, TokenType
+from .cmake import CMakeSaveError, ElementType, TokenType
 from .cmake_command import CMakeCommand
 from .cmake_comment import CMakeComment
+from .cmake_element_list import CMakeElementList
+from .cmake_signature_index import CMakeSignatureIndex
+from .cmake_source_map import CMakeSourceMap
+from .cmake_tokens import CMakeTokens
+from .cmake_variable_index import CMakeVariableIndex
 from .cmake_whitespace import CMakeWhitespace
 
 
+def file_stamp(path):
+    """Get stamp that identifies the version of a file on disk
+
+    Args:
+        path (string): Path to file
+
+    Returns:
+        tuple: Modification time in nanoseconds, size and inode of the file, or None if it does not exist
+
+    """
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def _umask():
+    """Get the umask of the process
+
+    Returns:
+        int: Umask
+
+    """
+
+    # The umask can only be read by setting it
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
 class CMakeFile:
     """Class that represents the contents of a CMakeLists.txt file"""
 
-    def __init__(self, path):
+    def __init__(self, path, compact=False):
         """Constructor
 
+        In compact storage mode, tokens are kept in CMakeTokens and consecutive
+        whitespace or comment lines are coalesced into a single element.
+
         Args:
             path (string): Path to cmake file
+            compact (Boolean): True to use compact storage mode
 
         """
         self.path = path
-        self.elements = []
+        self.compact = compact
+        self.dirty = True # True if the elements differ from the file on disk
+        self.stamp = None # Version of the file on disk when it was loaded or saved (see file_stamp)
+        self.elements = CMakeElementList()
+        self.token_buffer = None # Source buffer of the tokens (CMakeTokenBuffer), if any
+        self.diagnostics = []    # Problems found while parsing the file (CMakeDiagnostic)
+        self._source_map = None  # Positions of elements and lines (built on demand)
+        self._commands = None    # Commands by case-folded name, in file order (CMakeElementList, built on demand)
+        self.signature_depth = 0 # Number of signature items in the signature index (0: no index)
+        self._signatures = None  # Signature index (built on demand)
+        self._variables = None   # Variable index (built on demand)
+        self._undo_log = None    # Functions that undo the changes of the current transaction
+        self._savepoints = []    # Length of the undo log at the start of each open transaction
+        self._shared = False     # True if elements may be shared with other versions of the file (see snapshot)
 
     def add(self, element):
         """Add element to file
 
+        Used to build the file when parsing, does not mark the file as modified.
+
         Args:
             element (CMakeElement): CMake element
 
         """
+
+        self._source_map = None
+
+        # Coalesce runs of whitespace or comment lines in compact mode
+        if self.compact and len(self.elements) > 0 and (element.is_whitespace() or element.is_comment()):
+            last = self.elements.last()
+            if last.get_type() == element.get_type():
+                last.tokens.extend(element.tokens)
+                last.invalidate()
+                return
+
+        element.owner = self
         self.elements.append(element)
 
-    def save(self, path = None):
-        """Save file back to disk
+        # Update indices
+        if self._commands != None and element.is_command():
+            self._index_command(element)
+        if self._signatures != None and element.is_command():
+            self._signatures.append(element)
+        if self._variables != None and element.is_command():
+            self._variables.add(element)
+
+    def splice(self, begin, end, elements):
+        """Replace a range of elements
 
         Args:
-            path (string): Path to cmake file
+            begin (int): Index of the first element to replace
+            end (int): Index after the last element to replace
+            elements (list): New elements (CMakeElement)
+
+        """
+
+        # Remove old elements (elements shared with other versions of the file keep their owner)
+        elements = list(elements)
+        current = list(self.elements.iter_raw())
+        after = current[begin - 1] if begin > 0 else None
+        removed = current[begin:end]
+        for element in removed:
+            self.elements.remove(element)
+            if element.owner is self:
+                element.owner = None
+
+        # Add new elements (elements of other files are shared, see snapshot)
+        for element in elements:
+            self.elements.insert_after(after, element)
+            if element.owner == None:
+                element.owner = self
+            elif element.owner is not self:
+                self._shared = True
+                self.elements.own = self.own
+            after = element
+        self.dirty = True
+        self._source_map = None
+        self._commands = None
+        self._signatures = None
+        self._variables = None
+
+        # Remember how to undo the change
+        self._record(lambda: self.splice(begin, begin + len(elements), removed))
+
+    def get_commands(self, name):
+        """Get commands by name
+
+        Command names are compared case-insensitively, like in cmake.
+        The index is built on first use and kept up to date by add,
+        add_command and remove_command.
+
+        Args:
+            name (string): Command name, e.g. 'set'
+
+        Returns:
+            list: Commands with the given name in the order of the file (CMakeCommand)
+
+        """
+        return self._owned(list(self._get_commands(name)))
+
+    def _get_commands(self, name):
+        """Get commands by name from the index, without taking ownership
+
+        Args:
+            name (string): Command name
+
+        Returns:
+            iterable: Indexed commands with the given name (CMakeCommand)
+
+        """
+
+        # Build index
+        if self._commands == None:
+            self._commands = {}
+            for element in self.elements.iter_raw():
+                if element.is_command():
+                    self._index_command(element)
+
+        return self._commands.get(name.casefold(), ())
+
+    def _index_command(self, cmd, ordered = False):
+        """Add command to the name index
+
+        Args:
+            cmd (CMakeCommand): Command of the file
+            ordered (Boolean): True to place the command in file order (see CMakeElementList.insert_ordered), False to add it at the end
+
+        Returns:
+            CMakeElementList: Indexed commands with the name of the command
+
+        """
+
+        key = cmd.name.casefold()
+        cmds = self._commands.get(key)
+        if cmds is None:
+            cmds = CMakeElementList()
+            self._commands[key] = cmds
+        if ordered:
+            cmds.insert_ordered(cmd, self.elements)
+        else:
+            cmds.append(cmd)
+        return cmds
+
+    def index_signatures(self, depth = 2):
+        """Enable signature index
+
+        Commands are then also indexed by the first depth items of their
+        signature (see CMakeSignatureIndex), so that find_commands only walks
+        a trie for signatures such as [ 'set', 'META_PROJECT_NAME' ]. The index
+        is built on first use and rebuilt only after an argument that is part
+        of the key has been modified.
+
+        Args:
+            depth (int): Number of signature items to index (name and depth - 1 arguments), 0 to disable the index
+
+        """
+
+        self.signature_depth = depth
+        self._signatures = None
+
+    @property
+    def variables(self):
+        """Variables defined and used by the commands of the file
+
+        The index is built on first access and kept up to date by add,
+        add_command, remove_command and CMakeCommand.set_arg_value.
+
+        Returns:
+            CMakeVariableIndex: Variable index of the file
+
+        """
+
+        if self._variables == None:
+            self._variables = CMakeVariableIndex(e for e in self.elements.iter_raw() if e.is_command())
+        return self._variables
+
+    def find_definitions(self, name):
+        """Find commands that define a variable (set, option or list(APPEND))
+
+        Args:
+            name (string): Variable name, e.g. 'META_VERSION_MAJOR'
+
+        Returns:
+            list: List of commands (CMakeCommand)
+
+        """
+        return self._owned(self.variables.find_definitions(name))
+
+    def find_usages(self, name):
+        """Find references to a variable (${NAME})
+
+        Args:
+            name (string): Variable name, e.g. 'META_VERSION_MAJOR'
+
+        Returns:
+            list: List of commands and indices of the arguments that reference the variable (CMakeCommand, int)
+
+        """
+        return [ (self.own(cmd), index) for (cmd, index) in self.variables.find_usages(name) ]
+
+    def snapshot(self):
+        """Create copy-on-write snapshot of the file
+
+        The snapshot shares all elements with the file. An element is only
+        copied when the snapshot hands it out, i.e., when it is returned by
+        one of the query functions of the snapshot (find_commands,
+        get_commands, find_definitions, find_usages), reached through its
+        elements (by iteration, index, next, ...) or passed to own(), so that
+        modifications of the snapshot do not affect the file. Elements of the
+        file must not be modified while the snapshot is in use. Use diff() to
+        compare the snapshot to the file.
+
+        Returns:
+            CMakeFile: Snapshot of the file
+
+        """
+
+        snapshot = CMakeFile(self.path, compact=self.compact)
+        snapshot.dirty = self.dirty
+        snapshot.stamp = self.stamp
+        snapshot.elements = self.elements.copy()
+        snapshot.elements.own = snapshot.own
+        snapshot.token_buffer = self.token_buffer
+        snapshot.diagnostics = list(self.diagnostics)
+        snapshot.signature_depth = self.signature_depth
+        snapshot._shared = True
+        return snapshot
+
+    def own(self, element):
+        """Get element of the file that can be modified
+
+        In a snapshot, an element that is still shared with other versions of
+        the file is replaced by a copy, which is returned instead. In all other
+        files, the element itself is returned.
+
+        Args:
+            element (CMakeElement): Element of the file
+
+        Returns:
+            CMakeElement: Element that belongs to this file only
+
+        """
+
+        if not self._shared or element.owner is self:
+            return element
+
+        # Replace element by a copy
+        copy = element.copy()
+        self.elements.replace(element, copy)
+        copy.owner = self
+        self._source_map = None
+
+        # Update indices
+        if copy.is_command():
+            if self._commands != None:
+                self._commands[copy.name.casefold()].replace(element, copy)
+            if self._signatures != None:
+                self._signatures.replace(element, copy)
+            if self._variables != None:
+                self._variables.replace(element, copy)
+        return copy
+
+    def _owned(self, elements):
+        """Get elements of the file that can be modified
+
+        Args:
+            elements (list): Elements of the file (CMakeElement)
+
+        Returns:
+            list: Elements that belong to this file only (CMakeElement)
+
+        """
+
+        if not self._shared:
+            return elements
+        return [ self.own(element) for element in elements ]
+
+    def diff(self, other, context = 3):
+        """Compare file to another version of it, e.g., a snapshot to its file
+
+        Args:
+            other (CMakeFile): Other version of the file
+            context (int): Number of unchanged lines around each change
+
+        Returns:
+            list: Lines of a unified diff from other to this file (empty if both are equal)
+
+        """
+
+        old = ''.join([ element.text for element in other.elements.iter_raw() ]).splitlines(keepends=True)
+        new = ''.join([ element.text for element in self.elements.iter_raw() ]).splitlines(keepends=True)
+        return list(difflib.unified_diff(old, new, other.path, self.path, n=context))
+
+    @property
+    def source_map(self):
+        """Positions of the elements and lines of the file
+
+        The source map is built on first access and kept until the file is modified.
+
+        Returns:
+            CMakeSourceMap: Source map of the file
+
+        """
+
+        if self._source_map == None:
+            self._source_map = CMakeSourceMap(self.elements.iter_raw(), self.elements.own)
+        return self._source_map
+
+    def element_changed(self, element, arg_index = None, old_value = None):
+        """Notify the file that the tokens of an element have been modified
+
+        Needs to be called after changing tokens or elements directly, the
+        methods of CMakeFile and CMakeCommand do this themselves.
+
+        Args:
+            element (CMakeElement): Modified element
+            arg_index (int): Index of the modified argument, if only that argument has changed
+            old_value (string): Previous value of the modified argument
+
+        """
+
+        self._source_map = None
+        self.dirty = True
+
+        # Rendered text of the element is outdated
+        element.invalidate()
+
+        # Remember how to undo the change
+        if arg_index != None:
+            self._record(lambda: element.set_arg_value(arg_index, old_value))
+
+        # Keys of the indices may have changed
+        if arg_index == None:
+            self._commands = None
+            if element.is_command():
+                element.reset()
+        if self._signatures != None and (arg_index == None or arg_index + 1 < self._signatures.depth):
+            self._signatures = None
+        if self._variables != None and element.is_command():
+            if arg_index == None:
+                self._variables = None
+            else:
+                self._variables.update(element, self.elements)
+
+    def begin(self):
+        """Start transaction
+
+        Until the transaction is committed, the file is not saved and all
+        modifications done by set_command_arg, add_command, remove_command and
+        CMakeCommand.set_arg_value can be rolled back. Transactions can be nested,
+        only the outermost one saves the file.
+        """
+
+        if self._undo_log == None:
+            self._undo_log = []
+        self._savepoints.append(len(self._undo_log))
+
+    def commit(self, save = True):
+        """End transaction
+
+        When the outermost transaction ends, the file is saved once if it has
+        been modified. If it cannot be saved, all modifications are rolled back.
+
+        Args:
+            save (Boolean): True to save the file
+
+        Returns:
+            Boolean: True if the file has been saved (or did not need to be saved), else False
+
+        """
+
+        self._savepoints.pop()
+        if len(self._savepoints) > 0:
+            return True
+
+        # Save modifications
+        if len(self._undo_log) > 0 and save:
+            if not self.save():
+                self._savepoints.append(0)
+                self.rollback()
+                return False
+
+        self._undo_log = None
+        return True
+
+    def save_changes(self):
+        """Save the modifications of the current transaction without ending it
+
+        Only the outermost transaction saves the file. The modifications can
+        still be rolled back afterwards (and the file saved again), e.g., if
+        other files that are modified together cannot be saved.
+
+        Returns:
+            Boolean: True if the file has been saved (or did not need to be saved), else False
 
         """
 
+        if len(self._savepoints) != 1 or len(self._undo_log) == 0:
+            return True
+        return self.save()
+
+    def rollback(self):
+        """Undo all modifications of the current transaction and end it"""
+
+        # Undo changes in reverse order, without recording them again
+        savepoint = self._savepoints.pop()
+        undo_log = self._undo_log
+        self._undo_log = None
+        while len(undo_log) > savepoint:
+            undo_log.pop()()
+
+        if len(self._savepoints) > 0:
+            self._undo_log = undo_log
+
+    @contextlib.contextmanager
+    def transaction(self, save = True):
+        """Run modifications in a transaction
+
+        The file is saved once at the end, or all modifications are rolled
+        back if an exception is raised. If the file cannot be saved, the
+        modifications are rolled back as well and CMakeSaveError is raised.
+
+        Args:
+            save (Boolean): True to save the file at the end
+
+        Example:
+            with cmake_file.transaction():
+                cmake_file.set_command_arg([ 'set', 'A' ], 1, '"a"')
+                cmake_file.add_command([ 'set', 'B', '"b"' ])
+
+        """
+
+        self.begin()
         try:
-            # Open file
-            f = open(path or self.path, 'w')
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        if not self.commit(save):
+            raise CMakeSaveError('Could not save {}.'.format(self.path))
+
+    def _record(self, undo):
+        """Record modification in the current transaction
 
-            # Write elements to file
-            for element in self.elements:
-                element.write(f)
+        Args:
+            undo (function): Function that undoes the modification
+
+        """
 
-            # Done
+        if self._undo_log != None:
+            self._undo_log.append(undo)
+
+    def save(self, path = None, fsync = False):
+        """Save file back to disk
+
+        The file is only written if it has been modified since it was loaded
+        or saved. It is written to a temporary file in the same directory
+        first, which then replaces the file, so that readers never see a
+        partially written file. If the path is a symbolic link, the file it
+        points to is replaced and the link is kept.
+
+        Args:
+            path (string): Path to cmake file (default: path of the file)
+            fsync (Boolean): True to flush the file to the disk before replacing the old one
+
+        Returns:
+            Boolean: True if the file has been saved (or did not need to be saved), else False
+
+        """
+
+        path = path or self.path
+        own_file = os.path.realpath(path) == os.path.realpath(self.path)
+
+        # Skip unchanged files
+        if own_file and not self.dirty and os.path.isfile(path):
             return True
-        except:
+
+        # Render file into one buffer (unmodified elements are cached)
+        text = ''.join([ element.text for element in self.elements.iter_raw() ])
+
+        temp_path = None
+        try:
+            # Tokens must not refer to the file while it is replaced
+            if self.token_buffer != None and own_file:
+                self.token_buffer.detach()
+
+            # Write temporary file in the same directory (as the target of a link)
+            target = os.path.realpath(path)
+            (directory, name) = os.path.split(target)
+            (fd, temp_path) = tempfile.mkstemp(dir=directory, prefix='.' + name + '.', suffix='.tmp')
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # Keep permissions of an existing file, new files get the permissions of the umask (mkstemp uses 0600)
+            if os.path.isfile(target):
+                shutil.copymode(target, temp_path)
+            else:
+                os.chmod(temp_path, 0o666 & ~_umask())
+
+            # Replace file
+            os.replace(temp_path, target)
+            temp_path = None
+        except OSError:
             # Error
+            if temp_path != None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
             return False
 
+        # Done
+        if own_file:
+            self.dirty = False
+            self.stamp = file_stamp(path)
+        return True
+
+    def is_outdated(self):
+        """Check if the file on disk has changed since the file was loaded or saved
+
+        Returns:
+            Boolean: True if the file on disk has been modified, replaced or removed (or was never read or written), else False
+
+        """
+        return self.stamp == None or file_stamp(self.path) != self.stamp
+
     def print(self):
         """Print content of cmake file to terminal"""
-        for element in self.elements:
+        for element in self.elements.iter_raw():
             element.print()
 
     def find_commands(self, signature):
         """Find commands with a specific signature
 
+        The command name is matched case-insensitively, the arguments exactly.
+
         Args:
             signature (list): Command signature, e.g. [ 'SET', 'name' ]
 
@@ -70,15 +613,94 @@ class CMakeFile:
         if len(signature) <= 0:
             return []
 
-        # Find commands that have the given signature
+        # Walk signature index
+        if self.signature_depth > 0:
+            if self._signatures == None:
+                self._signatures = CMakeSignatureIndex(
+                    (e for e in self.elements.iter_raw() if e.is_command()), self.signature_depth)
+            return self._owned(self._signatures.find(signature))
+
+        # Find commands that have the given signature (look up names first, arguments are parsed lazily)
+        args = tuple(signature[1:])
         cmds = []
-        for element in self.elements:
-            if element.is_command():
-                if element.signature(len(signature) - 1) == signature:
-                    cmds.append(element)
+        for cmd in self._get_commands(signature[0]):
+            if cmd.signature()[1:len(signature)] == args:
+                cmds.append(cmd)
 
         # Return list of commands
-        return cmds
+        return self._owned(cmds)
+
+    def find_commands_batch(self, signatures):
+        """Find commands for several signatures at once
+
+        With a signature index, the trie is walked once for all signatures
+        (see CMakeSignatureIndex.find_batch). Otherwise, the commands of each
+        name are compared to all signatures of that name in one pass.
+
+        Args:
+            signatures (list): List of command signatures, e.g. [ [ 'set', 'A' ], [ 'set', 'B' ] ]
+
+        Returns:
+            list: List of commands (list of CMakeCommand) for each signature
+
+        """
+
+        # Signatures without a name find nothing
+        results = [ [] for signature in signatures ]
+        indices = [ index for (index, signature) in enumerate(signatures) if len(signature) > 0 ]
+
+        # Walk signature index
+        if self.signature_depth > 0:
+            if self._signatures == None:
+                self._signatures = CMakeSignatureIndex(
+                    (e for e in self.elements.iter_raw() if e.is_command()), self.signature_depth)
+            found = self._signatures.find_batch([ signatures[index] for index in indices ])
+            for (index, cmds) in zip(indices, found):
+                results[index] = cmds
+        else:
+            self._match_commands(signatures, indices, results)
+
+        # Take ownership (a command may be in several results, but is only copied once)
+        if self._shared:
+            owned = {}
+            for cmds in results:
+                for cmd in cmds:
+                    if not id(cmd) in owned:
+                        owned[id(cmd)] = self.own(cmd)
+            results = [ [ owned[id(cmd)] for cmd in cmds ] for cmds in results ]
+        return results
+
+    def _match_commands(self, signatures, indices, results):
+        """Find commands for several signatures in one pass over the commands of each name
+
+        Args:
+            signatures (list): List of command signatures
+            indices (list): Indices of the signatures to look up
+            results (list): Lists to which the commands of each signature are added
+
+        """
+
+        # Group signatures by name and first argument
+        names = {}
+        for index in indices:
+            signature = signatures[index]
+            (any_arg, by_arg) = names.setdefault(signature[0].casefold(), ([], {}))
+            if len(signature) == 1:
+                any_arg.append(index)
+            else:
+                by_arg.setdefault(signature[1], []).append(index)
+
+        # Compare the commands of each name to its signatures
+        for (name, (any_arg, by_arg)) in names.items():
+            for cmd in self._get_commands(name):
+                for index in any_arg:
+                    results[index].append(cmd)
+                cmd_signature = cmd.signature()
+                if len(cmd_signature) > 1:
+                    for index in by_arg.get(cmd_signature[1], []):
+                        args = tuple(signatures[index][1:])
+                        if cmd_signature[1:len(args) + 1] == args:
+                            results[index].append(cmd)
 
     def set_command_arg(self, signature, index, value):
         """Set argument of all commands that match a certain signature
@@ -105,26 +727,61 @@ class CMakeFile:
             before (CMakeElement): Element before which to add the command
             after (CMakeElement): Element after which to add the command
 
+        Returns:
+            CMakeCommand: The new command
+
         """
 
         # Create new command
         tokens = []
         for name in cmd:
+            if len(tokens) > 2:
+                tokens.append([ TokenType.WHITESPACE, ' ' ])
             tokens.append([ TokenType.DEFAULT, name ])
             if len(tokens) == 1:
                 tokens.append([ TokenType.SPECIAL_CHAR, '(' ])
         tokens.append([ TokenType.SPECIAL_CHAR, ')' ])
         tokens.append([ TokenType.EOL, '\n' ])
+        if self.compact:
+            tokens = CMakeTokens(tokens)
         command = CMakeCommand(tokens)
+        self.insert_command(command, before, after)
+        return command
+
+    def insert_command(self, command, before = None, after = None):
+        """Insert command object
+
+        Args:
+            command (CMakeCommand): Command that is not part of a file
+            before (CMakeElement): Element before which to add the command
+            after (CMakeElement): Element after which to add the command
+
+        """
+
+        command.owner = self
+        self._source_map = None
+        self.dirty = True
 
         # Insert command into file
         if before != None:
-            self.elements.insert(self.elements.index(before), command)
+            self.elements.insert_before(before, command)
         elif after != None:
-            self.elements.insert(self.elements.index(after) + 1, command)
+            self.elements.insert_after(after, command)
         else:
             self.elements.append(command)
 
+        # Update indices, the command goes next to the nearest command of the same name
+        elements = self.elements
+        if self._commands != None:
+            elements = self._index_command(command, ordered = True)
+        if self._signatures != None:
+            self._signatures.insert(command, elements)
+        if self._variables != None:
+            self._variables.add(command, self.elements)
+
+        # Remember how to undo the change
+        self._record(lambda: self.remove_command(command))
+
     def remove_command(self, cmd):
         """Remove command from cmake file
 
@@ -133,5 +790,19 @@ class CMakeFile:
 
         """
 
-        # Remove command
+        # Remove command (a shared command is replaced by a copy first, to keep the original intact)
+        cmd = self.own(cmd)
+        following = self.elements.next(cmd)
         self.elements.remove(cmd)
+        if self._commands != None:
+            self._commands[cmd.name.casefold()].remove(cmd)
+        if self._signatures != None:
+            self._signatures.remove(cmd)
+        if self._variables != None:
+            self._variables.remove(cmd)
+        cmd.owner = None
+        self._source_map = None
+        self.dirty = True
+
+        # Remember how to undo the change
+        self._record(lambda: self.insert_command(cmd, before = following))
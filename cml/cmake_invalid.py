@@ -0,0 +1,24 @@
+import os
+
+from .cmake_element import CMakeElement
+from .cmake import ElementType, TokenType
+
+
+class CMakeInvalid(CMakeElement):
+    """A section of a cmake file that could not be parsed
+
+    The tokens are kept unchanged, so that the file is written back as it was read.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, tokens):
+        """Constructor
+
+        Args:
+            tokens (list): List of tokens that belong to the invalid section
+
+        """
+
+        super().__init__(ElementType.INVALID)
+        self.tokens = tokens
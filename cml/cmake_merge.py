@@ -0,0 +1,207 @@
+import bisect
+
+from .cmake import CMakeDiagnostic
+
+
+def element_key(element):
+    """Get key by which elements of different versions of a file are aligned
+
+    Commands are compared by their case-folded name and arguments, so that
+    changes in whitespace between the arguments do not matter. All other
+    elements are compared by their text.
+
+    Args:
+        element (CMakeElement): Element
+
+    Returns:
+        tuple or string: Hashable key of the element
+
+    """
+
+    if element.is_command():
+        return (element.name.casefold(), ) + element.signature()[1:]
+    return element.text
+
+
+def align(a, b):
+    """Align two sequences of keys
+
+    Common prefixes and suffixes are matched first. The remaining range is
+    split at the keys that occur exactly once in both sequences (keeping the
+    longest run of them that is in the same order in both), and each part is
+    aligned the same way. Keys are only compared through dicts, so for files
+    that are mostly equal this takes about linear time. Keys that are not
+    unique in a part are only matched at its start or end.
+
+    Args:
+        a (list): Keys of the first sequence
+        b (list): Keys of the second sequence
+
+    Returns:
+        list: Pairs (i, j) of matching indices, in increasing order
+
+    """
+
+    matches = []
+    ranges = [ (0, len(a), 0, len(b)) ]
+    while len(ranges) > 0:
+        (a_begin, a_end, b_begin, b_end) = ranges.pop()
+
+        # Match common prefix and suffix
+        while a_begin < a_end and b_begin < b_end and a[a_begin] == b[b_begin]:
+            matches.append((a_begin, b_begin))
+            a_begin += 1
+            b_begin += 1
+        while a_begin < a_end and b_begin < b_end and a[a_end - 1] == b[b_end - 1]:
+            a_end -= 1
+            b_end -= 1
+            matches.append((a_end, b_end))
+        if a_begin == a_end or b_begin == b_end:
+            continue
+
+        # Split at unique keys
+        (i, j) = (a_begin, b_begin)
+        for (anchor_a, anchor_b) in _unique_matches(a, a_begin, a_end, b, b_begin, b_end):
+            ranges.append((i, anchor_a, j, anchor_b))
+            matches.append((anchor_a, anchor_b))
+            (i, j) = (anchor_a + 1, anchor_b + 1)
+        if i > a_begin:
+            ranges.append((i, a_end, j, b_end))
+
+    matches.sort()
+    return matches
+
+
+def _unique_matches(a, a_begin, a_end, b, b_begin, b_end):
+    """Find keys that occur exactly once in two ranges
+
+    Args:
+        a (list): Keys of the first sequence
+        a_begin (int): Start of the range in a
+        a_end (int): End of the range in a
+        b (list): Keys of the second sequence
+        b_begin (int): Start of the range in b
+        b_end (int): End of the range in b
+
+    Returns:
+        list: Pairs (i, j) of indices of unique keys that are in the same order in both ranges
+
+    """
+
+    # Count keys
+    counts = {}
+    for i in range(a_begin, a_end):
+        entry = counts.get(a[i])
+        counts[a[i]] = [ i, None, 1 ] if entry == None else [ i, None, 2 ]
+    for j in range(b_begin, b_end):
+        entry = counts.get(b[j])
+        if entry != None:
+            if entry[1] == None:
+                entry[1] = j
+            else:
+                entry[2] = 2
+    pairs = sorted((i, j) for (i, j, count) in counts.values() if count == 1 and j != None)
+
+    # Keep the longest increasing subsequence of positions in b (patience sorting)
+    tails = []        # Position in b at the end of the best subsequence of each length
+    tail_indices = [] # Index in pairs of that end
+    previous = []     # Index in pairs of the predecessor of each pair
+    for (index, (_, j)) in enumerate(pairs):
+        length = bisect.bisect_left(tails, j)
+        if length == len(tails):
+            tails.append(j)
+            tail_indices.append(index)
+        else:
+            tails[length] = j
+            tail_indices[length] = index
+        previous.append(tail_indices[length - 1] if length > 0 else None)
+
+    anchors = []
+    index = tail_indices[-1] if len(tail_indices) > 0 else None
+    while index != None:
+        anchors.append(pairs[index])
+        index = previous[index]
+    anchors.reverse()
+    return anchors
+
+
+def merge(base, ours, theirs):
+    """Three-way merge of elements
+
+    Elements are aligned by their keys (see element_key). Parts that have
+    only been changed in ours or theirs are taken from that version, parts
+    that have been changed in both the same way are taken from ours. Parts
+    that have been changed differently are conflicts, for which ours is kept.
+
+    Args:
+        base (list): Elements of the common ancestor (CMakeElement)
+        ours (list): Elements of the modified version, e.g., a project file (CMakeElement)
+        theirs (list): Elements of the other modified version, e.g., a new template (CMakeElement)
+
+    Returns:
+        (list, list): Merged elements, and the conflicts as (begin, end) ranges of the merged elements
+
+    """
+
+    base_keys = [ element_key(element) for element in base ]
+    our_keys = [ element_key(element) for element in ours ]
+    their_keys = [ element_key(element) for element in theirs ]
+    our_matches = dict(align(base_keys, our_keys))
+    their_matches = dict(align(base_keys, their_keys))
+
+    elements = []
+    conflicts = []
+    (b, o, t) = (0, 0, 0)
+    for k in range(len(base) + 1):
+        # Find next element that is unchanged in both versions (or the end)
+        if k < len(base):
+            if not k in our_matches or not k in their_matches:
+                continue
+            (next_o, next_t) = (our_matches[k], their_matches[k])
+        else:
+            (next_o, next_t) = (len(ours), len(theirs))
+
+        # Merge changed parts before it
+        if our_keys[o:next_o] == base_keys[b:k]:
+            elements.extend(theirs[t:next_t])
+        elif their_keys[t:next_t] == base_keys[b:k] or our_keys[o:next_o] == their_keys[t:next_t]:
+            elements.extend(ours[o:next_o])
+        else:
+            begin = len(elements)
+            elements.extend(ours[o:next_o])
+            conflicts.append((begin, len(elements)))
+
+        # Keep unchanged element
+        if k < len(base):
+            elements.append(ours[next_o])
+        (b, o, t) = (k + 1, next_o + 1, next_t + 1)
+
+    return (elements, conflicts)
+
+
+def merge_files(base, ours, theirs):
+    """Three-way merge of cmake files
+
+    The changes from base to theirs are merged into ours (see merge).
+
+    Args:
+        base (CMakeFile): Common ancestor, e.g., the template a project file has been generated from
+        ours (CMakeFile): File to update, e.g., a project file
+        theirs (CMakeFile): Other modified version, e.g., a new version of the template
+
+    Returns:
+        list: Conflicts in ours, with the line of each (CMakeDiagnostic)
+
+    """
+
+    # Replace elements
+    (elements, conflicts) = merge(list(base.elements), list(ours.elements), list(theirs.elements))
+    ours.splice(0, len(ours.elements), elements)
+
+    # Report conflicts
+    source_map = ours.source_map
+    diagnostics = []
+    for (begin, end) in conflicts:
+        (line, column) = source_map.line_column(source_map.element_starts[begin])
+        diagnostics.append(CMakeDiagnostic(line, column, 'Conflicting changes, kept {} element(s) of the file'.format(end - begin)))
+    return diagnostics
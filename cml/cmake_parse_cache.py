@@ -0,0 +1,109 @@
+import collections
+import threading
+
+
+class CMakeParseCache:
+    """Bounded cache of parsed cmake files
+
+    Parsed files are stored by path and parser options, together with the
+    modification time, size and inode of the file when it was parsed.
+    Entries are only returned while the file on disk still has the same
+    modification time, size and inode. When the total size of the cached files exceeds the
+    limit, the least recently used files are evicted.
+
+    The cached files must not be modified. get() hands out snapshots of
+    them (see CMakeFile.snapshot), so that modifications of the loaded files
+    never reach the cache.
+    """
+
+    persistent = False # Entries only live as long as the process
+
+    def __init__(self, max_size = 64 * 1024 * 1024):
+        """Constructor
+
+        Args:
+            max_size (int): Maximum total size of the cached files in bytes
+
+        """
+
+        self.max_size = max_size
+        self.size = 0       # Total size of the cached files in bytes
+        self.hits = 0       # Number of lookups that found a parsed file
+        self.misses = 0     # Number of lookups that did not
+        self.evictions = 0  # Number of files evicted to stay within max_size
+        self._entries = collections.OrderedDict() # (stamp, size, CMakeFile) by key, least recently used first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, stamp):
+        """Get parsed file
+
+        Args:
+            key (tuple): Real path of the file and parser options
+            stamp (tuple): Modification time, size and inode of the file on disk
+
+        Returns:
+            CMakeFile: Snapshot of the parsed file, or None if the file is not cached or has been modified since
+
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry != None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2].snapshot()
+
+            # Drop outdated entry
+            if entry != None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, stamp, cmake_file, size):
+        """Add parsed file
+
+        Args:
+            key (tuple): Real path of the file and parser options
+            stamp (tuple): Modification time, size and inode of the file when it was parsed
+            cmake_file (CMakeFile): Parsed file, which must not be modified afterwards
+            size (int): Size of the file in bytes
+
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_size:
+                return
+
+            self._entries[key] = (stamp, size, cmake_file)
+            self.size += size
+
+            # Evict least recently used files
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all files and reset the counters"""
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _remove(self, key):
+        """Remove file (the lock must be held)
+
+        Args:
+            key (tuple): Key of a cached file
+
+        """
+
+        (_, size, _) = self._entries.pop(key)
+        self.size -= size
@@ -1,21 +1,150 @@
+import bisect
+import io
+import mmap
 import os
+import re
+import sys
+import time
 
-from .cmake import ElementType, TokenType
-from .cmake_file import CMakeFile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from .cmake import CMakeDiagnostic, CMakeSyntaxError, ElementType, TokenType, Tokenizer
+from .cmake_file import CMakeFile, file_stamp
 from .cmake_command import CMakeCommand
 from .cmake_comment import CMakeComment
+from .cmake_invalid import CMakeInvalid
+from .cmake_tokens import CMakeTokenBuffer, CMakeTokens
 from .cmake_whitespace import CMakeWhitespace
 
 
+# Regular expression that matches one token of the same kind as the legacy state machine
+_TOKEN_REGEX = re.compile(r'''
+    (\n)                                  # EOL
+  | ([()])                                # SPECIAL_CHAR
+  | ([ \t]+)                              # WHITESPACE
+  | (\#[^\n]*)                            # COMMENT
+  | ("(?:[^"\\\n]|\\[^\n])*(?:"|\\)?)     # STRING (ends at EOL, like the state machine)
+  | ([^ \t\n#"()]+)                       # DEFAULT
+''', re.VERBOSE)
+
+# Same tokens on raw bytes, carriage returns are treated as whitespace
+_TOKEN_REGEX_BYTES = re.compile(rb'''
+    (\n)                                  # EOL
+  | ([()])                                # SPECIAL_CHAR
+  | ([ \t\r]+)                            # WHITESPACE
+  | (\#[^\n]*)                            # COMMENT
+  | ("(?:[^"\\\n]|\\[^\n])*(?:"|\\)?)     # STRING
+  | ([^ \t\r\n#"()]+)                     # DEFAULT
+''', re.VERBOSE)
+
+# Regular expression that finds newlines and brackets outside of strings and comments
+_STRUCTURE_REGEX = re.compile(r'''
+    (\n)                                  # EOL
+  | (\()                                  # Open bracket
+  | (\))                                  # Close bracket
+  | "(?:[^"\\\n]|\\[^\n])*(?:"|\\)?       # STRING
+  | \#[^\n]*                              # COMMENT
+''', re.VERBOSE)
+
+# Regular expression that matches one token of the complete listfile grammar
+# (bracket arguments, bracket comments and quoted arguments may span several lines)
+_LISTFILE_REGEX = re.compile(r'''
+    (\n)                                  # EOL
+  | ([()])                                # SPECIAL_CHAR
+  | ([ \t]+)                              # WHITESPACE
+  | (\#\[(=*)\[[\s\S]*?(?:\]\5\]|\Z))     # COMMENT (bracket comment)
+  | (\#[^\n]*)                            # COMMENT (line comment)
+  | ("(?:[^"\\]|\\[\s\S])*(?:"|\Z))       # STRING (quoted argument)
+  | (\[(=*)\[[\s\S]*?(?:\]\9\]|\Z))       # STRING (bracket argument)
+  | ((?:[^ \t\n()\#"\\]|\\[^\n]?)+)       # DEFAULT (unquoted argument)
+''', re.VERBOSE)
+
+# Regular expression that matches terminated strings and comments, to find unterminated ones
+_CLOSED_REGEX = re.compile(r'''
+    "(?:[^"\\]|\\[\s\S])*"                # Quoted argument
+  | \#?\[(=*)\[[\s\S]*\]\1\]              # Bracket argument or bracket comment
+  | \#(?!\[=*\[)[^\n]*                    # Line comment
+''', re.VERBOSE)
+
+# Regular expression that matches valid command names
+_IDENTIFIER_REGEX = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+
+# Minimum file size (in bytes) for parsing a file in parallel
+PARALLEL_THRESHOLD = 1024 * 1024
+
+# Files modified less than this many nanoseconds before they are parsed are not cached,
+# they could be modified again without changing their modification time
+_RACY_INTERVAL = 2 * 1000 * 1000 * 1000
+
+# Special characters by byte value
+_SPECIAL_CHARS = { ord('('): '(', ord(')'): ')' }
+
+# Token types in the order of the groups of _TOKEN_REGEX and _TOKEN_REGEX_BYTES
+_TOKEN_GROUPS = (
+    None,
+    TokenType.EOL,
+    TokenType.SPECIAL_CHAR,
+    TokenType.WHITESPACE,
+    TokenType.COMMENT,
+    TokenType.STRING,
+    TokenType.DEFAULT
+)
+
+# Token types in the order of the groups of _LISTFILE_REGEX
+_LISTFILE_GROUPS = (
+    None,
+    TokenType.EOL,
+    TokenType.SPECIAL_CHAR,
+    TokenType.WHITESPACE,
+    TokenType.COMMENT,
+    None,
+    TokenType.COMMENT,
+    TokenType.STRING,
+    TokenType.STRING,
+    None,
+    TokenType.DEFAULT
+)
+
+
 class CMakeParser:
     """A parser for cmake files"""
 
-    def __init__(self):
-        """Default Constructor"""
+    def __init__(self, tokenizer=Tokenizer.REGEX, compact=False, mmap=False, jobs=1,
+                       parallel_threshold=PARALLEL_THRESHOLD, full_grammar=False, cache=None):
+        """Constructor
+
+        In full grammar mode, the parser accepts the complete cmake listfile syntax
+        (nested brackets, bracket arguments and comments, multi-line strings) and
+        recovers from syntax errors: lines that cannot be parsed are kept as
+        CMakeInvalid elements and reported in CMakeFile.diagnostics. The whole
+        file is then tokenized at once, tokenizer, mmap and jobs are ignored.
+
+        Args:
+            tokenizer (Tokenizer): Tokenizer engine to use
+            compact (Boolean): True to create cmake files in compact storage mode
+            mmap (Boolean): True to memory-map files on load (see load_mapped)
+            jobs (int): Number of processes used to parse large files (see load_parallel)
+            parallel_threshold (int): Minimum file size (in bytes) for parsing a file in parallel
+            full_grammar (Boolean): True to parse the complete listfile grammar and recover from errors
+            cache (CMakeParseCache): Cache of parsed files to use in load, None to always parse files
+
+        """
+        self.tokenizer = tokenizer
+        self.compact = compact
+        self.mmap = mmap
+        self.jobs = jobs
+        self.parallel_threshold = parallel_threshold
+        self.full_grammar = full_grammar
+        self.cache = cache
 
     def load(self, path):
         """Load cmake file
 
+        If the parser has a cache (CMakeParseCache or CMakeDiskCache) and the
+        file has not been modified since it has been parsed, the file is taken
+        from the cache. Modifications of the loaded file never affect the cache.
+
         Args:
             path (string): Path to cmake file
 
@@ -23,19 +152,227 @@ class CMakeParser:
             CMakeFile: Representation of cmake file, or None
         """
 
-        # Tokenize cmake file
-        tokens = self.tokenize(path)
-        if tokens == None:
+        # Check if file exists
+        if not os.path.isfile(path):
+            return None
+
+        # Get version of the file before reading it, so that changes while parsing show up later (see CMakeFile.is_outdated)
+        now = time.time_ns()
+        stamp = file_stamp(path)
+        if stamp == None:
             return None
 
-        # Parse structure of cmake file
-        cmake_file = self.parse_structure(path, tokens)
-        if cmake_file == None:
+        if self.cache == None:
+            # Parse file without cache
+            cmake_file = self._load(path)
+        else:
+            # Look up parsed file by path, parser options, modification time and size (and inode, which changes on save)
+            key = (os.path.realpath(path), self.tokenizer, self.compact, self.mmap, self.full_grammar)
+            cmake_file = self.cache.get(key, stamp)
+            if cmake_file == None:
+                cmake_file = self._load(path)
+                if cmake_file != None and now - stamp[0] > _RACY_INTERVAL:
+                    # The cache may keep the parsed file, so hand out a copy-on-write snapshot of it
+                    self.cache.put(key, stamp, cmake_file, stamp[1])
+                    cmake_file = cmake_file.snapshot()
+
+        if cmake_file != None:
+            cmake_file.path = path
+            cmake_file.stamp = stamp
+        return cmake_file
+
+    def _load(self, path):
+        """Parse cmake file
+
+        Args:
+            path (string): Path to an existing cmake file
+
+        Returns:
+            CMakeFile: Representation of cmake file, or None
+        """
+
+        if self.mmap and not self.full_grammar:
+            # Keep tokens as spans of the mapped file
+            cmake_file = self.load_mapped(path)
+        elif self.jobs > 1 and not self.full_grammar and os.path.getsize(path) >= self.parallel_threshold:
+            # Split large files and parse them in parallel
+            cmake_file = self.load_parallel(path)
+        else:
+            # Collect elements from the token stream
+            cmake_file = self.parse_structure(path, self.iter_tokens(path))
+
+        # File is in sync with the disk
+        if cmake_file != None:
+            cmake_file.dirty = False
+        return cmake_file
+
+    def find_first(self, path, signatures):
+        """Find the first command for each of the given signatures
+
+        The file is parsed as a stream and only read until all signatures have
+        been found, so no complete CMakeFile is built.
+
+        Args:
+            path (string): Path to cmake file
+            signatures (list): List of command signatures, e.g. [ [ 'set', 'META_PROJECT_NAME' ] ]
+
+        Returns:
+            list: First command for each signature (CMakeCommand or None), or None if the file could not be parsed
+
+        """
+
+        # Check if file exists
+        if not os.path.isfile(path):
             return None
 
+        # Commands found so far
+        cmds = [ None ] * len(signatures)
+        remaining = len([ signature for signature in signatures if len(signature) > 0 ])
+
+        if remaining == 0:
+            return cmds
+
+        # Parse file until all signatures are resolved (invalid lines are skipped in full grammar mode)
+        elements = self.iter_elements(path, [])
+        try:
+            for element in elements:
+                if element.is_command():
+                    for (index, signature) in enumerate(signatures):
+                        if cmds[index] == None and len(signature) > 0 and element.name.casefold() == signature[0].casefold():
+                            if element.matches(signature):
+                                cmds[index] = element
+                                remaining -= 1
+
+                    # Stop reading as soon as everything has been found
+                    if remaining == 0:
+                        break
+        except CMakeSyntaxError:
+            # Syntax error
+            return None
+        finally:
+            # Close file
+            elements.close()
+
         # Done
+        return cmds
+
+    def reparse(self, cmake_file):
+        """Update cmake file after it has been modified on disk
+
+        The new content of the file is compared to the current content of
+        cmake_file. Only the elements that contain changes are parsed again
+        and replaced, all other elements are kept as they are. If the changed
+        elements contain syntax errors (e.g., a bracket that is closed further
+        down the file), the rest of the file is parsed again.
+
+        Args:
+            cmake_file (CMakeFile): Cmake file loaded by a parser with the same options
+
+        Returns:
+            CMakeFile: The updated cmake file, or None (cmake_file is then unchanged)
+
+        """
+
+        # Check if file exists
+        if not os.path.isfile(cmake_file.path):
+            return None
+
+        # Get version of the file before reading it
+        stamp = file_stamp(cmake_file.path)
+
+        # Memory-mapped tokens may already refer to the new content, so load the whole file
+        if cmake_file.token_buffer != None:
+            new_file = self._load(cmake_file.path)
+            if new_file == None:
+                return None
+            for element in new_file.elements:
+                element.owner = None
+            cmake_file.splice(0, len(cmake_file.elements), new_file.elements)
+            cmake_file.token_buffer = new_file.token_buffer
+            cmake_file.diagnostics = new_file.diagnostics
+            cmake_file.dirty = False
+            cmake_file.stamp = stamp
+            return cmake_file
+
+        # Read new content
+        with open(cmake_file.path, encoding='utf-8') as f:
+            text = f.read()
+
+        # Render current content (unmodified elements are cached)
+        elements = cmake_file.elements
+        texts = [ element.text for element in elements.iter_raw() ]
+        starts = [ 0 ]
+        for element_text in texts:
+            starts.append(starts[-1] + len(element_text))
+        old = ''.join(texts)
+
+        # Find changed range
+        prefix = _common_prefix(old, text)
+        if prefix == len(old) and prefix == len(text):
+            cmake_file.dirty = False
+            cmake_file.stamp = stamp
+            return cmake_file
+        suffix = _common_suffix(old, text, min(len(old), len(text)) - prefix)
+
+        # Widen it to the elements that contain the changes
+        begin = max(0, min(bisect.bisect_right(starts, prefix) - 1, len(elements) - 1))
+        end = min(bisect.bisect_right(starts, len(old) - suffix), len(elements))
+
+        # Parse changed elements, or everything after them if they are not complete
+        diagnostics = []
+        new_elements = self._parse_text(text[starts[begin]:len(text) - (len(old) - starts[end])], diagnostics)
+        if (new_elements == None or len(diagnostics) > 0) and end < len(elements):
+            end = len(elements)
+            diagnostics = []
+            new_elements = self._parse_text(text[starts[begin]:], diagnostics)
+
+        if new_elements == None:
+            # Syntax error
+            return None
+
+        # Move diagnostics to their new lines
+        if self.full_grammar:
+            first_line = old.count('\n', 0, starts[begin]) + 1
+            end_line = old.count('\n', 0, starts[end]) + 1
+            shift = first_line + text.count('\n', starts[begin], len(text) - (len(old) - starts[end])) - end_line
+            cmake_file.diagnostics = \
+                [ d for d in cmake_file.diagnostics if d.line < first_line ] + \
+                [ d._replace(line = d.line + first_line - 1) for d in diagnostics ] + \
+                [ d._replace(line = d.line + shift) for d in cmake_file.diagnostics if d.line >= end_line ]
+
+        # Replace changed elements
+        cmake_file.splice(begin, end, new_elements)
+        cmake_file.dirty = False
+        cmake_file.stamp = stamp
         return cmake_file
 
+    def _parse_text(self, text, diagnostics):
+        """Parse part of a cmake file into elements
+
+        Args:
+            text (string): Complete elements of a cmake file
+            diagnostics (list): List that collects syntax errors in full grammar mode
+
+        Returns:
+            list: List of elements (CMakeElement), or None on syntax errors
+
+        """
+
+        # Tokenize text with the selected engine
+        if self.full_grammar:
+            tokens = self.iter_tokens_listfile(text)
+        elif self.tokenizer == Tokenizer.FSM:
+            tokens = self.iter_tokens_fsm(io.StringIO(text))
+        else:
+            tokens = self.iter_tokens_string(text)
+
+        # Parse elements
+        try:
+            return list(self.parse_elements(tokens, diagnostics))
+        except CMakeSyntaxError:
+            # Syntax error
+            return None
+
     def tokenize(self, path):
         """Parse cmake file into list of tokens
 
@@ -51,15 +388,129 @@ class CMakeParser:
         if not os.path.isfile(path):
             return None
 
-        # Open file
-        f = open(path)
+        # Tokenize file with the selected engine
+        with open(path, encoding='utf-8') as f:
+            if self.full_grammar:
+                return self.tokenize_listfile(f.read())
+            elif self.tokenizer == Tokenizer.FSM:
+                return self.tokenize_fsm(f)
+            else:
+                return self.tokenize_string(f.read())
+
+    def tokenize_string(self, text):
+        """Parse string into list of tokens
+
+        Produces the same tokens as tokenize_fsm(), but scans the text
+        with a compiled regular expression instead of character by character.
+
+        Args:
+            text (string): Content of a cmake file
+
+        Returns:
+            list: List of tokens (TokenType, string)
+
+        """
+
+        groups = _TOKEN_GROUPS
+        return [ (groups[m.lastindex], m.group()) for m in _TOKEN_REGEX.finditer(text) ]
+
+    def tokenize_listfile(self, text):
+        """Parse string into list of tokens of the complete listfile grammar
+
+        Args:
+            text (string): Content of a cmake file
+
+        Returns:
+            list: List of tokens (TokenType, string)
+
+        """
+        return list(self.iter_tokens_listfile(text))
+
+    def tokenize_fsm(self, f):
+        """Parse stream into list of tokens using the legacy state machine
+
+        Args:
+            f (file object): Input stream to read from
+
+        Returns:
+            list: List of tokens (TokenType, string)
+
+        """
+        return list(self.iter_tokens_fsm(f))
+
+    def iter_tokens(self, path):
+        """Tokenize cmake file lazily
+
+        The file is read line by line (no token spans more than one line),
+        so only the current line is held in memory. In full grammar mode,
+        tokens may span lines and the file is read at once.
+
+        Args:
+            path (string): Path to cmake file
+
+        Yields:
+            (TokenType, string): Next token of the file
+
+        """
+
+        with open(path, encoding='utf-8') as f:
+            if self.full_grammar:
+                yield from self.iter_tokens_listfile(f.read())
+            elif self.tokenizer == Tokenizer.FSM:
+                yield from self.iter_tokens_fsm(f)
+            else:
+                for line in f:
+                    yield from self.iter_tokens_string(line)
+
+    def iter_tokens_string(self, text):
+        """Tokenize string lazily
+
+        Args:
+            text (string): Content of a cmake file
+
+        Yields:
+            (TokenType, string): Next token of the text
+
+        """
+
+        groups = _TOKEN_GROUPS
+        for m in _TOKEN_REGEX.finditer(text):
+            yield (groups[m.lastindex], m.group())
+
+    def iter_tokens_listfile(self, text):
+        """Tokenize string lazily according to the complete listfile grammar
+
+        Unterminated strings, bracket arguments and bracket comments extend
+        to the end of the text.
+
+        Args:
+            text (string): Content of a cmake file
+
+        Yields:
+            (TokenType, string): Next token of the text
+
+        """
+
+        groups = _LISTFILE_GROUPS
+        for m in _LISTFILE_REGEX.finditer(text):
+            yield (groups[m.lastindex], m.group())
+
+    def iter_tokens_fsm(self, f):
+        """Tokenize stream lazily using the legacy state machine
+
+        Args:
+            f (file object): Input stream to read from
+
+        Yields:
+            (TokenType, string): Next token of the stream
+
+        """
 
         # Tokenizer configuration
         whitespace = [ ' ', '\t' ]
         special = [ '(', ')' ]
 
         # Tokenize stream
-        tokens = []
         token = ''
         mode = TokenType.DEFAULT
         escape_code = False
@@ -127,7 +578,7 @@ class CMakeParser:
             # Finish old word if mode has changed
             if mode != next_mode:
                 if len(token) > 0:
-                    tokens.append((mode, token))
+                    yield (mode, token)
                 token = ''
 
             # Stop on EOF
@@ -140,7 +591,7 @@ class CMakeParser:
             # End EOL and SPECIAL_CHAR modes right away
             if mode == TokenType.EOL or mode == TokenType.SPECIAL_CHAR:
                 # Add token
-                tokens.append((mode, c))
+                yield (mode, c)
                 token = ''
 
                 # Switch to default mode
@@ -149,106 +600,768 @@ class CMakeParser:
                 # Add character to word
                 token += c
 
-        # Done parsing
-        return tokens
-
     def parse_structure(self, path, tokens):
         """Parse structure of cmake file after loading
 
         Args:
             path (string): Path to cmake file
-            tokens (list): List of tokens (TokenType, string)
+            tokens (iterable): Tokens (TokenType, string), e.g., a list or iter_tokens()
 
         Returns:
-            CMakeFile: Representation of cmake file, or None
+            CMakeFile: Representation of cmake file, or None (never None in full grammar mode)
 
         """
 
         # Create object
-        cmake_file = CMakeFile(path)
+        cmake_file = CMakeFile(path, compact=self.compact)
 
-        # Type of the current element
-        element = ElementType.WHITESPACE
-        command_status = 0
+        # Collect elements (errors are added to the diagnostics in full grammar mode)
+        try:
+            for element in self.parse_elements(tokens, cmake_file.diagnostics):
+                cmake_file.add(element)
+        except CMakeSyntaxError:
+            # Syntax error
+            return None
+
+        # Done parsing
+        return cmake_file
+
+    def iter_elements(self, path, diagnostics = None):
+        """Parse cmake file lazily
+
+        Tokens are read and elements are created on demand, so scanning
+        a file this way does not keep the whole file in memory.
+
+        Args:
+            path (string): Path to cmake file
+            diagnostics (list): List that collects syntax errors in full grammar mode (see parse_elements)
+
+        Yields:
+            CMakeElement: Next element of the file
+
+        Raises:
+            CMakeSyntaxError: The file contains a syntax error
+
+        """
+        yield from self.parse_elements(self.iter_tokens(path), diagnostics)
+
+    def parse_elements(self, tokens, diagnostics = None):
+        """Parse tokens into elements lazily
+
+        In full grammar mode, syntax errors are added to diagnostics (if given)
+        and the affected lines are returned as CMakeInvalid elements.
+
+        Args:
+            tokens (iterable): Tokens (TokenType, string)
+            diagnostics (list): List that collects syntax errors (CMakeDiagnostic) in full grammar mode
+
+        Yields:
+            CMakeElement: Next element (CMakeCommand, CMakeComment, CMakeWhitespace or CMakeInvalid)
+
+        Raises:
+            CMakeSyntaxError: The tokens contain a syntax error (and no diagnostics are collected)
+
+        """
+
+        # Parse complete grammar
+        if self.full_grammar:
+            yield from self.parse_listfile_elements(tokens, diagnostics)
+            return
 
         # Tokens that belong to the current element
-        current = []
+        new_tokens = CMakeTokens if self.compact else list
+        current = new_tokens()
 
         # Parse tokens
+        scanner = _ElementScanner()
         for (token_type, token) in tokens:
             # Take token
             current.append([token_type, token])
 
-            # If we don't know what we are parsing, yet:
-            if element == ElementType.WHITESPACE:
-                # Determine type of element (if possible)
-                if token_type == TokenType.DEFAULT:
-                    # We are parsing a command
-                    element = ElementType.COMMAND
-                    command_status = 0
-                elif token_type == TokenType.COMMENT:
-                    # We are parsing a comment
-                    element = ElementType.COMMENT
-                elif token_type == TokenType.EOL:
-                    # We got an EOL and only whitespace before
-                    cmake_file.add(CMakeWhitespace(current))
-
-                    # Start next element
-                    element = ElementType.WHITESPACE
-                    current = []
+            # Emit element if the token has completed it
+            element_type = scanner.feed(token_type, token)
+            if element_type != None:
+                yield _create_element(element_type, current, scanner.name_position)
+                current = new_tokens()
+
+        # Add last element if the file does not end with a newline
+        if len(current) > 0:
+            yield _create_element(scanner.finish(), current, scanner.name_position)
+
+    def parse_listfile_elements(self, tokens, diagnostics = None):
+        """Parse tokens of the complete listfile grammar into elements lazily
+
+        Args:
+            tokens (iterable): Tokens (TokenType, string), e.g., iter_tokens_listfile()
+            diagnostics (list): List that collects syntax errors (CMakeDiagnostic), or None to raise them
+
+        Yields:
+            CMakeElement: Next element (CMakeCommand, CMakeComment, CMakeWhitespace or CMakeInvalid)
+
+        Raises:
+            CMakeSyntaxError: The tokens contain a syntax error and diagnostics is None
+
+        """
+
+        # Tokens that belong to the current element
+        new_tokens = CMakeTokens if self.compact else list
+        current = new_tokens()
+
+        # Position of the current token
+        line = 1
+        column = 1
+        last = None
+
+        # Parse tokens
+        scanner = _ListfileScanner()
+        for (token_type, token) in tokens:
+            # Take token
+            current.append([token_type, token])
+            last = (token_type, token, line, column)
+
+            # Report syntax errors at the start of the token
+            element_type = scanner.feed(token_type, token)
+            if scanner.error != None:
+                _report(diagnostics, line, column, scanner.error)
+
+            # Advance position
+            if token_type == TokenType.EOL:
+                line += 1
+                column = 1
+            elif token_type != TokenType.DEFAULT and '\n' in token:
+                line += token.count('\n')
+                column = len(token) - token.rfind('\n')
+            else:
+                column += len(token)
+
+            # Emit element if the token has completed it
+            if element_type != None:
+                yield _create_element(element_type, current, scanner.name_position)
+                current = new_tokens()
+
+        # Only the last token can be unterminated
+        if last != None and last[0] in [ TokenType.STRING, TokenType.COMMENT ] and _CLOSED_REGEX.fullmatch(last[1]) == None:
+            _report(diagnostics, last[2], last[3], 'Unterminated {}'.format(
+                'quoted argument' if last[1].startswith('"') else
+                'bracket comment' if last[1].startswith('#') else 'bracket argument'))
+
+        # Add last element if the file does not end with a newline
+        if len(current) > 0:
+            element_type = scanner.finish()
+            if scanner.error != None:
+                _report(diagnostics, line, column, scanner.error)
+            yield _create_element(element_type, current, scanner.name_position)
+
+    def load_mapped(self, path):
+        """Load cmake file by memory-mapping it
+
+        Tokens are kept as (type, start, end) spans into the mapped file
+        (see CMakeTokenBuffer) and only decoded when they are read. The file
+        must not be truncated by other processes while the result is in use.
+
+        Args:
+            path (string): Path to cmake file
+
+        Returns:
+            CMakeFile: Representation of cmake file, or None
+
+        """
+
+        # Check if file exists
+        if not os.path.isfile(path):
+            return None
+
+        # Map file (empty files cannot be mapped)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buffer = b''
+
+        # Parse structure of cmake file
+        try:
+            return self.parse_buffer(path, buffer)
+        except CMakeSyntaxError:
+            # Syntax error
+            return None
+
+    def load_parallel(self, path):
+        """Load cmake file by parsing chunks of it in a process pool
+
+        The file is split at newlines outside of commands (see split_points),
+        so that each element belongs to exactly one chunk. The elements of all
+        chunks are then added to the file in their original order.
+
+        Args:
+            path (string): Path to cmake file
+
+        Returns:
+            CMakeFile: Representation of cmake file, or None
+
+        """
+
+        # Check if file exists
+        if not os.path.isfile(path):
+            return None
+
+        # Read file and split it into chunks
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        offsets = [ 0 ] + self.split_points(text, self.jobs) + [ len(text) ]
+        chunks = [ text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1) ]
+
+        # Parse chunks
+        if len(chunks) > 1:
+            with ProcessPoolExecutor(min(self.jobs, len(chunks))) as pool:
+                results = list(pool.map(_parse_chunk, [ (self.tokenizer, chunk) for chunk in chunks ]))
+        else:
+            results = [ _parse_chunk((self.tokenizer, text)) ]
+
+        # Merge elements
+        cmake_file = CMakeFile(path, compact=self.compact)
+        for result in results:
+            if result == None:
+                # Syntax error
+                return None
+
+            for element in _create_chunk_elements(result, self.compact):
+                cmake_file.add(element)
+
+        # Done parsing
+        return cmake_file
+
+    def split_points(self, text, count):
+        """Find offsets at which a cmake file can be split into chunks
+
+        A chunk ends after a newline that is outside of strings, comments and
+        command brackets, so that no element is split.
+
+        Args:
+            text (string): Content of a cmake file
+            count (int): Number of chunks to create (at most)
+
+        Returns:
+            list: Ascending offsets at which new chunks start
+
+        """
+
+        # Offsets from which to look for the next split point
+        targets = [ len(text) * i // count for i in range(1, count) ]
+
+        # Find newlines at the top level
+        points = []
+        depth = 0
+        for m in _STRUCTURE_REGEX.finditer(text):
+            if len(points) == len(targets):
+                break
+
+            group = m.lastindex
+            if group == 1:
+                if depth == 0 and m.start() >= targets[len(points)] and m.end() < len(text):
+                    points.append(m.end())
+            elif group == 2:
+                depth += 1
+            elif group == 3:
+                depth -= 1
+
+        # Done
+        return points
+
+    def iter_spans(self, buffer):
+        """Tokenize buffer of bytes lazily
+
+        Produces the same tokens as tokenize_string(), except that carriage
+        returns are treated as whitespace.
+
+        Args:
+            buffer (bytes-like): Content of a cmake file
+
+        Yields:
+            (TokenType, int, int): Type, start and end offset of the next token
+
+        """
+
+        groups = _TOKEN_GROUPS
+        for m in _TOKEN_REGEX_BYTES.finditer(buffer):
+            yield (groups[m.lastindex], m.start(), m.end())
+
+    def parse_buffer(self, path, buffer):
+        """Parse structure of cmake file from a buffer of bytes
+
+        Args:
+            path (string): Path to cmake file
+            buffer (bytes-like): Content of the cmake file, encoded as UTF-8
+
+        Returns:
+            CMakeFile: Representation of cmake file
+
+        Raises:
+            CMakeSyntaxError: The buffer contains a syntax error
+
+        """
+
+        # Create object
+        cmake_file = CMakeFile(path, compact=True)
+        tokens = CMakeTokenBuffer(buffer)
+        cmake_file.token_buffer = tokens
+
+        # Parse tokens, only special characters are decoded for the scanner
+        scanner = _ElementScanner()
+        begin = 0
+        for (token_type, start, end) in self.iter_spans(buffer):
+            tokens.append(token_type, start, end)
+            token = _SPECIAL_CHARS.get(buffer[start]) if token_type == TokenType.SPECIAL_CHAR else None
+
+            # Emit element if the token has completed it
+            try:
+                element_type = scanner.feed(token_type, token)
+            except CMakeSyntaxError:
+                raise CMakeSyntaxError('Unexpected token \'{}\''.format(tokens.value(len(tokens) - 1))) from None
+            if element_type != None:
+                cmake_file.add(_create_element(element_type, tokens.range(begin, len(tokens)), scanner.name_position))
+                begin = len(tokens)
+
+        # Add last element if the file does not end with a newline
+        if begin < len(tokens):
+            cmake_file.add(_create_element(scanner.finish(), tokens.range(begin, len(tokens)), scanner.name_position))
+
+        # Done parsing
+        return cmake_file
+
+
+def _parse_chunk(args):
+    """Parse chunk of a cmake file (runs in a worker process of CMakeParser.load_parallel)
+
+    To keep the transfer between processes cheap, the result contains plain
+    token data and element boundaries instead of element objects.
+
+    Args:
+        args (tuple): Tokenizer and text of the chunk
+
+    Returns:
+        tuple: Token types (bytes), token values (list) and elements (list of
+               element type, end index and name position), or None on syntax errors
+
+    """
+
+    (tokenizer, text) = args
+    parser = CMakeParser(tokenizer)
+
+    # Tokenize chunk
+    if tokenizer == Tokenizer.FSM:
+        tokens = parser.iter_tokens_fsm(io.StringIO(text))
+    else:
+        tokens = parser.iter_tokens_string(text)
+
+    # Find elements
+    types = array('B')
+    values = []
+    elements = []
+    scanner = _ElementScanner()
+    try:
+        for (token_type, token) in tokens:
+            types.append(token_type.value)
+            values.append(token)
+            element_type = scanner.feed(token_type, token)
+            if element_type != None:
+                elements.append((element_type.value, len(values), scanner.name_position))
+
+        # Add last element if the chunk does not end with a newline
+        if len(values) > 0 and (len(elements) == 0 or elements[-1][1] < len(values)):
+            elements.append((scanner.finish().value, len(values), scanner.name_position))
+    except CMakeSyntaxError:
+        # Syntax error
+        return None
+
+    # Done
+    return (types.tobytes(), values, elements)
+
+
+def _create_chunk_elements(chunk, compact):
+    """Create elements from the result of _parse_chunk()
+
+    Args:
+        chunk (tuple): Result of _parse_chunk()
+        compact (Boolean): True to create elements in compact storage mode
+
+    Returns:
+        list: List of elements (CMakeElement)
+
+    """
+
+    (types, values, boundaries) = chunk
+    token_types = [ None ] * (max(t.value for t in TokenType) + 1)
+    for token_type in TokenType:
+        token_types[token_type.value] = token_type
+
+    elements = []
+    begin = 0
+    for (element_type, end, name_position) in boundaries:
+        # Get tokens of element
+        if compact:
+            tokens = CMakeTokens()
+            tokens.types.frombytes(types[begin:end])
+            tokens.values = [ sys.intern(value) for value in values[begin:end] ]
+        else:
+            tokens = [ [ token_types[token_type], value ] for (token_type, value) in zip(types[begin:end], values[begin:end]) ]
+
+        # Create element
+        elements.append(_create_element(ElementType(element_type), tokens, name_position))
+        begin = end
+
+    # Done
+    return elements
+
+
+def _create_element(element_type, tokens, name_position):
+    """Create element of the given type
+
+    Args:
+        element_type (ElementType): Type of element
+        tokens (list): List of tokens that belong to the element
+        name_position (int): Index of the command name in tokens (commands only)
+
+    Returns:
+        CMakeElement: New element
+
+    """
+
+    if element_type == ElementType.COMMAND:
+        return CMakeCommand(tokens, name_position)
+    elif element_type == ElementType.COMMENT:
+        return CMakeComment(tokens)
+    elif element_type == ElementType.INVALID:
+        return CMakeInvalid(tokens)
+    else:
+        return CMakeWhitespace(tokens)
+
+
+def _common_prefix(a, b):
+    """Get length of the common prefix of two strings
+
+    Blocks of halving size are compared, so that the strings are compared in
+    C rather than character by character.
+
+    Args:
+        a (string): First string
+        b (string): Second string
+
+    Returns:
+        int: Number of equal characters at the start of both strings
+
+    """
+
+    (low, high) = (0, min(len(a), len(b)))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    """Get length of the common suffix of two strings
+
+    Args:
+        a (string): First string
+        b (string): Second string
+        limit (int): Maximum length of the suffix
+
+    Returns:
+        int: Number of equal characters at the end of both strings
+
+    """
+
+    (low, high) = (0, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _report(diagnostics, line, column, message):
+    """Report syntax error
+
+    Args:
+        diagnostics (list): List that collects syntax errors (CMakeDiagnostic), or None to raise them
+        line (int): Line of the error
+        column (int): Column of the error
+        message (string): Description of the error
+
+    Raises:
+        CMakeSyntaxError: diagnostics is None
+
+    """
+
+    if diagnostics == None:
+        raise CMakeSyntaxError('{}:{}: {}'.format(line, column, message))
+    diagnostics.append(CMakeDiagnostic(line, column, message))
+
+
+class _ElementScanner:
+    """State machine that finds the elements in a stream of tokens"""
+
+    def __init__(self):
+        """Constructor"""
+
+        # Type of the current element
+        self.element = ElementType.WHITESPACE
+        self.command_status = 0
+
+        # Number of tokens of the current element, and index of the command name
+        self.count = 0
+        self.name_position = None
+
+    def feed(self, token_type, token):
+        """Process next token
+
+        Args:
+            token_type (TokenType): Type of token
+            token (string): Value of the token (only needed for special characters)
+
+        Returns:
+            ElementType: Type of the element completed by this token, or None
+
+        Raises:
+            CMakeSyntaxError: Unexpected token
+
+        """
+
+        element = self.element
+        self.count += 1
+
+        # If we don't know what we are parsing, yet:
+        if element == ElementType.WHITESPACE:
+            # Determine type of element (if possible)
+            if token_type == TokenType.DEFAULT:
+                # We are parsing a command
+                self.element = ElementType.COMMAND
+                self.command_status = 0
+                self.name_position = self.count - 1
+            elif token_type == TokenType.COMMENT:
+                # We are parsing a comment
+                self.element = ElementType.COMMENT
+            elif token_type == TokenType.EOL:
+                # We got an EOL and only whitespace before
+                return self.end()
+            elif token_type != TokenType.WHITESPACE:
+                # Syntax error
+                raise CMakeSyntaxError('Unexpected token \'{}\''.format(token))
+
+        # If we are parsing a comment:
+        elif element == ElementType.COMMENT:
+            # Only accept more comments and whitespace
+            if token_type == TokenType.EOL:
+                # End comment
+                return self.end()
+            elif token_type != TokenType.COMMENT and token_type != TokenType.WHITESPACE:
+                # Syntax error
+                raise CMakeSyntaxError('Unexpected token \'{}\''.format(token))
+
+        # If we are parsing a command:
+        elif element == ElementType.COMMAND:
+            # <command_name> '('
+            if self.command_status == 0:
+                # Expect open bracket
+                if token_type == TokenType.SPECIAL_CHAR and token == '(':
+                    # Switch to parsing the command arguments
+                    self.command_status = 1
                 elif token_type != TokenType.WHITESPACE:
                     # Syntax error
-                    return None
+                    raise CMakeSyntaxError('Unexpected token \'{}\''.format(token))
+
+            # <command_name> '(' ...
+            elif self.command_status == 1:
+                # Everything allowed except open bracket
+                if token_type == TokenType.SPECIAL_CHAR and token == ')':
+                    # Command has ended
+                    self.command_status = 2
+                elif token_type == TokenType.SPECIAL_CHAR and token == '(':
+                    # Syntax error
+                    raise CMakeSyntaxError('Unexpected token \'{}\''.format(token))
 
-            # If we are parsing a comment:
-            elif element == ElementType.COMMENT:
-                # Only accept more comments and whitespace
+            # <command_name> '(' ... ')'
+            elif self.command_status == 2:
+                # Expect only whitespace, comments, or newline from now on
                 if token_type == TokenType.EOL:
-                    # End comment
-                    cmake_file.add(CMakeComment(current))
+                    # End command
+                    return self.end()
+                elif not token_type in [ TokenType.WHITESPACE, TokenType.COMMENT ]:
+                    # Syntax error
+                    raise CMakeSyntaxError('Unexpected token \'{}\''.format(token))
+
+        # Element continues
+        return None
+
+    def end(self):
+        """End current element
+
+        Returns:
+            ElementType: Type of the element that has ended
+
+        """
+
+        element = self.element
+        self.element = ElementType.WHITESPACE
+        self.count = 0
+        return element
+
+    def finish(self):
+        """End last element at the end of the stream
+
+        Returns:
+            ElementType: Type of the last element
+
+        Raises:
+            CMakeSyntaxError: The last element is incomplete
+
+        """
+
+        if self.element == ElementType.COMMAND and self.command_status != 2:
+            # Syntax error
+            raise CMakeSyntaxError('Unexpected end of file')
+        return self.end()
+
+
+class _ListfileScanner(_ElementScanner):
+    """State machine that finds the elements in a stream of tokens of the complete listfile grammar
+
+    Instead of raising syntax errors, the scanner describes them in self.error
+    and continues with an element of type INVALID until the end of the line.
+    """
+
+    def __init__(self):
+        """Constructor"""
+
+        super().__init__()
+
+        # Nesting depth of brackets within the current command
+        self.depth = 0
+
+        # Syntax error found by the last token, or None
+        self.error = None
+
+    def feed(self, token_type, token):
+        """Process next token
+
+        Args:
+            token_type (TokenType): Type of token
+            token (string): Value of the token
+
+        Returns:
+            ElementType: Type of the element completed by this token, or None
+
+        """
+
+        element = self.element
+        self.count += 1
+        self.error = None
 
-                    # Start next element
-                    element = ElementType.WHITESPACE
-                    current = []
-                elif token_type != TokenType.COMMENT and token_type != TokenType.WHITESPACE:
+        # If we are skipping an invalid line:
+        if element == ElementType.INVALID:
+            # Skip everything until the end of the line
+            if token_type == TokenType.EOL:
+                return self.end()
+
+        # If we don't know what we are parsing, yet:
+        elif element == ElementType.WHITESPACE:
+            # Determine type of element (if possible)
+            if token_type == TokenType.DEFAULT:
+                # We are parsing a command
+                if _IDENTIFIER_REGEX.match(token) == None:
+                    return self.fail('Invalid command name \'{}\''.format(token), token_type)
+                self.element = ElementType.COMMAND
+                self.command_status = 0
+                self.name_position = self.count - 1
+            elif token_type == TokenType.COMMENT:
+                # We are parsing a comment
+                self.element = ElementType.COMMENT
+            elif token_type == TokenType.EOL:
+                # We got an EOL and only whitespace before
+                return self.end()
+            elif token_type != TokenType.WHITESPACE:
+                # Syntax error
+                return self.fail('Unexpected token \'{}\''.format(token), token_type)
+
+        # If we are parsing a comment:
+        elif element == ElementType.COMMENT:
+            # Only accept more comments and whitespace
+            if token_type == TokenType.EOL:
+                # End comment
+                return self.end()
+            elif token_type != TokenType.COMMENT and token_type != TokenType.WHITESPACE:
+                # Syntax error
+                return self.fail('Unexpected token \'{}\''.format(token), token_type)
+
+        # If we are parsing a command:
+        elif element == ElementType.COMMAND:
+            # <command_name> '('
+            if self.command_status == 0:
+                # Expect open bracket
+                if token_type == TokenType.SPECIAL_CHAR and token == '(':
+                    # Switch to parsing the command arguments
+                    self.command_status = 1
+                    self.depth = 1
+                elif token_type != TokenType.WHITESPACE:
                     # Syntax error
-                    return None
-
-            # If we are parsing a command:
-            elif element == ElementType.COMMAND:
-                # <command_name> '('
-                if command_status == 0:
-                    # Expect open bracket
-                    if token_type == TokenType.SPECIAL_CHAR and token == '(':
-                        # Switch to parsing the command arguments
-                        command_status = 1
-                    elif token_type != TokenType.WHITESPACE:
-                        # Syntax error
-                        return None
-
-                # <command_name> '(' ...
-                elif command_status == 1:
-                    # Everything allowed except open bracket
-                    if token_type == TokenType.SPECIAL_CHAR and token == ')':
+                    return self.fail('Expected \'(\' after command name', token_type)
+
+            # <command_name> '(' ...
+            elif self.command_status == 1:
+                # Everything allowed, brackets must be balanced
+                if token_type == TokenType.SPECIAL_CHAR:
+                    self.depth += 1 if token == '(' else -1
+                    if self.depth == 0:
                         # Command has ended
-                        command_status = 2
-                    elif token_type == TokenType.SPECIAL_CHAR and token == '(':
-                        # Syntax error
-                        return None
-
-                # <command_name> '(' ... ')'
-                elif command_status == 2:
-                    # Expect only whitespace, comments, or newline from now on
-                    if token_type == TokenType.EOL:
-                        # End command
-                        cmake_file.add(CMakeCommand(current))
-
-                        # Start next element
-                        element = ElementType.WHITESPACE
-                        current = []
-                    elif not token_type in [ TokenType.WHITESPACE, TokenType.COMMENT ]:
-                        # Syntax error
-                        return None
+                        self.command_status = 2
 
-        # Done parsing
-        return cmake_file
+            # <command_name> '(' ... ')'
+            elif self.command_status == 2:
+                # Expect only whitespace, comments, or newline from now on
+                if token_type == TokenType.EOL:
+                    # End command
+                    return self.end()
+                elif not token_type in [ TokenType.WHITESPACE, TokenType.COMMENT ]:
+                    # Syntax error
+                    return self.fail('Expected newline after command', token_type)
+
+        # Element continues
+        return None
+
+    def fail(self, message, token_type):
+        """Turn current element into an invalid element
+
+        Args:
+            message (string): Description of the syntax error
+            token_type (TokenType): Type of the token that caused the error
+
+        Returns:
+            ElementType: INVALID if the token has ended the line, else None
+
+        """
+
+        self.error = message
+        self.element = ElementType.INVALID
+        if token_type == TokenType.EOL:
+            return self.end()
+        return None
+
+    def finish(self):
+        """End last element at the end of the stream
+
+        Returns:
+            ElementType: Type of the last element (INVALID if it is incomplete)
+
+        """
+
+        self.error = None
+        if self.element == ElementType.COMMAND and self.command_status != 2:
+            # Syntax error
+            self.error = 'Unexpected end of file'
+            self.element = ElementType.INVALID
+        return self.end()
@@ -0,0 +1,194 @@
+import itertools
+
+from .cmake_element_list import CMakeElementList
+
+
+class _Node:
+    """Node of the signature trie"""
+
+    __slots__ = ('children', 'commands')
+
+    def __init__(self):
+        """Constructor"""
+
+        self.children = {} # Child nodes by next signature item
+        self.commands = CMakeElementList() # Commands whose key starts with the path to this node, in file order
+
+
+class CMakeSignatureIndex:
+    """Prefix trie over the signatures of commands
+
+    Commands are indexed by the first depth items of their signature (the
+    case-folded name and the first depth - 1 arguments). Each node of the
+    trie holds all commands whose key starts with the path to the node, so a
+    lookup of a signature of up to depth items is a walk over depth dicts.
+    Longer signatures are compared to the commands found on that path.
+    """
+
+    __slots__ = ('depth', 'root')
+
+    def __init__(self, commands, depth = 2):
+        """Constructor
+
+        Args:
+            commands (iterable): Commands to index, in file order (CMakeCommand)
+            depth (int): Number of signature items to index (at least 1)
+
+        """
+
+        self.depth = depth
+        self.root = _Node()
+
+        for cmd in commands:
+            self.append(cmd)
+
+    def key(self, cmd):
+        """Get key of a command
+
+        Args:
+            cmd (CMakeCommand): Command
+
+        Returns:
+            tuple: Case-folded name and first arguments of the command
+
+        """
+
+        signature = cmd.signature(self.depth - 1)
+        return (signature[0].casefold(), ) + signature[1:]
+
+    def append(self, cmd):
+        """Add command after all indexed commands
+
+        Args:
+            cmd (CMakeCommand): Command
+
+        """
+
+        for node in self._path(self.key(cmd)):
+            node.commands.append(cmd)
+
+    def insert(self, cmd, elements):
+        """Add command before other indexed commands
+
+        The command is placed next to its nearest neighbour on each node (see
+        CMakeElementList.insert_ordered), which is searched among the commands
+        of the parent node, so the cost does not grow with the number of
+        indexed commands.
+
+        Args:
+            cmd (CMakeCommand): Command
+            elements (CMakeElementList): Elements of the file or indexed commands of the same name, including cmd
+
+        """
+
+        for node in self._path(self.key(cmd)):
+            node.commands.insert_ordered(cmd, elements)
+            elements = node.commands
+
+    def remove(self, cmd):
+        """Remove command
+
+        Args:
+            cmd (CMakeCommand): Indexed command
+
+        """
+
+        key = self.key(cmd)
+        node = self.root
+        for item in key:
+            child = node.children.get(item)
+            if child == None:
+                return
+            child.commands.remove(cmd)
+            if len(child.commands) == 0:
+                del node.children[item]
+                return
+            node = child
+
+    def replace(self, cmd, new_cmd):
+        """Replace command by a command with the same key
+
+        Args:
+            cmd (CMakeCommand): Indexed command
+            new_cmd (CMakeCommand): New command
+
+        """
+
+        node = self.root
+        for item in self.key(cmd):
+            node = node.children[item]
+            node.commands.replace(cmd, new_cmd)
+
+    def find(self, signature):
+        """Find commands with a specific signature
+
+        Args:
+            signature (list): Command signature, e.g. [ 'set', 'name' ]
+
+        Returns:
+            list: List of commands corresponding to the given signature (CMakeCommand)
+
+        """
+
+        return self.find_batch([ signature ])[0]
+
+    def find_batch(self, signatures):
+        """Find commands for several signatures in one walk over the trie
+
+        The nodes along each key are remembered, so signatures that share a
+        prefix (e.g., the same command name) only walk it once.
+
+        Args:
+            signatures (list): List of command signatures, e.g. [ [ 'set', 'A' ], [ 'set', 'B' ] ]
+
+        Returns:
+            list: List of commands (list of CMakeCommand) for each signature
+
+        """
+
+        nodes = { (): self.root } # Nodes by path from the root
+        results = []
+        for signature in signatures:
+            # Walk along the key, starting at the longest path that has been walked before
+            key = tuple(itertools.chain([ signature[0].casefold() ], signature[1:self.depth]))
+            length = len(key)
+            while not key[:length] in nodes:
+                length -= 1
+            node = nodes[key[:length]]
+            while node != None and length < len(key):
+                node = node.children.get(key[length])
+                length += 1
+                nodes[key[:length]] = node
+            if node == None:
+                results.append([])
+                continue
+
+            # Compare arguments that are not part of the key
+            if len(signature) > self.depth:
+                args = tuple(signature[1:])
+                results.append([ cmd for cmd in node.commands if cmd.signature()[1:len(signature)] == args ])
+            else:
+                results.append(list(node.commands))
+        return results
+
+    def _path(self, key):
+        """Get nodes along a key, create them if necessary
+
+        Args:
+            key (tuple): Key of a command
+
+        Returns:
+            list: Nodes for each item of the key (_Node)
+
+        """
+
+        nodes = []
+        node = self.root
+        for item in key:
+            child = node.children.get(item)
+            if child == None:
+                child = _Node()
+                node.children[item] = child
+            nodes.append(child)
+            node = child
+        return nodes
@@ -0,0 +1,172 @@
+import bisect
+
+from array import array
+
+from .cmake import TokenType
+
+
+def _byte_length(text):
+    """Get length of a string encoded as UTF-8
+
+    Args:
+        text (string): String
+
+    Returns:
+        int: Number of bytes
+
+    """
+
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-8'))
+
+
+class CMakeSourceMap:
+    """Positions of the elements and lines of a cmake file
+
+    Offsets are counted in bytes of the file encoded as UTF-8, lines and
+    columns start at 1. The tables are computed once, so that all lookups
+    are binary searches.
+
+    If own is set, elements that are found by position are passed through it
+    before they are returned (see CMakeElementList).
+    """
+
+    __slots__ = ('elements', 'positions', 'element_starts', 'line_starts', 'own')
+
+    def __init__(self, elements, own = None):
+        """Constructor
+
+        Args:
+            elements (iterable): Elements of the cmake file (CMakeElement)
+            own (function): Function that is applied to elements that are returned, or None
+
+        """
+
+        self.elements = list(elements)
+        self.own = own
+        self.positions = {}                   # Index of each element
+        self.element_starts = array('Q')      # Offset of each element, and of the end of the file
+        self.line_starts = array('Q', [ 0 ])  # Offset of each line
+
+        # Measure tokens
+        offset = 0
+        line_starts = self.line_starts
+        for (index, element) in enumerate(self.elements):
+            self.positions[element] = index
+            self.element_starts.append(offset)
+
+            for (token_type, token) in element.tokens:
+                if token_type == TokenType.EOL:
+                    offset += 1
+                    line_starts.append(offset)
+                elif token_type in [ TokenType.STRING, TokenType.COMMENT ] and '\n' in token:
+                    # Multi-line strings and bracket comments
+                    lines = token.split('\n')
+                    for line in lines[:-1]:
+                        offset += _byte_length(line) + 1
+                        line_starts.append(offset)
+                    offset += _byte_length(lines[-1])
+                else:
+                    offset += _byte_length(token)
+
+        self.element_starts.append(offset)
+
+    @property
+    def size(self):
+        """Size of the file in bytes
+
+        Returns:
+            int: Number of bytes
+
+        """
+        return self.element_starts[-1]
+
+    @property
+    def line_count(self):
+        """Number of lines of the file (including an empty last line)
+
+        Returns:
+            int: Number of lines
+
+        """
+        return len(self.line_starts)
+
+    def span(self, element):
+        """Get span of an element
+
+        Args:
+            element (CMakeElement): Element of the file
+
+        Returns:
+            (int, int): Offset of the first byte and after the last byte of the element, or None
+
+        """
+
+        index = self.positions.get(element)
+        if index == None:
+            return None
+        return (self.element_starts[index], self.element_starts[index + 1])
+
+    def element_at(self, offset):
+        """Get element that contains an offset
+
+        Args:
+            offset (int): Offset in the file
+
+        Returns:
+            CMakeElement: Element that contains the offset, or None
+
+        """
+
+        index = bisect.bisect_right(self.element_starts, offset) - 1
+        if index < 0 or index >= len(self.elements):
+            return None
+        if self.own != None:
+            return self.own(self.elements[index])
+        return self.elements[index]
+
+    def element_at_line(self, line):
+        """Get element that contains the start of a line
+
+        Args:
+            line (int): Line number
+
+        Returns:
+            CMakeElement: Element that contains the line, or None
+
+        """
+
+        offset = self.line_offset(line)
+        if offset == None:
+            return None
+        return self.element_at(offset)
+
+    def line_offset(self, line):
+        """Get offset of the start of a line
+
+        Args:
+            line (int): Line number
+
+        Returns:
+            int: Offset of the first byte of the line, or None
+
+        """
+
+        if line < 1 or line > len(self.line_starts):
+            return None
+        return self.line_starts[line - 1]
+
+    def line_column(self, offset):
+        """Get line and column of an offset
+
+        Args:
+            offset (int): Offset in the file
+
+        Returns:
+            (int, int): Line and column (in bytes) of the offset
+
+        """
+
+        line = bisect.bisect_right(self.line_starts, offset)
+        return (line, offset - self.line_starts[line - 1] + 1)
@@ -0,0 +1,325 @@
+import sys
+
+from array import array
+
+from .cmake import TokenType
+
+
+# Token types indexed by their value
+_TOKEN_TYPES = [ None ] * (max(t.value for t in TokenType) + 1)
+for _t in TokenType:
+    _TOKEN_TYPES[_t.value] = _t
+
+
+class CMakeTokens:
+    """Compact list of tokens
+
+    Token types are stored as small integers in an array and token values
+    as interned strings, instead of one [TokenType, string] list per token.
+    The class behaves like a list of (TokenType, string) tuples.
+    """
+
+    __slots__ = ('types', 'values')
+
+    def __init__(self, tokens = None):
+        """Constructor
+
+        Args:
+            tokens (iterable): Tokens (TokenType, string) to add
+
+        """
+
+        self.types = array('B')
+        self.values = []
+
+        if tokens:
+            self.extend(tokens)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        types = _TOKEN_TYPES
+        for (token_type, value) in zip(self.types, self.values):
+            yield (types[token_type], value)
+
+    def __getitem__(self, index):
+        return (_TOKEN_TYPES[self.types[index]], self.values[index])
+
+    def __setitem__(self, index, token):
+        (token_type, value) = token
+        self.types[index] = token_type.value
+        self.values[index] = sys.intern(value)
+
+    def append(self, token):
+        """Add token
+
+        Args:
+            token ((TokenType, string)): Token to add
+
+        """
+
+        (token_type, value) = token
+        self.types.append(token_type.value)
+        self.values.append(sys.intern(value))
+
+    def extend(self, tokens):
+        """Add tokens
+
+        Args:
+            tokens (iterable): Tokens (TokenType, string) to add
+
+        """
+
+        if isinstance(tokens, CMakeTokens):
+            self.types.extend(tokens.types)
+            self.values.extend(tokens.values)
+        else:
+            for token in tokens:
+                self.append(token)
+
+    def token_types(self):
+        """Get types of all tokens
+
+        Returns:
+            list: List of token types (TokenType)
+
+        """
+        types = _TOKEN_TYPES
+        return [ types[token_type] for token_type in self.types ]
+
+
+class CMakeTokenBuffer:
+    """Tokens stored as spans of a source buffer
+
+    Each token is a (type, start, end) span into a buffer of bytes, e.g., a
+    memory-mapped file. Token values are only decoded when they are read.
+    """
+
+    __slots__ = ('buffer', 'encoding', 'types', 'starts', 'ends', 'values', 'modified')
+
+    def __init__(self, buffer, encoding = 'utf-8'):
+        """Constructor
+
+        Args:
+            buffer (bytes-like): Source buffer
+            encoding (string): Encoding of the source buffer
+
+        """
+
+        self.buffer = buffer
+        self.encoding = encoding
+        self.types = array('B')
+        self.starts = array('Q')
+        self.ends = array('Q')
+        self.values = {} # Decoded or modified values by token index
+        self.modified = set() # Indices of modified tokens
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, token_type, start, end):
+        """Add token
+
+        Args:
+            token_type (TokenType): Type of token
+            start (int): Offset of the first byte of the token
+            end (int): Offset after the last byte of the token
+
+        """
+
+        self.types.append(token_type.value)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def token_type(self, index):
+        """Get type of token
+
+        Args:
+            index (int): Index of token
+
+        Returns:
+            TokenType: Type of token
+
+        """
+        return _TOKEN_TYPES[self.types[index]]
+
+    def value(self, index, cache = True):
+        """Get value of token
+
+        Args:
+            index (int): Index of token
+            cache (Boolean): True to keep the decoded value
+
+        Returns:
+            string: Value of the token
+
+        """
+
+        value = self.values.get(index)
+        if value == None:
+            value = self.buffer[self.starts[index]:self.ends[index]].decode(self.encoding)
+            if cache:
+                self.values[index] = value
+        return value
+
+    def set_value(self, index, value):
+        """Set value of token
+
+        Args:
+            index (int): Index of token
+            value (string): New value of the token
+
+        """
+        self.values[index] = value
+        self.modified.add(index)
+
+    def detach(self):
+        """Decode all tokens and release the source buffer
+
+        Needs to be called before the source of the buffer is modified.
+        """
+
+        if self.buffer != None:
+            for index in range(len(self.types)):
+                self.value(index)
+            self.buffer = None
+
+    def range(self, begin, end):
+        """Get view on a range of tokens
+
+        Args:
+            begin (int): Index of the first token
+            end (int): Index after the last token
+
+        Returns:
+            CMakeTokenRange: Tokens in the given range
+
+        """
+        return CMakeTokenRange(self, begin, end)
+
+    def source(self, begin, end):
+        """Get source text of a range of tokens
+
+        Args:
+            begin (int): Index of the first token
+            end (int): Index after the last token
+
+        Returns:
+            string: Decoded slice of the source buffer, or None if the buffer has been released or a token has been modified
+
+        """
+
+        if self.buffer == None:
+            return None
+        if begin >= end:
+            return ''
+        if self.modified and any(index in self.modified for index in range(begin, end)):
+            return None
+        return self.buffer[self.starts[begin]:self.ends[end - 1]].decode(self.encoding)
+
+
+class CMakeTokenRange:
+    """View on a range of tokens of a CMakeTokenBuffer
+
+    The class behaves like a list of (TokenType, string) tuples.
+    """
+
+    __slots__ = ('tokens', 'begin', 'end')
+
+    def __init__(self, tokens, begin, end):
+        """Constructor
+
+        Args:
+            tokens (CMakeTokenBuffer): Token buffer
+            begin (int): Index of the first token
+            end (int): Index after the last token
+
+        """
+
+        self.tokens = tokens
+        self.begin = begin
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.begin
+
+    def __iter__(self):
+        tokens = self.tokens
+        for index in range(self.begin, self.end):
+            yield (tokens.token_type(index), tokens.value(index, cache = False))
+
+    def __getitem__(self, index):
+        index = self.index(index)
+        return (self.tokens.token_type(index), self.tokens.value(index))
+
+    def __setitem__(self, index, token):
+        index = self.index(index)
+        (token_type, value) = token
+        self.tokens.types[index] = token_type.value
+        self.tokens.set_value(index, value)
+
+    def index(self, index):
+        """Get index of a token in the token buffer
+
+        Args:
+            index (int): Index of the token within the range
+
+        Returns:
+            int: Index of the token in the token buffer
+
+        """
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('token index out of range')
+        return self.begin + index
+
+    def extend(self, tokens):
+        """Add tokens that directly follow this range
+
+        Args:
+            tokens (CMakeTokenRange): Tokens of the same buffer, starting at the end of this range
+
+        """
+
+        if not isinstance(tokens, CMakeTokenRange) or tokens.tokens is not self.tokens or tokens.begin != self.end:
+            raise ValueError('token ranges are not contiguous')
+        self.end = tokens.end
+
+    def source(self):
+        """Get source text of the tokens
+
+        Returns:
+            string: Decoded slice of the source buffer, or None if it is not available
+
+        """
+        return self.tokens.source(self.begin, self.end)
+
+    def token_types(self):
+        """Get types of all tokens
+
+        Returns:
+            list: List of token types (TokenType)
+
+        """
+        types = _TOKEN_TYPES
+        return [ types[token_type] for token_type in self.tokens.types[self.begin:self.end] ]
+
+
+def token_types(tokens):
+    """Get types of tokens without reading their values
+
+    Args:
+        tokens (list): List of tokens (list, CMakeTokens or CMakeTokenRange)
+
+    Returns:
+        list: List of token types (TokenType)
+
+    """
+
+    if isinstance(tokens, list):
+        return [ token[0] for token in tokens ]
+    else:
+        return tokens.token_types()
@@ -0,0 +1,218 @@
+import re
+
+from .cmake_element_list import CMakeElementList
+
+
+# Regular expression that matches variable references, e.g. ${NAME} (the innermost name of nested references)
+_REFERENCE_REGEX = re.compile(r'\$\{([A-Za-z0-9_./+-]+)\}')
+
+
+def defined_variables(cmd):
+    """Get variables defined by a command
+
+    Variables are defined by set(NAME ...), option(NAME ...) and list(APPEND NAME ...).
+
+    Args:
+        cmd (CMakeCommand): Command
+
+    Returns:
+        tuple: Names of the defined variables
+
+    """
+
+    name = cmd.name.casefold()
+    if name == 'set' or name == 'option':
+        variable = cmd.get_arg_value(0)
+    elif name == 'list' and cmd.get_arg_value(0) == 'APPEND':
+        variable = cmd.get_arg_value(1)
+    else:
+        return ()
+
+    if variable == None:
+        return ()
+    return (variable, )
+
+
+def used_variables(cmd):
+    """Get variables referenced by the arguments of a command
+
+    Args:
+        cmd (CMakeCommand): Command
+
+    Returns:
+        tuple: Names of the referenced variables, in order of their first reference
+
+    """
+
+    names = {}
+    for (_, value) in cmd.args:
+        if '${' in value:
+            for name in _REFERENCE_REGEX.findall(value):
+                names[name] = True
+    return tuple(names)
+
+
+class CMakeVariableIndex:
+    """Index of the variables that are defined and used by commands
+
+    For each variable name, the index holds the commands that define the
+    variable and the commands that reference it with ${NAME}, in file order
+    (CMakeElementList).
+    """
+
+    __slots__ = ('definitions', 'usages', 'entries')
+
+    def __init__(self, commands):
+        """Constructor
+
+        Args:
+            commands (iterable): Commands to index, in file order (CMakeCommand)
+
+        """
+
+        self.definitions = {} # Defining commands by variable name
+        self.usages = {}      # Referencing commands by variable name
+        self.entries = {}     # Names defined and used by each command
+
+        for cmd in commands:
+            self.add(cmd)
+
+    def add(self, cmd, elements = None):
+        """Add command
+
+        Args:
+            cmd (CMakeCommand): Command
+            elements (CMakeElementList): Elements of the file, including cmd, or None if cmd is the last command
+
+        """
+
+        (defined, used) = (defined_variables(cmd), used_variables(cmd))
+        self.entries[cmd] = (defined, used)
+        for name in defined:
+            _insert(self.definitions, name, cmd, elements)
+        for name in used:
+            _insert(self.usages, name, cmd, elements)
+
+    def remove(self, cmd):
+        """Remove command
+
+        Args:
+            cmd (CMakeCommand): Indexed command
+
+        """
+
+        (defined, used) = self.entries.pop(cmd)
+        for name in defined:
+            _remove(self.definitions, name, cmd)
+        for name in used:
+            _remove(self.usages, name, cmd)
+
+    def update(self, cmd, elements):
+        """Update command after its arguments have been modified
+
+        Args:
+            cmd (CMakeCommand): Indexed command
+            elements (CMakeElementList): Elements of the file, including cmd
+
+        """
+
+        (old_defined, old_used) = self.entries[cmd]
+        (defined, used) = (defined_variables(cmd), used_variables(cmd))
+        self.entries[cmd] = (defined, used)
+
+        # Move command to the lists of its new names
+        for name in old_defined:
+            if not name in defined:
+                _remove(self.definitions, name, cmd)
+        for name in defined:
+            if not name in old_defined:
+                _insert(self.definitions, name, cmd, elements)
+        for name in old_used:
+            if not name in used:
+                _remove(self.usages, name, cmd)
+        for name in used:
+            if not name in old_used:
+                _insert(self.usages, name, cmd, elements)
+
+    def replace(self, cmd, new_cmd):
+        """Replace command by a command with the same arguments
+
+        Args:
+            cmd (CMakeCommand): Indexed command
+            new_cmd (CMakeCommand): New command
+
+        """
+
+        (defined, used) = self.entries.pop(cmd)
+        self.entries[new_cmd] = (defined, used)
+        for name in defined:
+            self.definitions[name].replace(cmd, new_cmd)
+        for name in used:
+            self.usages[name].replace(cmd, new_cmd)
+
+    def find_definitions(self, name):
+        """Find commands that define a variable
+
+        Args:
+            name (string): Variable name
+
+        Returns:
+            list: List of commands (CMakeCommand)
+
+        """
+        return list(self.definitions.get(name, []))
+
+    def find_usages(self, name):
+        """Find references to a variable
+
+        Args:
+            name (string): Variable name
+
+        Returns:
+            list: List of commands and argument indices (CMakeCommand, int)
+
+        """
+
+        usages = []
+        for cmd in self.usages.get(name, []):
+            for (index, (_, value)) in enumerate(cmd.args):
+                if '${' in value and name in _REFERENCE_REGEX.findall(value):
+                    usages.append((cmd, index))
+        return usages
+
+
+def _insert(table, name, cmd, elements):
+    """Insert command into the list of a variable, in file order
+
+    Args:
+        table (dict): Commands by variable name (definitions or usages)
+        name (string): Variable name
+        cmd (CMakeCommand): Command
+        elements (CMakeElementList): Elements of the file, including cmd, or None to add cmd at the end
+
+    """
+
+    cmds = table.get(name)
+    if cmds is None:
+        cmds = CMakeElementList()
+        table[name] = cmds
+    if elements is None:
+        cmds.append(cmd)
+    else:
+        cmds.insert_ordered(cmd, elements)
+
+
+def _remove(table, name, cmd):
+    """Remove command from the list of a variable
+
+    Args:
+        table (dict): Commands by variable name
+        name (string): Variable name
+        cmd (CMakeCommand): Command
+
+    """
+
+    cmds = table[name]
+    cmds.remove(cmd)
+    if len(cmds) == 0:
+        del table[name]
@@ -7,6 +7,8 @@ from .cmake import ElementType, TokenType
 class CMakeWhitespace(CMakeElement):
     """A section of a cmake file that contains only whitespace"""
 
+    __slots__ = ()
+
     def __init__(self, tokens):
         """Constructor
 
@@ -17,14 +19,3 @@ class CMakeWhitespace(CMakeElement):
 
         super().__init__(ElementType.WHITESPACE)
         self.tokens = tokens
-
-    def write(self, stream):
-        """Print element to stream
-
-        Args:
-            stream (file object): Output stream to write to
-
-        """
-
-        for (_, token) in self.tokens:
-            stream.write(token)
@@ -1,49 +1,301 @@
+import contextlib
 import os
 import datetime
+import re
+import shutil
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from . import utils
+from .cmake import CMakeSaveError
+from .cmake_file import CMakeFile, file_stamp
+from .cmake_merge import merge_files
+from .cmake_parse_cache import CMakeParseCache
 from .cmake_parser import CMakeParser
+from .sub_project import SubProject
 from .user_query import UserQuery
 
 
+def _decode_string(values):
+    """Decode a (quoted) string value
+
+    Args:
+        values (list): Argument of the set command
+
+    Returns:
+        string: Value without quotes and escapes
+
+    """
+
+    value = values[0]
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        value = re.sub(r'\\(["\\])', r'\1', value[1:-1])
+    return value
+
+
+def _encode_string(value):
+    """Encode a string value
+
+    Args:
+        value (string): Value
+
+    Returns:
+        list: Quoted argument for the set command
+
+    """
+    return [ '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"')) ]
+
+
+def _decode_version(values):
+    """Decode a version number
+
+    Args:
+        values (list): Arguments of the set commands for the major, minor and patch version
+
+    Returns:
+        string: Version number (major.minor.patch)
+
+    """
+    return '.'.join([ _decode_string([ value ]) for value in values ])
+
+
+def _encode_version(value):
+    """Encode a version number
+
+    Args:
+        value (string): Version number (major.minor.patch)
+
+    Returns:
+        list: Quoted arguments for the major, minor and patch version, or None if the value is not a valid version
+
+    """
+
+    parts = value.split('.')
+    if len(parts) != 3 or '' in parts:
+        return None
+    return [ _encode_string(part)[0] for part in parts ]
+
+
+# Property of a project, stored in the main cmake file by set commands of the given variables
+ProjectProperty = namedtuple('ProjectProperty', [ 'variables', 'decode', 'encode', 'description' ])
+
+# Properties of a project by name
+PROPERTIES = {
+    'name':              ProjectProperty([ 'META_PROJECT_NAME' ], _decode_string, _encode_string, 'Project name'),
+    'description':       ProjectProperty([ 'META_PROJECT_DESCRIPTION' ], _decode_string, _encode_string, 'Project description'),
+    'author_name':       ProjectProperty([ 'META_AUTHOR_ORGANIZATION' ], _decode_string, _encode_string, 'Author name'),
+    'author_domain':     ProjectProperty([ 'META_AUTHOR_DOMAIN' ], _decode_string, _encode_string, 'URL to website'),
+    'author_maintainer': ProjectProperty([ 'META_AUTHOR_MAINTAINER' ], _decode_string, _encode_string, 'Email address of author'),
+    'version':           ProjectProperty([ 'META_VERSION_MAJOR', 'META_VERSION_MINOR', 'META_VERSION_PATCH' ],
+                                         _decode_version, _encode_version, 'Version number (major.minor.patch)')
+}
+
+# Number of sub-projects to load at once from which they are loaded on a thread pool
+PARALLEL_SUBPROJECTS = 16
+
+
 class Project:
     """Class that represents a cmake project on the disk"""
 
-    def __init__(self, path=None, query=None):
+    parse_cache = CMakeParseCache() # Parsed cmake files, shared by all projects
+
+    def __init__(self, path=None, query=None, scan=False):
         """Default Constructor
-        
+
+        The project files are loaded on first access (see main_cmake and
+        source_cmake), so creating a project does not parse anything.
+
         Args:
             path (string): Path to project directory
             query (UserQuery): Query interface to interact with the user
+            scan (Boolean): True to parse the project files right away
 
         """
 
         # Initialize data
         self.path = path or '.' # Path to project directory
         self.query = query or UserQuery() # Interface to query the user
-        self.main_cmake = None  # The main cmake file
-        self.source_cmake = None  # The cmake file in source/
-        self.project_name = '' # The name of the project
+        self._main_cmake = None   # The main cmake file (loaded on first access)
+        self._source_cmake = None # The cmake file in source/ (loaded on first access)
+        self._property_file = None # Main cmake file the property commands have been resolved for
+        self._property_cmds = None # Commands that store the properties, by name
+        self._project_name = None  # Project name and the stamp of the main cmake file it has been read from
+        self._subprojects = None  # Sub-projects by name (discovered on first access)
+        self._targets = {}        # Sub-projects by the name of their target
+        self.parser = CMakeParser(cache=self.parse_cache) # Parser for the cmake files of the project
 
         # Scan project directory
-        self.scan()
+        if scan:
+            self.scan()
+
+    @property
+    def main_cmake(self):
+        """The main cmake file
+
+        The file is loaded on first access, and loaded again when it has
+        changed on disk, unless it has been modified in memory and not saved yet.
+
+        Returns:
+            CMakeFile: Main cmake file, or None if it does not exist
+
+        """
+
+        self._main_cmake = self._load(self._main_cmake, 'CMakeLists.txt')
+        return self._main_cmake
+
+    @property
+    def source_cmake(self):
+        """The cmake file in source/
+
+        The file is loaded like main_cmake.
+
+        Returns:
+            CMakeFile: Cmake file in source/, or None if it does not exist
+
+        """
+
+        self._source_cmake = self._load(self._source_cmake, os.path.join('source', 'CMakeLists.txt'))
+        return self._source_cmake
+
+    @property
+    def project_name(self):
+        """The name of the project
+
+        Returns:
+            string: Project name, or '' if the project has no main cmake file or no name
+
+        """
+
+        # Get name from the loaded main cmake file (may contain unsaved changes)
+        if self._main_cmake != None:
+            return self.get_prop('name') or ''
+
+        # Read name from disk only if the main cmake file has changed
+        stamp = file_stamp(os.path.join(self.path, 'CMakeLists.txt'))
+        if stamp == None:
+            return ''
+        if self._project_name == None or self._project_name[0] != stamp:
+            self._project_name = (stamp, self.get_prop('name') or '')
+        return self._project_name[1]
+
+    @property
+    def subprojects(self):
+        """Sub-projects of the project
+
+        Sub-projects are the directories in source/ that contain a
+        CMakeLists.txt. They are discovered and loaded on first access, and
+        loaded again when their cmake file has changed on disk, unless it has
+        been modified in memory and not saved yet. If many sub-projects need
+        to be loaded, they are loaded on a thread pool.
+
+        Returns:
+            dict: Sub-projects by name (SubProject), sorted by name
+
+        """
+
+        self._update_subprojects()
+        return self._subprojects
+
+    def find_subproject(self, target):
+        """Find the sub-project that builds a target
+
+        Args:
+            target (string): Target name
+
+        Returns:
+            SubProject: Sub-project that builds the target, or None
+
+        """
+
+        self._update_subprojects()
+        return self._targets.get(target)
+
+    def _update_subprojects(self):
+        """Discover sub-projects and load new and changed ones (see subprojects)"""
+
+        # Find sub-project directories
+        source_dir = os.path.join(self.path, 'source')
+        names = []
+        try:
+            with os.scandir(source_dir) as it:
+                for entry in it:
+                    if entry.is_dir() and os.path.isfile(os.path.join(entry.path, 'CMakeLists.txt')):
+                        names.append(entry.name)
+        except OSError:
+            pass
+        names.sort()
+
+        # Load new and changed sub-projects
+        old = self._subprojects or {}
+        outdated = [ name for name in names if not name in old or
+                     (not old[name].cmake_file.dirty and old[name].cmake_file.is_outdated()) ]
+        if len(outdated) >= PARALLEL_SUBPROJECTS:
+            with ThreadPoolExecutor() as executor:
+                loaded = dict(zip(outdated, executor.map(self._load_subproject, outdated)))
+        else:
+            loaded = { name: self._load_subproject(name) for name in outdated }
+
+        # Update index
+        if self._subprojects == None or len(loaded) > 0 or list(old) != names:
+            subprojects = {}
+            for name in names:
+                subproject = loaded[name] if name in loaded else old[name]
+                if subproject != None:
+                    subprojects[name] = subproject
+            self._subprojects = subprojects
+            self._targets = { subproject.target: subproject for subproject in subprojects.values() if subproject.target != None }
+
+    def _load_subproject(self, name):
+        """Load sub-project
+
+        Args:
+            name (string): Name of sub-project
+
+        Returns:
+            SubProject: Sub-project, or None if its cmake file cannot be parsed
+
+        """
+
+        path = os.path.join(self.path, 'source', name)
+        cmake_file = self.parser.load(os.path.join(path, 'CMakeLists.txt'))
+        if cmake_file == None:
+            return None
+        return SubProject(name, path, cmake_file)
 
     def scan(self):
-        """Scan the project files"""
+        """Load the project files now instead of on first access
+
+        Files are parsed again if they have changed on disk, unless they have
+        been modified in memory and not saved yet. Unchanged files are taken
+        from the parse cache.
+        """
+
+        self._main_cmake = self._load(self._main_cmake, 'CMakeLists.txt')
+        self._source_cmake = self._load(self._source_cmake, os.path.join('source', 'CMakeLists.txt'))
+
+    def _load(self, cmake_file, filename):
+        """Load cmake file of the project, unless the loaded version is still current
+
+        Args:
+            cmake_file (CMakeFile): Loaded version of the file, or None
+            filename (string): Path of the file relative to the project directory
+
+        Returns:
+            CMakeFile: Loaded cmake file, or None if it does not exist
 
-        # Reset data
-        self.main_cmake = None
-        self.source_cmake = None
+        """
 
-        # Parse main cmake file
-        parser = CMakeParser()
-        self.main_cmake = parser.load(os.path.join(self.path, 'CMakeLists.txt'))
-        if self.main_cmake:
-            # Get project name
-            self.project_name = self.get_prop('name')
+        # Keep current files and unsaved modifications
+        if cmake_file != None and (cmake_file.dirty or not cmake_file.is_outdated()):
+            return cmake_file
 
-        # Parse cmake file in source
-        self.source_cmake = parser.load(os.path.join(self.path, 'source', 'CMakeLists.txt'))
+        # Parse file (unchanged files are taken from the parse cache)
+        cmake_file = self.parser.load(os.path.join(self.path, filename))
+        if cmake_file != None:
+            # Properties are looked up by name and first argument
+            cmake_file.index_signatures()
+        return cmake_file
 
     def is_valid(self):
         """Check if the project is a valid cmake_init project
@@ -56,100 +308,194 @@ class Project:
         # Check if main cmake file exists
         return self.main_cmake != None and self.source_cmake
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run modifications of the project cmake files in a transaction
+
+        Each modified cmake file is saved once at the end. If an exception
+        is raised, the modifications of all files are rolled back. If one of
+        the files cannot be saved, the modifications of all files are rolled
+        back, the files that have already been saved are written again, and
+        CMakeSaveError is raised. Restoring the saved files may fail as well
+        (e.g., if the disk is full), so the files are not updated atomically.
+
+        Example:
+            with project.transaction():
+                project.set_prop('name', 'test')
+                project.set_prop('version', '1.0.0')
+
+        """
+
+        cmake_files = [ f for f in [ self.main_cmake, self.source_cmake ] if f ]
+        for cmake_file in cmake_files:
+            cmake_file.begin()
+        try:
+            yield self
+        except BaseException:
+            for cmake_file in cmake_files:
+                cmake_file.rollback()
+            raise
+
+        # Save all files before ending the transactions, so that they can still be restored
+        saved = []
+        for cmake_file in cmake_files:
+            if not cmake_file.save_changes():
+                for other in cmake_files:
+                    other.rollback()
+                for other in saved:
+                    other.save()
+                raise CMakeSaveError('Could not save {}.'.format(cmake_file.path))
+            saved.append(cmake_file)
+        for cmake_file in cmake_files:
+            cmake_file.commit(save = False)
+
     def get_prop(self, prop):
         """Get property value
 
-        Available properties:
-          - name: Project name
-          - description: Project description
-          - author_name: Author name
-          - author_domain: URL to website
-          - author_maintainer: Email address of author
-          - version: Version number (major.minor.patch)
+        If the main cmake file has not been loaded yet, it is only read until
+        the property has been found (unless it can be taken from a persistent
+        parse cache, see get_props).
 
         Args:
-            prop (string): Property name
+            prop (string): Property name (see PROPERTIES)
 
         Returns:
-            string: Property value
+            string: Property value, or None if the property is unknown or not found
 
         """
+        return self.get_props([ prop ])[prop]
+
+    def get_props(self, props=None):
+        """Get several property values at once
+
+        The commands that store the properties are looked up in one pass over
+        the main cmake file. If the file has not been loaded yet, it is only
+        read until the last property has been found, unless the parser has a
+        persistent cache (CMakeDiskCache, e.g., cm --cache). Then the file is
+        loaded through the cache, so that later processes can reuse it.
+
+        Args:
+            props (list): Property names (default: all properties, see PROPERTIES)
 
-        # Helper function to get the parameter value of a cmake command
-        def get_command_arg_value(signature, index):
-            cmds = self.main_cmake.find_commands(signature)
-            if len(cmds) == 1:
-                return cmds[0].get_arg_value(index)
+        Returns:
+            dict: Property values by name (None for properties that are unknown or not found)
+
+        """
+
+        props = list(PROPERTIES) if props == None else props
+        known = [ prop for prop in props if prop in PROPERTIES ]
+
+        persistent = self.parser.cache != None and self.parser.cache.persistent
+        cmake_file = self.main_cmake if self._main_cmake != None or persistent else None
+        if cmake_file:
+            # Use the resolved commands of the loaded file
+            commands = self._property_commands(cmake_file)
+        else:
+            # Only read the main cmake file up to the last command
+            signatures = [ [ 'set', variable ] for prop in known for variable in PROPERTIES[prop].variables ]
+            cmds = self.parser.find_first(os.path.join(self.path, 'CMakeLists.txt'), signatures) or [ None ] * len(signatures)
+            commands = {}
+            for prop in known:
+                count = len(PROPERTIES[prop].variables)
+                (commands[prop], cmds) = (cmds[:count], cmds[count:])
+
+        # Decode values
+        values = {}
+        for prop in props:
+            cmds = commands.get(prop)
+            if cmds == None or None in cmds:
+                values[prop] = None
             else:
-                return None
-
-        # Determine property
-        if prop == 'name':
-            # Project name
-            return get_command_arg_value([ 'set', 'META_PROJECT_NAME' ], 1).strip('\"')
-        elif prop == 'description':
-            # Project description
-            return get_command_arg_value([ 'set', 'META_PROJECT_DESCRIPTION' ], 1).strip('\"')
-        elif prop == 'author_name':
-            # Author name
-            return get_command_arg_value([ 'set', 'META_AUTHOR_ORGANIZATION' ], 1).strip('\"')
-        elif prop == 'author_domain':
-            # Author domain
-            return get_command_arg_value([ 'set', 'META_AUTHOR_DOMAIN' ], 1).strip('\"')
-        elif prop == 'author_maintainer':
-            # Author maintainer
-            return get_command_arg_value([ 'set', 'META_AUTHOR_MAINTAINER' ], 1).strip('\"')
-        elif prop == 'version':
-            # Project Version
-            major = get_command_arg_value([ 'set', 'META_VERSION_MAJOR' ], 1).strip('\"')
-            minor = get_command_arg_value([ 'set', 'META_VERSION_MINOR' ], 1).strip('\"')
-            patch = get_command_arg_value([ 'set', 'META_VERSION_PATCH' ], 1).strip('\"')
-            return '{}.{}.{}'.format(major, minor, patch)
-
-        # Property not found
-        return None
+                values[prop] = PROPERTIES[prop].decode([ cmd.get_arg_value(1) for cmd in cmds ])
+        return values
 
     def set_prop(self, prop, value):
         """Set property value
 
+        The main cmake file is saved right away, unless a transaction is open.
+
         Args:
-            prop (string): Property name
+            prop (string): Property name (see PROPERTIES)
             value (string): Property value
 
+        Returns:
+            Boolean: True if the property has been set, else False
+
+        """
+        return self.set_props({ prop: value })
+
+    def set_props(self, values):
+        """Set several property values at once
+
+        The main cmake file is saved once, unless a transaction is open. If a
+        property is unknown, a value is invalid or a property is not found in
+        the main cmake file, nothing is changed.
+
+        Args:
+            values (dict): Property values by name (see PROPERTIES)
+
+        Returns:
+            Boolean: True if the properties have been set, else False
+
         """
 
-        # Helper function to set the parameter value of a cmake command
-        def set_command_arg_value(signature, index, value):
-            cmds = self.main_cmake.find_commands(signature)
-            if len(cmds) == 1:
-                cmds[0].set_arg_value(index, value)
-
-        # Determine property
-        if prop == 'name':
-            # Project name
-            set_command_arg_value([ 'set', 'META_PROJECT_NAME' ], 1, '"{}"'.format(value))
-        elif prop == 'description':
-            # Project name
-            set_command_arg_value([ 'set', 'META_PROJECT_DESCRIPTION' ], 1, '"{}"'.format(value))
-        elif prop == 'author_name':
-            # Author name
-            set_command_arg_value([ 'set', 'META_AUTHOR_ORGANIZATION' ], 1, '"{}"'.format(value))
-        elif prop == 'author_domain':
-            # Author name
-            set_command_arg_value([ 'set', 'META_AUTHOR_DOMAIN' ], 1, '"{}"'.format(value))
-        elif prop == 'author_maintainer':
-            # Author name
-            set_command_arg_value([ 'set', 'META_AUTHOR_MAINTAINER' ], 1, '"{}"'.format(value))
-        elif prop == 'version':
-            # Project Version
-            values = value.split('.')
-            if len(values) == 3:
-                set_command_arg_value([ 'set', 'META_VERSION_MAJOR' ], 1, '"{}"'.format(values[0]))
-                set_command_arg_value([ 'set', 'META_VERSION_MINOR' ], 1, '"{}"'.format(values[1]))
-                set_command_arg_value([ 'set', 'META_VERSION_PATCH' ], 1, '"{}"'.format(values[2]))
-
-        # Save cmake file
-        self.main_cmake.save()
+        # Check main cmake file
+        cmake_file = self.main_cmake
+        if cmake_file == None:
+            print('Could not find {}.'.format(os.path.join(self.path, 'CMakeLists.txt')))
+            return False
+
+        # Encode values
+        commands = self._property_commands(cmake_file)
+        changes = []
+        for (prop, value) in values.items():
+            if not prop in PROPERTIES:
+                print('Unknown property "{}".'.format(prop))
+                return False
+            args = PROPERTIES[prop].encode(value)
+            if args == None:
+                print('Invalid value for property "{}": "{}".'.format(prop, value))
+                return False
+            if None in commands[prop]:
+                print('Could not find property "{}" in {}.'.format(prop, cmake_file.path))
+                return False
+            changes.extend(zip(commands[prop], args))
+
+        # Change properties and save the main cmake file once
+        try:
+            with cmake_file.transaction():
+                for (cmd, arg) in changes:
+                    cmd.set_arg_value(1, arg)
+        except CMakeSaveError as error:
+            print(error)
+            return False
+        return True
+
+    def _property_commands(self, cmake_file):
+        """Get the commands that store the properties
+
+        The commands are resolved once for each loaded version of the main
+        cmake file, and again if one of them has been removed from it.
+
+        Args:
+            cmake_file (CMakeFile): Main cmake file
+
+        Returns:
+            dict: Commands by property name (list of CMakeCommand, None for each command that is not found)
+
+        """
+
+        if self._property_file is cmake_file and \
+           all(cmd == None or cmd.owner is cmake_file for cmds in self._property_cmds.values() for cmd in cmds):
+            return self._property_cmds
+
+        # Resolve commands (the first command of each variable, like find_first when the file is not loaded)
+        self._property_file = cmake_file
+        self._property_cmds = {}
+        for (prop, definition) in PROPERTIES.items():
+            found = cmake_file.find_commands_batch([ [ 'set', variable ] for variable in definition.variables ])
+            self._property_cmds[prop] = [ cmds[0] if len(cmds) > 0 else None for cmds in found ]
+        return self._property_cmds
 
     def initialize(self, name=None, description=None, author_name=None, author_domain=None,
                          author_maintainer=None, version=None, dry=True):
@@ -189,22 +535,33 @@ class Project:
             author_maintainer = self.query.ask('Maintainer email address', 'example@example.com')
         if version == None:
             version = self.query.ask('Version number', '1.0.0')
+            while PROPERTIES['version'].encode(version) == None:
+                print('Invalid version number "{}", please use major.minor.patch.'.format(version))
+                version = self.query.ask('Version number', '1.0.0')
+
+        # Check information before the project is created
+        values = {
+            'name': name,
+            'description': description,
+            'author_name': author_name,
+            'author_domain': author_domain,
+            'author_maintainer': author_maintainer,
+            'version': version
+        }
+        for (prop, value) in values.items():
+            if PROPERTIES[prop].encode(value) == None:
+                print('Invalid value for property "{}": "{}".'.format(prop, value))
+                return False
 
         # Copy project template
         if not utils.copy_template(os.path.join(utils.data_dir(), 'templates/core'), self.path, dry):
             print('Could not initialize project.')
             return False
 
-        # Rescan project
-        self.scan()
-
-        # Update project information
-        self.set_prop('name', name)
-        self.set_prop('description', description)
-        self.set_prop('author_name', author_name)
-        self.set_prop('author_domain', author_domain)
-        self.set_prop('author_maintainer', author_maintainer)
-        self.set_prop('version', version)
+        # Update project information (and write the main cmake file once)
+        if not self.set_props(values):
+            print('Could not initialize project.')
+            return False
 
         # Generate README.md
         readme_file = open(os.path.join(self.path, 'README.md'), 'w')
@@ -231,7 +588,7 @@ class Project:
 
         Args:
             name (string): Name of sub-project
-            dry (Boolean): True for dry-run (do not modify anything)
+            dry (Boolean): True for dry-run (do not modify anything, print the changes of the cmake files)
 
         """
 
@@ -278,20 +635,18 @@ class Project:
             ])
 
             # Replace values in cmake file
-            parser = CMakeParser()
-            main_cmake = parser.load(cmake_lists)
-            if main_cmake:
-                main_cmake.set_command_arg([ 'set', 'target' ], 1, name)
-                main_cmake.set_command_arg([ 'set', 'headers' ], 1, '${include_path}/' + name + '.h')
-                main_cmake.set_command_arg([ 'set', 'sources' ], 1, '${source_path}/' + name + '.cpp')
-                main_cmake.save()
-
-            # Add project to sources-cmake file
-            if self.source_cmake:
-                marker = self.source_cmake.find_commands([ 'set', 'IDE_FOLDER', '""'])
-                if len(marker) > 0:
-                    self.source_cmake.add_command([ 'add_subdirectory', name ], after=marker[0])
-                    self.source_cmake.save()
+            main_cmake = self.parser.load(cmake_lists)
+            def set_target(cmake_file):
+                cmake_file.set_command_arg([ 'set', 'target' ], 1, name)
+                cmake_file.set_command_arg([ 'set', 'headers' ], 1, '${include_path}/' + name + '.h')
+                cmake_file.set_command_arg([ 'set', 'sources' ], 1, '${source_path}/' + name + '.cpp')
+            if main_cmake and not self._modify(main_cmake, set_target, dry):
+                return False
+
+        # Add project to sources-cmake file
+        if self.source_cmake and not self._modify(self.source_cmake, lambda cmake_file:
+                _add_subdirectory(cmake_file, [ 'set', 'IDE_FOLDER', '""' ], name), dry):
+            return False
 
         # Done
         return True
@@ -301,7 +656,7 @@ class Project:
 
         Args:
             name (string): Name of sub-project
-            dry (Boolean): True for dry-run (do not modify anything)
+            dry (Boolean): True for dry-run (do not modify anything, print the changes of the cmake files)
 
         """
 
@@ -330,18 +685,15 @@ class Project:
             ])
 
             # Replace values in cmake file
-            parser = CMakeParser()
-            main_cmake = parser.load(cmake_lists)
-            if main_cmake:
-                main_cmake.set_command_arg([ 'set', 'target' ], 1, name)
-                main_cmake.save()
-
-            # Add project to sources-cmake file
-            if self.source_cmake:
-                marker = self.source_cmake.find_commands([ 'set', 'IDE_FOLDER', '"Executables"'])
-                if len(marker) > 0:
-                    self.source_cmake.add_command([ 'add_subdirectory', name ], after=marker[0])
-                    self.source_cmake.save()
+            main_cmake = self.parser.load(cmake_lists)
+            if main_cmake and not self._modify(main_cmake, lambda cmake_file:
+                    cmake_file.set_command_arg([ 'set', 'target' ], 1, name), dry):
+                return False
+
+        # Add project to sources-cmake file
+        if self.source_cmake and not self._modify(self.source_cmake, lambda cmake_file:
+                _add_subdirectory(cmake_file, [ 'set', 'IDE_FOLDER', '"Executables"' ], name), dry):
+            return False
 
         # Done
         return True
@@ -352,7 +704,7 @@ class Project:
 
         Args:
             name (string): Name of sub-project
-            dry (Boolean): True for dry-run (do not modify anything)
+            dry (Boolean): True for dry-run (do not modify anything, print the changes of the cmake files)
 
         """
 
@@ -368,14 +720,130 @@ class Project:
             print('Could not remove sub-project.')
             return False
 
-        # Adjust cmake files
-        if not dry:
-            # Remove project from sources-cmake file
-            if self.source_cmake:
-                marker = self.source_cmake.find_commands([ 'add_subdirectory', name ])
-                if len(marker) > 0:
-                    self.source_cmake.remove_command(marker[0])
-                    self.source_cmake.save()
+        # Remove project from sources-cmake file
+        if self.source_cmake and not self._modify(self.source_cmake, lambda cmake_file: _remove_subdirectory(cmake_file, name), dry):
+            return False
 
         # Done
         return True
+
+    def upgrade(self, base, dry=True):
+        """Update the cmake files of the project to the current core template
+
+        The changes between the version of the core template the project has
+        been generated from and the current one are merged into the cmake
+        files of the project, keeping all changes made in the project. Where
+        both have been changed differently, the project file is kept and a
+        conflict is reported.
+
+        Args:
+            base (string): Path to the version of the core template the project has been generated from
+            dry (Boolean): True for dry-run (do not modify anything, print the changes of the cmake files)
+
+        Returns:
+            Boolean: True if all files have been updated without conflicts, else False
+
+        """
+
+        # Check base template
+        if not os.path.isdir(base):
+            print('Could not find template "{}".'.format(base))
+            return False
+
+        # Merge cmake files of the template
+        template_dir = os.path.join(utils.data_dir(), 'templates', 'core')
+        result = True
+        for filename in utils.cmake_files(template_dir):
+            path = os.path.join(self.path, filename)
+            base_path = os.path.join(base, filename)
+            if not os.path.isfile(path):
+                # Skip files that have been removed from the project
+                if os.path.isfile(base_path):
+                    continue
+
+                # Add new files of the template
+                print('GENERATE {}'.format(path))
+                if not dry:
+                    utils.ensure_dir(os.path.dirname(path), dry)
+                    shutil.copy(os.path.join(template_dir, filename), path)
+                continue
+
+            base_cmake = self.parser.load(base_path) if os.path.isfile(base_path) else CMakeFile(base_path)
+            cmake_file = self.parser.load(path)
+            template_cmake = self.parser.load(os.path.join(template_dir, filename))
+            if base_cmake == None or cmake_file == None or template_cmake == None:
+                print('Could not parse {}'.format(path))
+                result = False
+                continue
+
+            conflicts = []
+            if not self._modify(cmake_file, lambda cmake_file:
+                    conflicts.extend(merge_files(base_cmake, cmake_file, template_cmake)), dry):
+                result = False
+            for conflict in conflicts:
+                print('CONFLICT {}:{}: {}'.format(path, conflict.line, conflict.message))
+                result = False
+
+        # Done
+        return result
+
+    def _modify(self, cmake_file, modify, dry):
+        """Modify cmake file, or show the modifications in a dry-run
+
+        Args:
+            cmake_file (CMakeFile): Cmake file of the project
+            modify (function): Function that modifies the given cmake file
+            dry (Boolean): True to modify a snapshot of the file and print the differences instead
+
+        Returns:
+            Boolean: True if the file has been modified and saved (or the differences have been printed), else False
+
+        """
+
+        if dry:
+            # Modify snapshot and show differences
+            snapshot = cmake_file.snapshot()
+            modify(snapshot)
+            lines = snapshot.diff(cmake_file)
+            if len(lines) > 0:
+                print('MODIFY {}'.format(cmake_file.path))
+                for line in lines:
+                    print(line, end='' if line.endswith('\n') else '\n')
+        else:
+            # Modify and save file
+            try:
+                with cmake_file.transaction():
+                    modify(cmake_file)
+            except CMakeSaveError as error:
+                print(error)
+                return False
+        return True
+
+
+def _add_subdirectory(cmake_file, marker, name):
+    """Add sub-project to cmake file
+
+    Args:
+        cmake_file (CMakeFile): Cmake file in source/
+        marker (list): Signature of the command after which to add the sub-project
+        name (string): Name of sub-project
+
+    """
+
+    cmds = cmake_file.find_commands(marker)
+    if len(cmds) > 0:
+        cmake_file.add_command([ 'add_subdirectory', name ], after=cmds[0])
+
+
+def _remove_subdirectory(cmake_file, name):
+    """Remove sub-project from cmake file
+
+    Args:
+        cmake_file (CMakeFile): Cmake file in source/
+        name (string): Name of sub-project
+
+    """
+
+    cmds = cmake_file.find_commands([ 'add_subdirectory', name ])
+    if len(cmds) > 0:
+        cmake_file.remove_command(cmds[0])
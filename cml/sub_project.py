@@ -0,0 +1,116 @@
+import os
+import re
+
+from .cmake import TokenType
+
+
+# Reference to a variable, e.g. ${target}
+_VARIABLE_REGEX = re.compile(r'\$\{([A-Za-z0-9_.+-]+)\}')
+
+# Arguments of add_library and add_executable that are not source files
+_TARGET_KEYWORDS = { 'STATIC', 'SHARED', 'MODULE', 'OBJECT', 'INTERFACE', 'EXCLUDE_FROM_ALL', 'WIN32', 'MACOSX_BUNDLE' }
+
+# Arguments of target_sources that are not source files
+_SCOPE_KEYWORDS = { 'PRIVATE', 'PUBLIC', 'INTERFACE' }
+
+# File extensions of header files
+_HEADER_EXTENSIONS = { '.h', '.hh', '.hpp', '.hxx', '.inl' }
+
+
+class SubProject:
+    """Class that represents a sub-project of a cmake project (a directory in source/ with a CMakeLists.txt)"""
+
+    def __init__(self, name, path, cmake_file):
+        """Constructor
+
+        The target of the sub-project is taken from the first add_library or
+        add_executable command of its cmake file, and its files from that
+        command and from target_sources. Variables that are set in the file
+        are expanded, and paths in the sub-project directory are made
+        relative to it. The information reflects the cmake file as it was
+        when the sub-project has been created.
+
+        Args:
+            name (string): Name of sub-project (name of its directory)
+            path (string): Path to sub-project directory
+            cmake_file (CMakeFile): The cmake file of the sub-project
+
+        """
+
+        self.name = name  # Name of sub-project
+        self.path = path  # Path to sub-project directory
+        self.cmake_file = cmake_file  # The cmake file of the sub-project
+        self.target = None  # Name of the target built by the sub-project, or None
+        self.type = None    # Type of the target ('library' or 'executable'), or None
+        self.headers = []   # Header files of the target
+        self.sources = []   # Other source files of the target
+
+        # Find target
+        variables = { 'CMAKE_CURRENT_SOURCE_DIR': '.', 'CMAKE_CURRENT_LIST_DIR': '.' }
+        files = []
+        for element in cmake_file.elements.iter_raw():
+            if not element.is_command():
+                continue
+            name = element.name.casefold()
+            args = element.args
+            if name == 'set' and len(args) > 0:
+                # Remember variable
+                names = _expand(args[0:1], variables)
+                values = _expand(args[1:], variables)
+                for keyword in [ 'CACHE', 'PARENT_SCOPE' ]:
+                    if keyword in values:
+                        values = values[:values.index(keyword)]
+                if len(names) > 0:
+                    variables[names[0]] = ';'.join(values)
+            elif name in [ 'add_library', 'add_executable' ] and self.target == None:
+                # Target (aliases and imported targets are not built here)
+                values = _expand(args, variables)
+                if len(values) == 0 or 'ALIAS' in values or 'IMPORTED' in values:
+                    continue
+                self.target = values[0]
+                self.type = 'library' if name == 'add_library' else 'executable'
+                files.extend(value for value in values[1:] if not value in _TARGET_KEYWORDS)
+            elif name == 'target_sources' and self.target != None:
+                # Additional files of the target
+                values = _expand(args, variables)
+                if len(values) > 0 and values[0] == self.target:
+                    files.extend(value for value in values[1:] if not value in _SCOPE_KEYWORDS)
+
+        # Sort files into headers and sources
+        for filename in files:
+            if not '${' in filename:
+                filename = os.path.normpath(filename)
+            if os.path.splitext(filename)[1].casefold() in _HEADER_EXTENSIONS:
+                self.headers.append(filename)
+            else:
+                self.sources.append(filename)
+
+    def __repr__(self):
+        return 'SubProject({!r}, target={!r}, type={!r})'.format(self.name, self.target, self.type)
+
+
+def _expand(args, variables):
+    """Expand command arguments into a list of values
+
+    References to known variables are replaced. Unquoted arguments are split
+    into list items, quoted arguments are kept as one value.
+
+    Args:
+        args (list): Argument tokens (TokenType, string)
+        variables (dict): Variable values by name
+
+    Returns:
+        list: Values of the arguments
+
+    """
+
+    def substitute(value):
+        return _VARIABLE_REGEX.sub(lambda m: variables.get(m.group(1), m.group(0)), value)
+
+    values = []
+    for (token_type, value) in args:
+        if token_type == TokenType.STRING and len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+            values.append(substitute(value[1:-1]))
+        else:
+            values.extend(item for item in substitute(value).split(';') if item)
+    return values
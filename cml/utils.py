@@ -147,6 +147,24 @@ def remove_subdirectory(path, dry=True):
     # Done
     return True
 
+def cmake_files(path):
+    """List cmake files in a directory and its subdirectories
+
+    Args:
+        path (string): Path to directory
+
+    Returns:
+        list: Paths of all CMakeLists.txt and *.cmake files, relative to path
+
+    """
+
+    files = []
+    for (root, _, names) in os.walk(path):
+        for name in names:
+            if name == 'CMakeLists.txt' or name.endswith('.cmake'):
+                files.append(os.path.relpath(os.path.join(root, name), path))
+    return sorted(files)
+
 def replace_in_file(path, variables):
     """Replace variables in a file
 
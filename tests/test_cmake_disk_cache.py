@@ -0,0 +1,116 @@
+from .context import cml
+
+import os
+import tempfile
+import time
+import unittest
+
+from cml import cmake_disk_cache
+
+
+def write(path, text):
+    """Write file with a modification time of one minute ago"""
+    with open(path, 'w') as f:
+        f.write(text)
+    mtime = time.time() - 60
+    os.utime(path, (mtime, mtime))
+
+
+class CMakeDiskCacheTest(unittest.TestCase):
+    """Test cases for cml.cmake_disk_cache."""
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt')) as f:
+                text = f.read()
+            directory = os.path.join(tmp, 'cache')
+
+            # Files are restored as they have been parsed
+            for (options, content) in [ ({}, text), ({ 'compact': True }, text), ({ 'mmap': True }, text),
+                                        ({ 'full_grammar': True }, text + 'set(A\n') ]:
+                write(path, content)
+                cache = cml.CMakeDiskCache(directory)
+                parsed = cml.CMakeParser(cache=cache, **options).load(path)
+                restored = cml.CMakeParser(cache=cml.CMakeDiskCache(directory), **options).load(path)
+                self.assertEqual((cache.hits, cache.misses), (0, 1))
+                self.assertEqual(
+                    [ (type(e), list(e.tokens)) for e in restored.elements ],
+                    [ (type(e), list(e.tokens)) for e in parsed.elements ])
+                self.assertEqual(restored.diagnostics, parsed.diagnostics)
+                self.assertEqual(restored.path, path)
+                self.assertFalse(restored.dirty)
+            self.assertEqual(len(cache), 4)
+
+            # Modified files are parsed again
+            write(path, text)
+            cache = cml.CMakeDiskCache(directory)
+            parser = cml.CMakeParser(cache=cache)
+            parser.load(path)
+            parser.load(path)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            write(path, 'set(A 1)\n')
+            self.assertEqual(len(parser.load(path).elements), 1)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+            # Entries of other versions or broken entries are ignored
+            cmake_disk_cache.CACHE_FORMAT += 1
+            try:
+                self.assertEqual(len(parser.load(path).elements), 1)
+            finally:
+                cmake_disk_cache.CACHE_FORMAT -= 1
+            self.assertEqual(cache.misses, 3)
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(b'broken')
+            self.assertEqual(len(parser.load(path).elements), 1)
+            self.assertEqual(cache.misses, 4)
+
+            cache.clear()
+            self.assertEqual((len(cache), cache.size, cache.hits), (0, 0, 0))
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [ os.path.join(tmp, name + '.cmake') for name in [ 'a', 'b', 'c' ] ]
+            for path in paths:
+                write(path, 'set(A 1)\n')
+
+            # The least recently used entries are removed
+            cache = cml.CMakeDiskCache(os.path.join(tmp, 'cache'))
+            parser = cml.CMakeParser(cache=cache)
+            parser.load(paths[0])
+            cache.max_size = cache.size * 2
+            parser.load(paths[1])
+            os.utime(os.path.join(cache.directory, os.listdir(cache.directory)[0]), (0, 0))
+            parser.load(paths[2])
+            self.assertEqual((len(cache), cache.evictions), (2, 1))
+
+
+    def test_statistics(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            write(path, 'set(A 1)\n')
+            directory = os.path.join(tmp, 'cache')
+
+            # Counters of all processes are added up
+            for _ in range(2):
+                cache = cml.CMakeDiskCache(directory)
+                cml.CMakeParser(cache=cache).load(path)
+                cache.save_statistics()
+                self.assertEqual((cache.hits, cache.misses), (0, 0))
+            self.assertEqual(cml.CMakeDiskCache(directory).statistics(), (1, 1, 0))
+            self.assertEqual(sorted(os.listdir(directory))[-1], cmake_disk_cache.STATISTICS_FILE)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+            # Project properties are read through the cache
+            cache = cml.CMakeDiskCache(directory)
+            project = cml.Project(tmp)
+            project.parser = cml.CMakeParser(cache=cache)
+            self.assertIsNone(project.get_prop('name'))
+            self.assertEqual(cache.hits, 1)
+
+            cache.clear()
+            self.assertEqual(cache.statistics(), (0, 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
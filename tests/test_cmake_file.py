@@ -1,8 +1,25 @@
 from .context import cml
 
+import io
+import os
+import shutil
+import tempfile
 import unittest
 
 
+def core_cmake_path():
+    """Get path to the main cmake file of the core template"""
+    return os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt')
+
+
+def render(cmake_file):
+    """Render cmake file into a string"""
+    stream = io.StringIO()
+    for element in cmake_file.elements:
+        element.write(stream)
+    return stream.getvalue()
+
+
 class CMakeTest(unittest.TestCase):
     """Test cases for cml.cmake_file."""
 
@@ -10,6 +27,457 @@ class CMakeTest(unittest.TestCase):
         # [TODO]
         self.assertTrue(True)
 
+    def test_compact(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+        compact_file = cml.CMakeParser(compact=True).load(core_cmake_path())
+
+        self.assertEqual(render(compact_file), render(cmake_file))
+        self.assertLess(len(compact_file.elements), len(cmake_file.elements))
+
+        for f in [ cmake_file, compact_file ]:
+            cmd = f.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+            self.assertEqual(tuple(cmd.get_arg(1)), (cml.TokenType.STRING, '"template"'))
+            cmd.set_arg_value(1, '"test"')
+            self.assertEqual(cmd.get_arg_value(1), '"test"')
+            f.add_command([ 'add_subdirectory', 'docs' ], after=cmd)
+
+        self.assertEqual(render(compact_file), render(cmake_file))
+
+    def test_source_map(self):
+        with open(core_cmake_path(), 'rb') as f:
+            data = f.read()
+
+        for parser in [ cml.CMakeParser(), cml.CMakeParser(compact=True), cml.CMakeParser(mmap=True) ]:
+            cmake_file = parser.load(core_cmake_path())
+            source_map = cmake_file.source_map
+            self.assertEqual(source_map.size, len(data))
+            self.assertEqual(source_map.line_count, data.count(b'\n') + 1)
+
+            # Spans cover the elements
+            for element in cmake_file.elements:
+                (start, end) = element.span
+                stream = io.StringIO()
+                element.write(stream)
+                self.assertEqual(data[start:end], stream.getvalue().encode('utf-8'))
+                self.assertIs(source_map.element_at(start), element)
+                self.assertIs(source_map.element_at(end - 1), element)
+
+            # Lines and columns
+            cmd = cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+            line = data[:cmd.span[0]].count(b'\n') + 1
+            self.assertEqual(source_map.line_column(cmd.span[0] + 3), (line, 4))
+            self.assertIs(source_map.element_at_line(line), cmd)
+
+            # Spans are updated after modifications
+            following = cmake_file.elements[cmake_file.elements.index(cmd) + 1]
+            start = following.span[0]
+            cmd.set_arg_value(1, '"test-project"')
+            self.assertEqual(following.span[0], start + len('"test-project"') - len('"template"'))
+
+        # Lines within multi-line tokens
+        cmake_file = cml.CMakeFile('CMakeLists.txt')
+        for element in cml.CMakeParser(full_grammar=True).parse_elements(
+                cml.CMakeParser().iter_tokens_listfile('set(A "\u00e4\nb")\nset(B)\n')):
+            cmake_file.add(element)
+        self.assertEqual(cmake_file.source_map.line_column(cmake_file.elements[1].span[0]), (3, 1))
+        self.assertIs(cmake_file.source_map.element_at_line(2), cmake_file.elements[0])
+        self.assertEqual(cmake_file.source_map.line_offset(2), 10)
+
+    def test_command_index(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+        cmds = cmake_file.find_commands([ 'set' ])
+        self.assertEqual(cmds, [ e for e in cmake_file.elements if e.is_command() and e.name == 'set' ])
+
+        # Names are case-insensitive
+        cmd = cmake_file.find_commands([ 'SET', 'META_PROJECT_NAME' ])[0]
+        cmake_file.add_command([ 'SET', 'META_PROJECT_NAME', '"other"' ], after=cmd)
+        cmake_file.add_command([ 'Set', 'META_PROJECT_NAME', '"first"' ], before=cmd)
+        self.assertEqual(
+            [ c.signature() for c in cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ]) ],
+            [ ('Set', 'META_PROJECT_NAME', '"first"'), ('set', 'META_PROJECT_NAME', '"template"'), ('SET', 'META_PROJECT_NAME', '"other"') ])
+        self.assertEqual(cmake_file.get_commands('set'), [ e for e in cmake_file.elements if e.is_command() and e.name.lower() == 'set' ])
+
+        cmake_file.remove_command(cmd)
+        self.assertEqual(len(cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])), 2)
+        self.assertEqual(cmake_file.find_commands([ 'missing' ]), [])
+
+    def test_add_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            for parser in [ cml.CMakeParser(), cml.CMakeParser(compact=True) ]:
+                with open(path, 'w') as f:
+                    f.write('project(test)\n')
+                cmake_file = parser.load(path)
+
+                # Arguments are separated by spaces
+                cmd = cmake_file.add_command([ 'set', 'A', '"b"', 'c' ])
+                self.assertEqual(cmd.text, 'set(A "b" c)\n')
+                cmake_file.add_command([ 'enable_testing' ])
+                self.assertTrue(cmake_file.save())
+                with open(path) as f:
+                    self.assertEqual(f.read(), 'project(test)\nset(A "b" c)\nenable_testing()\n')
+                self.assertEqual(parser.load(path).find_commands([ 'set' ])[0].signature(), ('set', 'A', '"b"', 'c'))
+
+    def test_signature_index(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+        indexed_file = cml.CMakeParser().load(core_cmake_path())
+        indexed_file.index_signatures()
+
+        def signatures(f, signature):
+            return [ cmd.signature() for cmd in f.find_commands(signature) ]
+
+        queries = [ [ 'set' ], [ 'SET', 'META_PROJECT_NAME' ], [ 'set', 'META_VERSION_MAJOR', '"2"' ], [ 'set', 'MISSING' ], [ 'include' ] ]
+        for f in [ cmake_file, indexed_file ]:
+            cmd = f.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+            f.add_command([ 'set', 'META_PROJECT_NAME', '"after"' ], after=cmd)
+            f.add_command([ 'set', 'META_PROJECT_NAME', '"before"' ], before=cmd)
+            f.remove_command(f.find_commands([ 'set', 'META_VERSION_MINOR' ])[0])
+        for query in queries:
+            self.assertEqual(signatures(indexed_file, query), signatures(cmake_file, query))
+
+        # Only arguments of the key invalidate the index
+        cmd = indexed_file.find_commands([ 'set', 'META_PROJECT_NAME', '"template"' ])[0]
+        cmd.set_arg_value(1, '"changed"')
+        self.assertIsNotNone(indexed_file._signatures)
+        self.assertEqual(indexed_file.find_commands([ 'set', 'META_PROJECT_NAME', '"changed"' ]), [ cmd ])
+        cmd.set_arg_value(0, 'OTHER_NAME')
+        self.assertIsNone(indexed_file._signatures)
+        self.assertEqual(indexed_file.find_commands_batch([ [ 'set', 'OTHER_NAME' ], [ 'set', 'META_PROJECT_NAME' ] ]),
+            [ [ cmd ], indexed_file.find_commands([ 'set', 'META_PROJECT_NAME' ]) ])
+        self.assertEqual(len(indexed_file.find_commands([ 'set', 'META_PROJECT_NAME' ])), 2)
+
+        # Inserting a command does not look at the other commands of the same name
+        marker = cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+        indexed_marker = indexed_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+        indexed_file.find_commands([ 'add_subdirectory' ])
+        keys = []
+        key = cml.CMakeSignatureIndex.key
+        cml.CMakeSignatureIndex.key = lambda index, cmd: keys.append(cmd) or key(index, cmd)
+        try:
+            for i in range(200):
+                cmake_file.add_command([ 'add_subdirectory', 'lib{}'.format(i) ], after=marker)
+                indexed_file.add_command([ 'add_subdirectory', 'lib{}'.format(i) ], after=indexed_marker)
+        finally:
+            cml.CMakeSignatureIndex.key = key
+        self.assertEqual(len(keys), 200)
+        for query in [ [ 'add_subdirectory' ], [ 'add_subdirectory', 'lib0' ], [ 'add_subdirectory', 'lib199' ] ]:
+            self.assertEqual(signatures(indexed_file, query), signatures(cmake_file, query))
+
+    def test_index_maintenance(self):
+        def add_and_remove(count):
+            # Indexed file with count sub-directories
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'CMakeLists.txt')
+                with open(path, 'w') as f:
+                    f.write('set(DIR src)\n')
+                    f.writelines('add_subdirectory(${{DIR}}/lib{})\n'.format(i) for i in range(count))
+                cmake_file = cml.CMakeParser().load(path)
+            cmake_file.index_signatures()
+            marker = cmake_file.find_commands([ 'add_subdirectory', '${{DIR}}/lib{}'.format(count // 2) ])[0]
+            cmake_file.find_usages('DIR')
+
+            # Count comparisons of commands while adding and removing commands in the middle of the file
+            comparisons = []
+            def eq(cmd, other):
+                comparisons.append(cmd)
+                return cmd is other
+            cml.CMakeCommand.__eq__ = eq
+            try:
+                cmds = [ cmake_file.add_command([ 'add_subdirectory', '${{DIR}}/new{}'.format(i) ], after=marker) for i in range(100) ]
+                for cmd in cmds:
+                    cmake_file.remove_command(cmd)
+            finally:
+                del cml.CMakeCommand.__eq__
+
+            self.assertEqual(len(cmake_file.find_commands([ 'add_subdirectory' ])), count)
+            self.assertEqual(len(cmake_file.find_usages('DIR')), count)
+            return len(comparisons)
+
+        # The work does not depend on the size of the file
+        self.assertEqual(add_and_remove(2000), add_and_remove(10))
+
+    def test_find_commands_batch(self):
+        signatures = [ [ 'set', 'META_PROJECT_NAME' ], [ 'SET' ], [], [ 'set', 'META_PROJECT_NAME', '"template"' ],
+                       [ 'option' ], [ 'set', 'UNKNOWN' ], [ 'unknown' ], [ 'set', 'META_PROJECT_NAME' ] ]
+        for depth in [ 0, 1, 2, 3 ]:
+            cmake_file = cml.CMakeParser().load(core_cmake_path())
+            cmake_file.index_signatures(depth)
+            expected = [ cmake_file.find_commands(signature) for signature in signatures ]
+            self.assertEqual(cmake_file.find_commands_batch(signatures), expected)
+
+            # Commands found for several signatures are copied only once in a snapshot
+            snapshot = cmake_file.snapshot()
+            found = snapshot.find_commands_batch(signatures)
+            self.assertIs(found[0][0], found[7][0])
+            self.assertIn(found[0][0], found[1])
+            self.assertNotIn(found[0][0], cmake_file.elements)
+            self.assertEqual([ [ cmd.signature() for cmd in cmds ] for cmds in found ],
+                             [ [ cmd.signature() for cmd in cmds ] for cmds in expected ])
+
+    def test_variable_index(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+
+        # Definitions and usages
+        major = cmake_file.find_commands([ 'set', 'META_VERSION_MAJOR' ])[0]
+        version = cmake_file.find_commands([ 'set', 'META_VERSION' ])[0]
+        self.assertEqual(cmake_file.find_definitions('META_VERSION_MAJOR'), [ major ])
+        self.assertEqual(cmake_file.find_usages('META_VERSION_MAJOR')[0], (version, 1))
+        self.assertEqual(cmake_file.find_definitions('CMAKE_MODULE_PATH'), cmake_file.find_commands([ 'list', 'APPEND', 'CMAKE_MODULE_PATH' ]))
+        self.assertEqual(cmake_file.find_definitions('OPTION_BUILD_TESTS'), cmake_file.find_commands([ 'option', 'OPTION_BUILD_TESTS' ]))
+
+        # The index follows modifications
+        version.set_arg_value(1, '"${META_VERSION_MINOR}"')
+        self.assertNotIn(version, [ cmd for (cmd, _) in cmake_file.find_usages('META_VERSION_MAJOR') ])
+        major.set_arg_value(0, 'META_MAJOR')
+        self.assertEqual(cmake_file.find_definitions('META_VERSION_MAJOR'), [])
+        self.assertEqual(cmake_file.find_definitions('META_MAJOR'), [ major ])
+
+        cmake_file.add_command([ 'set', 'META_MAJOR', '"3"' ], before=major)
+        cmake_file.add_command([ 'message', '${META_MAJOR}' ], after=major)
+        first = cmake_file.find_definitions('META_MAJOR')[0]
+        self.assertEqual(cmake_file.find_definitions('META_MAJOR'), [ first, major ])
+        self.assertEqual(first.get_arg_value(1), '"3"')
+        self.assertEqual(len(cmake_file.find_usages('META_MAJOR')), 1)
+
+        cmake_file.remove_command(first)
+        self.assertEqual(cmake_file.find_definitions('META_MAJOR'), [ major ])
+
+    def test_signature_cache(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+        cmd = cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+
+        self.assertIs(cmd.signature(), cmd.signature())
+        self.assertEqual(cmd.signature(1), ('set', 'META_PROJECT_NAME'))
+        self.assertTrue(cmd.matches([ 'SET', 'META_PROJECT_NAME', '"template"' ]))
+        self.assertFalse(cmd.matches([ 'set', 'META_PROJECT_NAME', '"template"', 'x' ]))
+
+        # Modified arguments invalidate the cache
+        cmd.set_arg_value(1, '"changed"')
+        self.assertEqual(cmd.get_arg_value(1), '"changed"')
+        self.assertEqual(cmd.signature(), ('set', 'META_PROJECT_NAME', '"changed"'))
+
+        # Signatures can be used to group commands
+        groups = {}
+        for element in cmake_file.elements:
+            if element.is_command():
+                groups.setdefault(element.signature(0), []).append(element)
+        self.assertEqual(groups[('set', )], cmake_file.find_commands([ 'set' ]))
+
+    def test_element_list(self):
+        cmake_file = cml.CMakeParser().load(core_cmake_path())
+        elements = list(cmake_file.elements)
+
+        # Positional access and iteration in document order
+        self.assertEqual(len(cmake_file.elements), len(elements))
+        self.assertIs(cmake_file.elements[-1], elements[-1])
+        self.assertIs(cmake_file.elements[3], elements[3])
+        self.assertEqual(list(reversed(cmake_file.elements)), elements[::-1])
+
+        # Insert many commands after the same marker
+        marker = cmake_file.find_commands([ 'add_subdirectory', 'source' ])[0]
+        for i in range(100):
+            cmake_file.add_command([ 'add_subdirectory', 'lib{}'.format(i) ], after=marker)
+        cmds = cmake_file.find_commands([ 'add_subdirectory' ])
+        self.assertEqual(cmds[1:101], [ cmake_file.find_commands([ 'add_subdirectory', 'lib{}'.format(i) ])[0] for i in reversed(range(100)) ])
+        self.assertIs(cmake_file.elements.next(marker), cmds[1])
+        self.assertIs(cmake_file.elements.prev(cmds[1]), marker)
+
+        for cmd in cmds[1:101]:
+            cmake_file.remove_command(cmd)
+        self.assertEqual(cmake_file.elements, elements)
+        with self.assertRaises(ValueError):
+            cmake_file.elements.remove(cmds[1])
+
+    def test_transaction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            shutil.copy(core_cmake_path(), path)
+            cmake_file = cml.CMakeParser().load(path)
+            original = render(cmake_file)
+
+            # Modifications are rolled back on errors
+            with self.assertRaises(RuntimeError):
+                with cmake_file.transaction():
+                    cmake_file.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"test"')
+                    marker = cmake_file.find_commands([ 'add_subdirectory', 'source' ])[0]
+                    cmake_file.add_command([ 'add_subdirectory', 'docs' ], after=marker)
+                    cmake_file.remove_command(marker)
+                    raise RuntimeError()
+            self.assertEqual(render(cmake_file), original)
+            self.assertEqual(len(cmake_file.find_commands([ 'add_subdirectory', 'source' ])), 1)
+            self.assertEqual(cmake_file.find_commands([ 'add_subdirectory', 'docs' ]), [])
+
+            # The file is only saved by the outermost transaction
+            with cmake_file.transaction():
+                cmake_file.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"test"')
+                with cmake_file.transaction():
+                    cmake_file.set_command_arg([ 'set', 'META_VERSION_MAJOR' ], 1, '"3"')
+                with open(path) as f:
+                    self.assertEqual(f.read(), original)
+
+                # Nested transactions are rolled back on their own
+                try:
+                    with cmake_file.transaction():
+                        cmake_file.add_command([ 'add_subdirectory', 'docs' ])
+                        raise RuntimeError()
+                except RuntimeError:
+                    pass
+
+            with open(path) as f:
+                self.assertEqual(f.read(), render(cmake_file))
+            self.assertEqual(cmake_file.find_commands([ 'set', 'META_VERSION_MAJOR' ])[0].get_arg_value(1), '"3"')
+            self.assertEqual(cmake_file.find_commands([ 'add_subdirectory', 'docs' ]), [])
+
+            # Modifications are rolled back if the file cannot be saved
+            saved = render(cmake_file)
+            cmake_file.save = lambda path = None, fsync = False: False
+            with self.assertRaises(cml.CMakeSaveError):
+                with cmake_file.transaction():
+                    cmake_file.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"other"')
+            self.assertEqual(render(cmake_file), saved)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            shutil.copy(core_cmake_path(), path)
+            os.chmod(path, 0o640)
+            cmake_file = cml.CMakeParser().load(path)
+            self.assertFalse(cmake_file.dirty)
+
+            # Unchanged files are not written
+            inode = os.stat(path).st_ino
+            self.assertTrue(cmake_file.save())
+            self.assertEqual(os.stat(path).st_ino, inode)
+
+            # Modified files replace the old file and keep its permissions
+            cmake_file.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"test"')
+            self.assertTrue(cmake_file.dirty)
+            self.assertTrue(cmake_file.save(fsync=True))
+            self.assertFalse(cmake_file.dirty)
+            self.assertNotEqual(os.stat(path).st_ino, inode)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+            with open(path) as f:
+                self.assertEqual(f.read(), render(cmake_file))
+            self.assertEqual(os.listdir(tmp), [ 'CMakeLists.txt' ])
+            self.assertFalse(cmake_file.is_outdated())
+
+            # Changes of the file on disk are detected
+            with open(path, 'a') as f:
+                f.write('\n')
+            self.assertTrue(cmake_file.is_outdated())
+            self.assertFalse(cml.CMakeParser().reparse(cmake_file).is_outdated())
+
+            # Saving to another path keeps the file modified
+            cmake_file.remove_command(cmake_file.find_commands([ 'add_subdirectory', 'source' ])[0])
+            self.assertTrue(cmake_file.save(os.path.join(tmp, 'copy.txt')))
+            self.assertTrue(cmake_file.dirty)
+
+            # New files are created with the permissions of the umask
+            umask = os.umask(0o027)
+            try:
+                self.assertTrue(cmake_file.save(os.path.join(tmp, 'new.txt')))
+            finally:
+                os.umask(umask)
+            self.assertEqual(os.stat(os.path.join(tmp, 'new.txt')).st_mode & 0o777, 0o640)
+            os.remove(os.path.join(tmp, 'new.txt'))
+
+            # Errors leave no temporary files behind
+            self.assertFalse(cmake_file.save(os.path.join(tmp, 'missing', 'CMakeLists.txt')))
+            self.assertEqual(sorted(os.listdir(tmp)), [ 'CMakeLists.txt', 'copy.txt' ])
+
+            # Symbolic links are kept, the file they point to is replaced
+            os.mkdir(os.path.join(tmp, 'project'))
+            link = os.path.join(tmp, 'project', 'CMakeLists.txt')
+            os.symlink(os.path.join('..', 'copy.txt'), link)
+            linked_file = cml.CMakeParser().load(link)
+            linked_file.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"linked"')
+            self.assertTrue(linked_file.save())
+            self.assertTrue(os.path.islink(link))
+            with open(os.path.join(tmp, 'copy.txt')) as f:
+                self.assertEqual(f.read(), render(linked_file))
+            self.assertEqual(sorted(os.listdir(tmp)), [ 'CMakeLists.txt', 'copy.txt', 'project' ])
+            self.assertFalse(linked_file.is_outdated())
+
+    def test_text_cache(self):
+        for parser in [ cml.CMakeParser(), cml.CMakeParser(compact=True), cml.CMakeParser(mmap=True) ]:
+            cmake_file = parser.load(core_cmake_path())
+            with open(core_cmake_path()) as f:
+                self.assertEqual(''.join([ e.text for e in cmake_file.elements ]), f.read())
+
+            # Text is cached until the tokens are modified
+            cmd = cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+            text = cmd.text
+            self.assertIs(cmd.text, text)
+            cmd.set_arg_value(1, '"test"')
+            self.assertEqual(cmd.text, text.replace('"template"', '"test"'))
+            self.assertEqual(render(cmake_file), ''.join([ e.text for e in cmake_file.elements ]))
+
+        # Direct modifications of the tokens are saved after element_changed
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            for parser in [ cml.CMakeParser(), cml.CMakeParser(compact=True), cml.CMakeParser(mmap=True) ]:
+                with open(path, 'w') as f:
+                    f.write('set(A "x")\n')
+                cmake_file = parser.load(path)
+                cmd = cmake_file.find_commands([ 'set', 'A' ])[0]
+                text = cmd.text
+                cmd.tokens[2] = [ cml.TokenType.DEFAULT, 'B' ]
+                cmake_file.element_changed(cmd)
+                self.assertEqual(cmd.text, text.replace('A', 'B'))
+                self.assertEqual(cmd.signature(), ('set', 'B', '"x"'))
+                self.assertTrue(cmake_file.save())
+                with open(path) as f:
+                    self.assertEqual(f.read(), 'set(B "x")\n')
+
+    def test_snapshot(self):
+        for parser in [ cml.CMakeParser(), cml.CMakeParser(mmap=True) ]:
+            cmake_file = parser.load(core_cmake_path())
+            cmake_file.index_signatures()
+            original = render(cmake_file)
+            snapshot = cmake_file.snapshot()
+
+            # Elements are shared until they are modified
+            marker = snapshot.find_commands([ 'add_subdirectory', 'source' ])[0]
+            self.assertNotIn(marker, cmake_file.elements)
+            snapshot.find_commands([ 'set', 'META_PROJECT_NAME' ])[0].set_arg_value(1, '"test"')
+            snapshot.add_command([ 'add_subdirectory', 'docs' ], after=marker)
+            snapshot.remove_command(marker)
+            shared = [ e for e in snapshot.elements.iter_raw() if e in cmake_file.elements ]
+            self.assertEqual(len(shared), len(cmake_file.elements) - 2)
+
+            # The file is unchanged
+            self.assertEqual(render(cmake_file), original)
+            self.assertEqual(cmake_file.diff(cmake_file.snapshot()), [])
+            self.assertEqual(cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"template"')
+            self.assertEqual(len(cmake_file.find_commands([ 'add_subdirectory', 'source' ])), 1)
+
+            diff = snapshot.diff(cmake_file)
+            self.assertEqual([ line for line in diff if line[0] in '+-' and line[:3] not in [ '+++', '---' ] ], [
+                '-set(META_PROJECT_NAME        "template")\n', '+set(META_PROJECT_NAME        "test")\n',
+                '-add_subdirectory(source)\n', '+add_subdirectory(docs)\n' ])
+
+            # Elements reached through the element list of the snapshot are copied as well
+            snapshot = cmake_file.snapshot()
+            cmd = [ e for e in snapshot.elements if e.is_command() and e.matches([ 'set', 'META_VERSION_MAJOR' ]) ][0]
+            self.assertNotIn(cmd, cmake_file.elements)
+            self.assertNotIn(snapshot.elements[0], cmake_file.elements)
+            snapshot.dirty = False
+            cmd.set_arg_value(1, '"9"')
+            self.assertTrue(snapshot.dirty)
+            self.assertEqual(render(cmake_file), original)
+            self.assertEqual(len(snapshot.find_commands([ 'set', 'META_VERSION_MAJOR', '"9"' ])), 1)
+
+            # Building the source map and splicing keep the other elements shared
+            snapshot = cmake_file.snapshot()
+            source_map = snapshot.source_map
+            self.assertEqual(source_map.size, cmake_file.source_map.size)
+            self.assertTrue(all(e in cmake_file.elements for e in snapshot.elements.iter_raw()))
+            self.assertNotIn(source_map.element_at(0), cmake_file.elements)
+            snapshot.splice(1, 2, [])
+            shared = [ e for e in snapshot.elements.iter_raw() if e in cmake_file.elements ]
+            self.assertEqual(len(shared), len(cmake_file.elements) - 2)
+            self.assertEqual(render(cmake_file), original)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,54 @@
+from .context import cml
+
+import unittest
+
+from cml.cmake_merge import align, merge
+
+
+def parse(text):
+    """Parse cmake code into a list of elements"""
+    parser = cml.CMakeParser()
+    return list(parser.parse_elements(parser.iter_tokens_string(text)))
+
+
+def render(elements):
+    """Render elements into a string"""
+    return ''.join([ element.text for element in elements ])
+
+
+class CMakeMergeTest(unittest.TestCase):
+    """Test cases for cml.cmake_merge."""
+
+    def test_align(self):
+        self.assertEqual(align(list('abcde'), list('abxde')), [ (0, 0), (1, 1), (3, 3), (4, 4) ])
+        self.assertEqual(len(align(list('axbyc'), list('cbzxa'))), 1)
+        self.assertEqual(align([], list('ab')), [])
+
+        # Repeated keys between unique ones
+        self.assertEqual(align(list('xaaybbz'), list('xaqybz')), [ (0, 0), (1, 1), (3, 3), (5, 4), (6, 5) ])
+
+    def test_merge(self):
+        base = parse('set(A 1)\nset(B 2)\n\nset(C 3)\nset(D 4)\n')
+        ours = parse('set(E 5)\nset(A 1)\nset(B "mine")\n\nset(C 3)\nset(D 4)\n')
+        theirs = parse('set(A 1)\nset(B 2)\n\nset(C   3)\nset(X 0)\n')
+
+        # Changes on both sides are merged, formatting of ours is kept
+        (elements, conflicts) = merge(base, ours, theirs)
+        self.assertEqual(render(elements), 'set(E 5)\nset(A 1)\nset(B "mine")\n\nset(C 3)\nset(X 0)\n')
+        self.assertEqual(conflicts, [])
+        self.assertIs(elements[4], ours[4])
+
+        # Different changes of the same part are conflicts
+        theirs = parse('set(A 1)\nset(B "theirs")\n\nset(C 3)\nset(D 4)\n')
+        (elements, conflicts) = merge(base, ours, theirs)
+        self.assertEqual(render(elements), render(ours))
+        self.assertEqual(conflicts, [ (2, 3) ])
+
+        # Equal changes are not
+        (elements, conflicts) = merge(base, ours, ours)
+        self.assertEqual(render(elements), render(ours))
+        self.assertEqual(conflicts, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
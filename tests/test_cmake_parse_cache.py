@@ -0,0 +1,93 @@
+from .context import cml
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+def age(path):
+    """Set modification time of a file to one minute ago"""
+    mtime = time.time() - 60
+    os.utime(path, (mtime, mtime))
+
+
+class CMakeParseCacheTest(unittest.TestCase):
+    """Test cases for cml.cmake_parse_cache."""
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            shutil.copy(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt'), path)
+            age(path)
+            cache = cml.CMakeParseCache()
+            parser = cml.CMakeParser(cache=cache)
+
+            # Unchanged files are parsed once
+            first = parser.load(path)
+            second = parser.load(path)
+            self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+            self.assertEqual(cache.size, os.path.getsize(path))
+            self.assertEqual(second.elements, first.elements)
+
+            # Files are cached for each set of parser options
+            self.assertLess(len(cml.CMakeParser(cache=cache, compact=True).load(path).elements), len(first.elements))
+            self.assertEqual(len(cache), 2)
+
+            # Modifications of a loaded file do not reach the cache
+            first.set_command_arg([ 'set', 'META_PROJECT_NAME' ], 1, '"test"')
+            self.assertTrue(first.dirty)
+            third = parser.load(path)
+            self.assertFalse(third.dirty)
+            self.assertEqual(third.find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"template"')
+            self.assertEqual(second.find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"template"')
+
+            # Also when the modified element has been reached by iterating over the file
+            cmd = [ e for e in second.elements if e.is_command() and e.matches([ 'set', 'META_PROJECT_NAME' ]) ][0]
+            cmd.set_arg_value(1, '"leak"')
+            self.assertTrue(second.dirty)
+            self.assertEqual(parser.load(path).find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"template"')
+            self.assertEqual(cache.misses, 2)
+
+            # Saved files are parsed again
+            self.assertTrue(first.save())
+            age(path)
+            self.assertEqual(parser.load(path).find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"test"')
+            self.assertEqual(cache.misses, 3)
+
+            # Files that have just been modified are not cached
+            os.utime(path)
+            parser.load(path)
+            parser.load(path)
+            self.assertEqual(cache.misses, 5)
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for name in [ 'a', 'b', 'c' ]:
+                paths.append(os.path.join(tmp, name + '.cmake'))
+                with open(paths[-1], 'w') as f:
+                    f.write('set({} 1)\n'.format(name.upper()))
+                age(paths[-1])
+
+            cache = cml.CMakeParseCache(max_size=20)
+            parser = cml.CMakeParser(cache=cache)
+            parser.load(paths[0])
+            parser.load(paths[1])
+            parser.load(paths[0])
+            parser.load(paths[2])
+
+            # The least recently used file is evicted
+            self.assertEqual((len(cache), cache.size, cache.evictions), (2, 18, 1))
+            parser.load(paths[0])
+            self.assertEqual(cache.hits, 2)
+            parser.load(paths[1])
+            self.assertEqual(cache.misses, 4)
+
+            cache.clear()
+            self.assertEqual((len(cache), cache.size, cache.hits, cache.misses), (0, 0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
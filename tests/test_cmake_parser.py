@@ -1,8 +1,22 @@
 from .context import cml
 
+import io
+import os
+import tempfile
+import time
 import unittest
 
 
+def template_files():
+    """Get all cmake files contained in the project templates"""
+    files = []
+    for root, _, names in os.walk(os.path.join(cml.utils.data_dir(), 'templates')):
+        for name in names:
+            if name == 'CMakeLists.txt' or name.endswith('.cmake'):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
 class CMakeTest(unittest.TestCase):
     """Test cases for cml.cmake_parser."""
 
@@ -10,6 +24,231 @@ class CMakeTest(unittest.TestCase):
         # [TODO]
         self.assertTrue(True)
 
+    def test_tokenizers_match(self):
+        fsm = cml.CMakeParser(cml.Tokenizer.FSM)
+        regex = cml.CMakeParser(cml.Tokenizer.REGEX)
+
+        text = 'set(a "b\\"c" "unterminated\n  d)# comment\n\t"x\\\n'
+        self.assertEqual(fsm.tokenize_fsm(io.StringIO(text)), regex.tokenize_string(text))
+
+        for path in template_files():
+            self.assertEqual(fsm.tokenize(path), regex.tokenize(path), path)
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for tokenizer in cml.Tokenizer:
+                parser = cml.CMakeParser(tokenizer)
+                for path in template_files():
+                    out = os.path.join(tmp, 'CMakeLists.txt')
+                    self.assertTrue(parser.load(path).save(out))
+                    with open(path) as a, open(out) as b:
+                        self.assertEqual(a.read(), b.read(), path)
+
+    def test_streaming(self):
+        parser = cml.CMakeParser()
+        path = os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt')
+
+        self.assertEqual(list(parser.iter_tokens(path)), parser.tokenize(path))
+
+        elements = list(parser.iter_elements(path))
+        self.assertEqual(len(elements), len(parser.load(path).elements))
+        self.assertTrue(elements[0].is_whitespace() or elements[0].is_comment())
+
+        with self.assertRaises(cml.CMakeSyntaxError):
+            list(parser.parse_elements(parser.iter_tokens_string('set(a (b))\n')))
+
+    def test_lazy_commands(self):
+        path = os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt')
+        cmake_file = cml.CMakeParser().load(path)
+        commands = [ e for e in cmake_file.elements if e.is_command() ]
+
+        # Only the command name is known after loading
+        self.assertTrue(all(cmd._arg_positions == None for cmd in commands))
+        cmake_file.find_commands([ 'add_subdirectory', 'source' ])
+        parsed = [ cmd for cmd in commands if cmd._arg_positions != None ]
+        self.assertEqual([ cmd.name for cmd in parsed ], [ 'add_subdirectory' ] * len(parsed))
+
+        # Arguments are the same as for eagerly parsed commands
+        for cmd in commands:
+            eager = cml.CMakeCommand(cmd.tokens)
+            eager.parse()
+            self.assertEqual(cmd.signature(), eager.signature())
+
+    def test_find_first(self):
+        parser = cml.CMakeParser()
+        path = os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt')
+
+        (name, version, missing) = parser.find_first(path, [
+            [ 'set', 'META_PROJECT_NAME' ], [ 'set', 'META_VERSION_MAJOR' ], [ 'set', 'MISSING' ] ])
+        self.assertEqual(name.get_arg_value(1), '"template"')
+        self.assertEqual(version.get_arg_value(1), '"2"')
+        self.assertIsNone(missing)
+
+        # Parsing stops once all signatures are found
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(path, 'w') as f:
+                f.write('set(A 1)\nset(B (2))\n')
+            self.assertIsNotNone(parser.find_first(path, [ [ 'set', 'A' ] ])[0])
+            self.assertIsNone(parser.find_first(path, [ [ 'set', 'C' ] ]))
+
+    def test_parallel(self):
+        parser = cml.CMakeParser()
+        parallel_parser = cml.CMakeParser(jobs=2, parallel_threshold=0)
+
+        # Split points are never inside of commands or strings
+        text = 'set(a\n"b)"\n)\n# (\nset(c)\n'
+        self.assertEqual(parallel_parser.split_points(text, 2), [ text.index('# (') ])
+        self.assertEqual(parallel_parser.split_points(text, 4), [ text.index('# ('), text.index('set(c)') ])
+
+        # Parallel loading gives the same result as sequential loading
+        for path in template_files():
+            cmake_file = parser.load(path)
+            parallel_file = parallel_parser.load(path)
+            self.assertEqual(
+                [ (type(e), e.tokens) for e in parallel_file.elements ],
+                [ (type(e), e.tokens) for e in cmake_file.elements ])
+
+    def test_mapped(self):
+        parser = cml.CMakeParser()
+        mapped_parser = cml.CMakeParser(mmap=True)
+
+        for path in template_files():
+            cmake_file = parser.load(path)
+            mapped_file = mapped_parser.load(path)
+            self.assertEqual(
+                [ e.signature() for e in mapped_file.elements if e.is_command() ],
+                [ e.signature() for e in cmake_file.elements if e.is_command() ])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(path, 'wb') as f:
+                f.write(b'project(test)\r\nset(NAME "\xc3\xa4")\r\n')
+
+            # Values are decoded when they are read
+            cmake_file = mapped_parser.load(path)
+            self.assertEqual(len(cmake_file.token_buffer.values), 0)
+            cmd = cmake_file.find_commands([ 'set', 'NAME' ])[0]
+            self.assertEqual(cmd.get_arg_value(1), '"\u00e4"')
+
+            # The mapped file can be overwritten
+            cmd.set_arg_value(1, '"b"')
+            self.assertTrue(cmake_file.save())
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'project(test)\r\nset(NAME "b")\r\n')
+
+    def test_full_grammar(self):
+        parser = cml.CMakeParser(full_grammar=True)
+
+        # Templates are parsed the same way as by the default parser
+        for path in template_files():
+            cmake_file = parser.load(path)
+            self.assertEqual(cmake_file.diagnostics, [], path)
+            self.assertEqual(
+                [ e.signature() for e in cmake_file.elements if e.is_command() ],
+                [ e.signature() for e in cml.CMakeParser().load(path).elements if e.is_command() ])
+
+        text = ('if((A) AND B)\n'
+                '  set(X [==[a\n]]b]==] "c\nd")\n'
+                '#[[ bracket\ncomment ]]\n'
+                'foo bar\n'
+                'set(Y 1)\n'
+                'set(Z "e\n')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(path, 'w') as f:
+                f.write(text)
+
+            # Errors are reported and the rest of the file is kept
+            cmake_file = parser.load(path)
+            self.assertEqual(cmake_file.diagnostics, [
+                cml.CMakeDiagnostic(7, 5, "Expected '(' after command name"),
+                cml.CMakeDiagnostic(9, 7, 'Unterminated quoted argument'),
+                cml.CMakeDiagnostic(10, 1, 'Unexpected end of file') ])
+            self.assertEqual(cmake_file.find_commands([ 'set', 'X' ])[0].signature(), ('set', 'X', '[==[a\n]]b]==]', '"c\nd"'))
+            self.assertEqual(len(cmake_file.find_commands([ 'set', 'Y' ])), 1)
+            self.assertEqual(len([ e for e in cmake_file.elements if e.is_invalid() ]), 2)
+
+            # Invalid lines are written back unchanged
+            self.assertTrue(cmake_file.save())
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+
+            # The default parser gives up on the first error
+            self.assertIsNone(cml.CMakeParser().load(path))
+            with self.assertRaises(cml.CMakeSyntaxError):
+                list(parser.iter_elements(path))
+
+    def test_reparse(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(template_files()[0]) as f:
+                text = f.read()
+            with open(path, 'w') as f:
+                f.write(text)
+
+            for parser in [ cml.CMakeParser(), cml.CMakeParser(compact=True), cml.CMakeParser(full_grammar=True) ]:
+                cmake_file = parser.load(path)
+                elements = list(cmake_file.elements)
+                cmd = cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0]
+                index = elements.index(cmd)
+
+                # Only the modified element is replaced
+                with open(path, 'w') as f:
+                    f.write(text.replace('"template"', '"changed"', 1))
+                self.assertIs(parser.reparse(cmake_file), cmake_file)
+                self.assertEqual(cmake_file.find_commands([ 'set', 'META_PROJECT_NAME' ])[0].get_arg_value(1), '"changed"')
+                self.assertEqual(len(cmake_file.elements), len(elements))
+                for (i, element) in enumerate(cmake_file.elements):
+                    if i == index:
+                        self.assertIsNot(element, cmd)
+                    else:
+                        self.assertIs(element, elements[i])
+
+                # Brackets that are not closed within the changed range
+                if parser.full_grammar:
+                    with open(path, 'w') as f:
+                        f.write('set(A 1)\nset(B 2)\n\nset(C 3)\n')
+                    parser.reparse(cmake_file)
+                    with open(path, 'w') as f:
+                        f.write('set(A 1)\nset(B\n2\n\nset(C 3)\n')
+                    self.assertIs(parser.reparse(cmake_file), cmake_file)
+                    self.assertEqual(
+                        [ (type(e), e.tokens) for e in cmake_file.elements ],
+                        [ (type(e), e.tokens) for e in parser.load(path).elements ])
+                    self.assertEqual(cmake_file.diagnostics, parser.load(path).diagnostics)
+
+                with open(path, 'w') as f:
+                    f.write(text)
+
+            # Syntax errors leave the file unchanged
+            parser = cml.CMakeParser()
+            cmake_file = parser.load(path)
+            elements = list(cmake_file.elements)
+            with open(path, 'w') as f:
+                f.write(text + 'set(A\n')
+            self.assertIsNone(parser.reparse(cmake_file))
+            self.assertEqual(cmake_file.elements, elements)
+
+            # Files loaded from a cache keep sharing the unmodified elements
+            parser = cml.CMakeParser(cache=cml.CMakeParseCache())
+            with open(path, 'w') as f:
+                f.write(text)
+            mtime = time.time() - 60
+            os.utime(path, (mtime, mtime))
+            cmake_file = parser.load(path)
+            elements = list(cmake_file.elements.iter_raw())
+            index = [ i for (i, e) in enumerate(elements) if 'META_PROJECT_NAME' in e.text ][0]
+            with open(path, 'w') as f:
+                f.write(text.replace('"template"', '"changed"', 1))
+            self.assertIs(parser.reparse(cmake_file), cmake_file)
+            for (i, element) in enumerate(cmake_file.elements.iter_raw()):
+                if i == index:
+                    self.assertIs(element.owner, cmake_file)
+                else:
+                    self.assertIs(element, elements[i])
+                    self.assertIsNot(element.owner, cmake_file)
+
 
 if __name__ == '__main__':
     unittest.main()
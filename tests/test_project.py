@@ -1,5 +1,10 @@
 from .context import cml
 
+import contextlib
+import io
+import os
+import shutil
+import tempfile
 import unittest
 
 
@@ -11,6 +16,294 @@ class ProjectTest(unittest.TestCase):
         self.assertEquals(project.path, cml.utils.data_dir())
         self.assertFalse(project.is_valid())
 
+    def test_get_prop_without_scan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt'), tmp)
+
+            project = cml.Project(tmp, scan=False)
+            self.assertEqual(project.get_prop('name'), 'template')
+            self.assertEqual(project.get_prop('version'), '2.0.0')
+            self.assertIsNone(project._main_cmake)
+
+            # The first definition of a property is used, whether the file is loaded or not
+            with open(os.path.join(tmp, 'CMakeLists.txt'), 'a') as f:
+                f.write('set(META_PROJECT_NAME "other")\n')
+            project = cml.Project(tmp)
+            self.assertEqual(project.get_prop('name'), 'template')
+            self.assertIsNotNone(project.main_cmake)
+            self.assertEqual(project.get_prop('name'), 'template')
+
+    def test_properties(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            shutil.copy(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt'), tmp)
+
+            # All properties are read at once
+            values = cml.Project(tmp).get_props()
+            self.assertEqual(list(values), list(cml.project.PROPERTIES))
+            self.assertEqual(values['version'], '2.0.0')
+            self.assertEqual(cml.Project(tmp).get_props([ 'name', 'unknown' ]), { 'name': 'template', 'unknown': None })
+
+            # Several properties are written at once, and commands are only resolved once
+            project = cml.Project(tmp)
+            with open(path) as f:
+                original = f.read()
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertFalse(project.set_props({ 'name': 'test', 'version': '1.2' }))
+                self.assertFalse(project.set_props({ 'name': 'test', 'unknown': '1' }))
+            with open(path) as f:
+                self.assertEqual(f.read(), original)
+            commands = project._property_commands(project.main_cmake)
+            self.assertTrue(project.set_props({ 'name': 'test', 'version': '1.2.3', 'description': 'A "quoted" \\ text' }))
+            self.assertIs(project._property_commands(project.main_cmake), commands)
+            self.assertEqual(len(project.main_cmake.find_commands([ 'set', 'META_PROJECT_DESCRIPTION', '"A \\"quoted\\" \\\\ text"' ])), 1)
+
+            # Values are decoded again
+            values = cml.Project(tmp).get_props()
+            self.assertEqual(values['name'], 'test')
+            self.assertEqual(values['version'], '1.2.3')
+            self.assertEqual(values['description'], 'A "quoted" \\ text')
+            self.assertEqual(project.get_prop('description'), 'A "quoted" \\ text')
+
+    def test_subprojects(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cml.Project(tmp).initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.2.3', dry=False)
+                project = cml.Project(tmp)
+                project.generate_library('mylib', dry=False)
+                project.generate_executable('myapp', dry=False)
+
+            # Sub-projects are indexed by target
+            project = cml.Project(tmp)
+            self.assertEqual(list(project.subprojects), [ 'myapp', 'mylib' ])
+            mylib = project.find_subproject('mylib')
+            self.assertEqual((mylib.name, mylib.type), ('mylib', 'library'))
+            self.assertEqual(mylib.headers, [ os.path.join('include', 'mylib', 'mylib.h') ])
+            self.assertEqual(mylib.sources, [ os.path.join('source', 'mylib.cpp') ])
+            self.assertEqual(project.find_subproject('myapp').type, 'executable')
+            self.assertIsNone(project.find_subproject('unknown'))
+
+            # Unchanged sub-projects are kept, changed ones are loaded again
+            myapp = project.subprojects['myapp']
+            with open(os.path.join(tmp, 'source', 'mylib', 'CMakeLists.txt'), 'a') as f:
+                f.write('target_sources(${target} PRIVATE extra.cpp)\n')
+            self.assertIs(project.subprojects['myapp'], myapp)
+            self.assertEqual(project.find_subproject('mylib').sources, [ os.path.join('source', 'mylib.cpp'), 'extra.cpp' ])
+
+            # Sub-projects can be loaded on a thread pool
+            parallel = cml.project.PARALLEL_SUBPROJECTS
+            cml.project.PARALLEL_SUBPROJECTS = 1
+            try:
+                self.assertEqual(list(cml.Project(tmp).subprojects), [ 'myapp', 'mylib' ])
+            finally:
+                cml.project.PARALLEL_SUBPROJECTS = parallel
+
+            # Removed sub-projects disappear
+            with contextlib.redirect_stdout(io.StringIO()):
+                project.remove_subproject('myapp', dry=False)
+            self.assertEqual(list(project.subprojects), [ 'mylib' ])
+            self.assertIsNone(project.find_subproject('myapp'))
+
+    def test_project_name(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            project = cml.Project(tmp, scan=False)
+            self.assertEqual(project.project_name, '')
+
+            # The name is read once for each version of the main cmake file
+            shutil.copy(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt'), tmp)
+            reads = []
+            find_first = project.parser.find_first
+            def counting_find_first(*args):
+                reads.append(args[0])
+                return find_first(*args)
+            project.parser.find_first = counting_find_first
+            self.assertEqual(project.project_name, 'template')
+            self.assertEqual(project.project_name, 'template')
+            self.assertEqual(reads, [ path ])
+            self.assertIsNone(project._main_cmake)
+
+            with open(path, 'a') as f:
+                f.write('set(OTHER 1)\n')
+            self.assertEqual(project.project_name, 'template')
+            self.assertEqual(len(reads), 2)
+
+            # A project without a name has an empty name
+            with open(path, 'w') as f:
+                f.write('project(test)\n')
+            self.assertEqual(project.project_name, '')
+            self.assertEqual(project.project_name.upper(), '')
+
+    def test_lazy_loading(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'CMakeLists.txt')
+            shutil.copy(os.path.join(cml.utils.data_dir(), 'templates', 'core', 'CMakeLists.txt'), tmp)
+
+            # Files are loaded on first access
+            project = cml.Project(tmp)
+            self.assertIsNone(project._main_cmake)
+            main_cmake = project.main_cmake
+            self.assertIs(project.main_cmake, main_cmake)
+            self.assertIsNone(project.source_cmake)
+            self.assertEqual(project.project_name, 'template')
+
+            # Saving the file keeps it
+            project.set_prop('name', 'test')
+            self.assertIs(project.main_cmake, main_cmake)
+            self.assertEqual(project.project_name, 'test')
+
+            # Changes on disk are loaded again
+            with open(path, 'a') as f:
+                f.write('set(NEW 1)\n')
+            self.assertIsNot(project.main_cmake, main_cmake)
+            self.assertEqual(len(project.main_cmake.find_commands([ 'set', 'NEW' ])), 1)
+
+            # Unsaved modifications are kept
+            main_cmake = project.main_cmake
+            main_cmake.set_command_arg([ 'set', 'NEW' ], 1, '2')
+            with open(path, 'a') as f:
+                f.write('set(OTHER 1)\n')
+            self.assertIs(project.main_cmake, main_cmake)
+
+    def test_initialize_saves_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            saves = []
+            save = cml.CMakeFile.save
+            def counting_save(cmake_file, path = None):
+                saves.append(cmake_file.path)
+                return save(cmake_file, path)
+
+            cml.CMakeFile.save = counting_save
+            try:
+                project = cml.Project(tmp, scan=False)
+                self.assertTrue(project.initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.2.3', dry=False))
+            finally:
+                cml.CMakeFile.save = save
+
+            self.assertEqual(saves, [ os.path.join(tmp, 'CMakeLists.txt') ])
+            self.assertEqual(cml.Project(tmp).get_prop('version'), '1.2.3')
+
+    def test_transaction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cml.Project(tmp, scan=False).initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.2.3', dry=False)
+            main_path = os.path.join(tmp, 'CMakeLists.txt')
+            with open(main_path) as f:
+                main_text = f.read()
+
+            # If a file cannot be saved, the files that have been saved are restored
+            project = cml.Project(tmp)
+            project.source_cmake.save = lambda path = None, fsync = False: False
+            with self.assertRaises(cml.CMakeSaveError):
+                with project.transaction():
+                    project.set_prop('name', 'other')
+                    project.source_cmake.add_command([ 'add_subdirectory', 'docs' ])
+            with open(main_path) as f:
+                self.assertEqual(f.read(), main_text)
+            self.assertEqual(project.get_prop('name'), 'test')
+            self.assertEqual(project.source_cmake.find_commands([ 'add_subdirectory', 'docs' ]), [])
+
+            # Failed saves are reported
+            project.main_cmake.save = lambda path = None, fsync = False: False
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertFalse(project.set_prop('name', 'other'))
+            self.assertIn('Could not save {}.'.format(main_path), out.getvalue())
+            self.assertEqual(project.get_prop('name'), 'test')
+
+    def test_initialize_invalid_version(self):
+        class Query:
+            def __init__(self, answers):
+                self.answers = answers
+
+            def ask(self, msg, default = ''):
+                return self.answers.pop(0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # An invalid version is rejected before anything is created
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertFalse(cml.Project(tmp, scan=False).initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.0', dry=False))
+            self.assertIn('Invalid value for property "version": "1.0"', out.getvalue())
+            self.assertTrue(cml.utils.dir_empty(tmp))
+
+            # An invalid version that has been entered is asked for again
+            project = cml.Project(tmp, scan=False)
+            project.query = Query([ '1.0', '1.0.1' ])
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertTrue(project.initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', dry=False))
+            self.assertIn('Invalid version number "1.0"', out.getvalue())
+            self.assertEqual(cml.Project(tmp).get_props([ 'name', 'version' ]), { 'name': 'test', 'version': '1.0.1' })
+
+    def test_dry_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cml.Project(tmp, scan=False).initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.2.3', dry=False)
+            source_cmake = os.path.join(tmp, 'source', 'CMakeLists.txt')
+            with open(source_cmake) as f:
+                original = f.read()
+
+            # Changes of the cmake files are shown, but not saved
+            project = cml.Project(tmp)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertTrue(project.generate_library('mylib', dry=True))
+            self.assertIn('MODIFY {}'.format(source_cmake), output.getvalue())
+            self.assertIn('\n+add_subdirectory(mylib)\n', output.getvalue())
+            self.assertFalse(os.path.exists(os.path.join(tmp, 'source', 'mylib')))
+            with open(source_cmake) as f:
+                self.assertEqual(f.read(), original)
+            self.assertEqual(project.source_cmake.find_commands([ 'add_subdirectory', 'mylib' ]), [])
+
+    def test_upgrade(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Old version of the template
+            base = os.path.join(tmp, 'base')
+            shutil.copytree(os.path.join(cml.utils.data_dir(), 'templates', 'core'), base)
+            def downgrade(path):
+                with open(path) as f:
+                    text = f.read()
+                text = text.replace('cmake_minimum_required(VERSION 3.0 FATAL_ERROR)', 'cmake_minimum_required(VERSION 2.8 FATAL_ERROR)')
+                text = text.replace('option(OPTION_ENABLE_COVERAGE', 'option(OPTION_OLD')
+                with open(path, 'w') as f:
+                    f.write(text)
+            downgrade(os.path.join(base, 'CMakeLists.txt'))
+
+            # Project generated from it, with changes of its own
+            path = os.path.join(tmp, 'project')
+            os.mkdir(path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                cml.Project(path, scan=False).initialize('test', 'Test', 'Author', 'https://example.com', 'a@example.com', '1.2.3', dry=False)
+            cmake_lists = os.path.join(path, 'CMakeLists.txt')
+            downgrade(cmake_lists)
+            cmake_file = cml.CMakeParser().load(cmake_lists)
+            cmake_file.add_command([ 'set', 'USER_FLAG' ], after=cmake_file.find_commands([ 'project' ])[0])
+            cmake_file.save()
+
+            # Changes of the template are merged, changes of the project are kept
+            project = cml.Project(path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(project.upgrade(base, dry=False))
+            self.assertEqual(project.main_cmake.find_commands([ 'cmake_minimum_required' ])[0].get_arg_value(1), '3.0')
+            self.assertEqual(len(project.main_cmake.find_commands([ 'option', 'OPTION_ENABLE_COVERAGE' ])), 1)
+            self.assertEqual(project.main_cmake.find_commands([ 'option', 'OPTION_OLD' ]), [])
+            self.assertEqual(len(project.main_cmake.find_commands([ 'set', 'USER_FLAG' ])), 1)
+            self.assertEqual(project.get_prop('name'), 'test')
+            self.assertEqual(project.get_prop('version'), '1.2.3')
+
+            # Conflicting changes are reported, the project file is kept
+            downgrade(cmake_lists)
+            cmake_file = cml.CMakeParser().load(cmake_lists)
+            cmake_file.set_command_arg([ 'option', 'OPTION_OLD' ], 1, '"Changed"')
+            cmake_file.save()
+            with open(cmake_lists) as f:
+                text = f.read()
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertFalse(cml.Project(path).upgrade(base, dry=False))
+            self.assertIn('CONFLICT {}:'.format(cmake_lists), output.getvalue())
+            self.assertIn('OPTION_OLD "Changed"', text)
+            with open(cmake_lists) as f:
+                self.assertEqual(f.read(), text.replace('VERSION 2.8', 'VERSION 3.0'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+from .context import cml
+
+import os
+import unittest
+
+
+def load(text):
+    """Parse cmake file from a string"""
+    parser = cml.CMakeParser()
+    cmake_file = cml.CMakeFile('CMakeLists.txt')
+    for element in parser.parse_elements(parser.tokenize_string(text)):
+        cmake_file.add(element)
+    return cmake_file
+
+
+class SubProjectTest(unittest.TestCase):
+    """Test cases for cml.sub_project."""
+
+    def test_templates(self):
+        path = os.path.join(cml.utils.data_dir(), 'templates', 'library')
+        subproject = cml.SubProject('lib', path, cml.CMakeParser().load(os.path.join(path, 'CMakeLists.txt')))
+        self.assertEqual((subproject.target, subproject.type), ('lib', 'library'))
+        self.assertEqual(subproject.headers, [ os.path.join('include', 'lib', 'lib.h') ])
+        self.assertEqual(subproject.sources, [ os.path.join('source', 'lib.cpp') ])
+
+        path = os.path.join(cml.utils.data_dir(), 'templates', 'executable')
+        subproject = cml.SubProject('app', path, cml.CMakeParser(compact=True).load(os.path.join(path, 'CMakeLists.txt')))
+        self.assertEqual((subproject.target, subproject.type), ('executable', 'executable'))
+        self.assertEqual((subproject.headers, subproject.sources), ([], [ 'main.cpp' ]))
+
+        # Reading a snapshot (e.g., from a parse cache) does not copy its elements
+        cmake_file = cml.CMakeParser().load(os.path.join(path, 'CMakeLists.txt'))
+        snapshot = cmake_file.snapshot()
+        self.assertEqual(cml.SubProject('app', path, snapshot).sources, [ 'main.cpp' ])
+        self.assertTrue(all(e.owner is cmake_file for e in snapshot.elements.iter_raw()))
+
+    def test_variables(self):
+        subproject = cml.SubProject('test', 'test', load(
+            'add_library(other::alias ALIAS other)\n'
+            'set(name "my lib")\n'
+            'set(files a.cpp;b.h CACHE STRING "")\n'
+            'add_library("${name}" STATIC ${files} ${unknown}/c.cpp)\n'
+            'target_sources("${name}" PRIVATE d.hpp)\n'
+            'target_sources(other PRIVATE e.cpp)\n'))
+        self.assertEqual((subproject.target, subproject.type), ('my lib', 'library'))
+        self.assertEqual(subproject.headers, [ 'b.h', 'd.hpp' ])
+        self.assertEqual(subproject.sources, [ 'a.cpp', '${unknown}/c.cpp' ])
+
+        # Sub-projects without target
+        subproject = cml.SubProject('tests', 'tests', load('add_subdirectory(test)\n'))
+        self.assertEqual((subproject.target, subproject.type, subproject.headers, subproject.sources), (None, None, [], []))
+
+
+if __name__ == '__main__':
+    unittest.main()